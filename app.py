@@ -1,28 +1,69 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, Response, has_request_context, g
 from werkzeug.security import generate_password_hash, check_password_hash
 import string
 import os
 import io
+import csv
 import base64
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
+import importlib
+from importlib.util import find_spec
 from dotenv import load_dotenv
-import google.generativeai as genai
 import datetime
 from dateutil.relativedelta import relativedelta
 import mysql.connector.pooling
-import pandas as pd
-from sklearn.linear_model import LinearRegression
 import json
-from decimal import Decimal
-import numpy as np
+from decimal import Decimal, ROUND_HALF_UP
 import re
+import hashlib
+import hmac
+import bisect
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import queue
+import subprocess
+import sys
+import timeit
+from types import SimpleNamespace
+from statistics import NormalDist, median
+from collections import OrderedDict
+from contextlib import contextmanager
+import click
+import chart_renderer
 
 # Load the .env file for secrets
 load_dotenv()
 
+# Imports a heavy module the first time one of its attributes is used. Pages like /login never draw
+# charts or call the chatbot, so workers only pay for matplotlib, pandas and numpy once a route needs them.
+class LazyModule:
+    def __init__(self, module_name, before_import=None):
+        self._module_name = module_name
+        self._before_import = before_import
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    if self._before_import:
+                        self._before_import()
+                    self._module = importlib.import_module(self._module_name)
+        return self._module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+def use_agg_backend():
+    import matplotlib
+    matplotlib.use("Agg")
+
+plt = LazyModule('matplotlib.pyplot', before_import=use_agg_backend)
+np = LazyModule('numpy')
+
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY")
 
@@ -34,31 +75,827 @@ pool_config = {
     "database": os.getenv("DB_NAME"),
     "port": os.getenv("DB_PORT"),
     "autocommit": True,
-    "pool_size": 10,
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
     "pool_reset_session": True
 }
 
-# Using connection pool so that the app is more responsive
-connection_pool = mysql.connector.pooling.MySQLConnectionPool(**pool_config)
+# Query profiling. Every statement run on a pooled connection is timed, including the time spent
+# fetching its rows. Each response gets a Server-Timing header with its database time and query count,
+# statements slower than DB_SLOW_QUERY_MS are printed, and a statement run DB_N_PLUS_ONE or more times
+# in one request is counted as an N+1 pattern. Totals per statement and per route are on
+# /internal/query-stats. The bookkeeping is a few counters per statement, so it's on by default;
+# DB_PROFILE=0 turns it off.
+DB_PROFILE = os.getenv("DB_PROFILE", "1") != "0"
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+DB_N_PLUS_ONE = int(os.getenv("DB_N_PLUS_ONE", "5"))
+QUERY_STATS_LIMIT = 500
+IN_LIST_PATTERN = re.compile(r'IN \((?:%s, )+%s\)')
+
+class QueryProfiler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.statements = {}
+        self.routes = {}
+        self.n_plus_one = {}
+        self.slow_queries = 0
+
+    # Batch statements differ only in how many ids are in their IN list, so those count as one statement
+    def statement_key(self, sql):
+        return IN_LIST_PATTERN.sub("IN (...)", sql) if "%s, %s" in sql else sql
+
+    def record(self, sql, route, seconds, rows, bind_count):
+        key = self.statement_key(sql)
+        with self.lock:
+            stats = self.statements.get(key)
+            if stats is None and len(self.statements) < QUERY_STATS_LIMIT:
+                stats = self.statements[key] = {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "rows": 0}
+            if stats is not None:
+                stats["count"] += 1
+                stats["seconds"] += seconds
+                stats["max_seconds"] = max(stats["max_seconds"], seconds)
+                stats["rows"] += rows
+            slow = seconds * 1000 >= DB_SLOW_QUERY_MS
+            if slow:
+                self.slow_queries += 1
+
+        if has_request_context():
+            g.db_queries = g.get('db_queries', 0) + 1
+            g.db_seconds = g.get('db_seconds', 0.0) + seconds
+            statement_counts = g.setdefault('db_statements', {})
+            statement_counts[key] = statement_counts.get(key, 0) + 1
+        if slow:
+            print(f"Slow query ({seconds * 1000:.0f} ms, {rows} rows, {bind_count} params, {route}): {' '.join(sql.split())[:500]}")
+
+    # Called once per request. Returns (queries, seconds) for the Server-Timing header.
+    def finish_request(self, route):
+        queries = g.get('db_queries', 0)
+        seconds = g.get('db_seconds', 0.0)
+        if not queries:
+            return 0, 0.0
+
+        repeated = [key for key, count in g.get('db_statements', {}).items() if count >= DB_N_PLUS_ONE]
+        with self.lock:
+            stats = self.routes.setdefault(route, {"requests": 0, "queries": 0, "seconds": 0.0, "max_seconds": 0.0})
+            stats["requests"] += 1
+            stats["queries"] += queries
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+            first_seen = []
+            for key in repeated:
+                if (route, key) not in self.n_plus_one:
+                    first_seen.append(key)
+                self.n_plus_one[(route, key)] = self.n_plus_one.get((route, key), 0) + 1
+        for key in first_seen:
+            print(f"Possible N+1 in {route}: ran {g.db_statements[key]} times: {' '.join(key.split())[:300]}")
+        if seconds * 1000 >= DB_SLOW_QUERY_MS:
+            print(f"Slow request {route}: {queries} queries, {seconds * 1000:.0f} ms in the database")
+        return queries, seconds
+
+    def stats(self):
+        with self.lock:
+            statements = sorted(self.statements.items(), key=lambda item: -item[1]["seconds"])[:50]
+            return {
+                "slow_query_ms": DB_SLOW_QUERY_MS,
+                "slow_queries": self.slow_queries,
+                "n_plus_one": [
+                    {"route": route, "statement": key, "requests": count}
+                    for (route, key), count in sorted(self.n_plus_one.items(), key=lambda item: -item[1])
+                ],
+                "routes": {
+                    route: {
+                        "requests": stats["requests"],
+                        "average_queries": round(stats["queries"] / stats["requests"], 1),
+                        "average_db_ms": round(stats["seconds"] / stats["requests"] * 1000, 2),
+                        "max_db_ms": round(stats["max_seconds"] * 1000, 2)
+                    }
+                    for route, stats in sorted(self.routes.items(), key=lambda item: -item[1]["seconds"])
+                },
+                "statements": [
+                    {
+                        "statement": key,
+                        "count": stats["count"],
+                        "total_ms": round(stats["seconds"] * 1000, 2),
+                        "average_ms": round(stats["seconds"] / stats["count"] * 1000, 3),
+                        "max_ms": round(stats["max_seconds"] * 1000, 2),
+                        "rows": stats["rows"]
+                    }
+                    for key, stats in statements
+                ]
+            }
+
+query_profiler = QueryProfiler()
+
+# Cursor handed out by TrackedConnection when profiling is on. A statement's time runs from execute
+# through its fetches and is recorded when the cursor moves on to the next statement or is closed.
+class ProfiledCursor:
+    def __init__(self, cursor, route):
+        self._cursor = cursor
+        self._route = route
+        self._sql = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        row = self.fetchone()
+        while row is not None:
+            yield row
+            row = self.fetchone()
+
+    def _start(self, sql, bind_count):
+        self._finish()
+        self._sql = sql
+        self._bind_count = bind_count
+        self._seconds = 0.0
+        self._rows = 0
+
+    def _timed(self, method, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self._seconds += time.perf_counter() - started
+
+    def _finish(self):
+        if self._sql is not None:
+            sql, self._sql = self._sql, None
+            # Writes don't fetch anything, so their rows are the affected row count
+            rows = self._rows or max(self._cursor.rowcount or 0, 0)
+            query_profiler.record(sql, self._route, self._seconds, rows, self._bind_count)
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        self._start(operation, len(params) if params else 0)
+        return self._timed(self._cursor.execute, operation, params, *args, **kwargs)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        seq_params = list(seq_params)
+        self._start(operation, sum(len(params) for params in seq_params))
+        return self._timed(self._cursor.executemany, operation, seq_params, *args, **kwargs)
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        if row is not None:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._timed(self._cursor.fetchmany, *args, **kwargs)
+        self._rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self._rows += len(rows)
+        return rows
+
+    def close(self):
+        self._finish()
+        return self._cursor.close()
+
+class PoolTimeoutError(mysql.connector.errors.PoolError):
+    pass
+
+# A connection handed out by InstrumentedPool. Behaves like the pooled connection it wraps, and
+# closing it (or leaving the with block) gives it back to the pool.
+class TrackedConnection:
+    def __init__(self, pool, cnx, overflow, route):
+        self._pool = pool
+        self._cnx = cnx
+        self._overflow = overflow
+        self._route = route
+        self._checked_out = time.monotonic()
+        self._cursors = []
+
+    def __getattr__(self, name):
+        return getattr(self._cnx, name)
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._cnx.cursor(*args, **kwargs)
+        if not DB_PROFILE:
+            return cursor
+        profiled = ProfiledCursor(cursor, self._route)
+        self._cursors.append(profiled)
+        return profiled
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._cnx is not None:
+            # Record the last statement of any cursor the caller didn't close
+            for cursor in self._cursors:
+                cursor._finish()
+            self._cursors = []
+            cnx, self._cnx = self._cnx, None
+            self._pool.release(cnx, self._overflow, self._route, self._checked_out)
+
+# Wraps MySQLConnectionPool, which raises as soon as every connection is out. Here a request waits up
+# to DB_POOL_TIMEOUT seconds for a connection, and past pool_size it can open up to DB_POOL_MAX_OVERFLOW
+# extra connections that are closed when they're given back. Pooled connections older than
+# DB_POOL_RECYCLE seconds are reconnected on checkout so the server never drops one under us.
+# Wait times, usage per route and session reset cost are kept for /internal/db-pool.
+# The MySQL pool is only created on the first checkout, so importing app.py never connects. The chart
+# render processes import it again as __mp_main__ when the app is started with python app.py, and they
+# must not hold database connections or fail to start because the database is down.
+class InstrumentedPool:
+    def __init__(self, config, max_overflow, timeout, recycle):
+        self.config = dict(config)
+        self.pool = None
+        self.pool_size = int(config.get('pool_size', 5))
+        self.connect_config = {key: value for key, value in config.items() if not key.startswith('pool_')}
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.slots = threading.BoundedSemaphore(self.pool_size + max_overflow)
+        self.lock = threading.Lock()
+        self.connected_at = {}
+        self.pooled_in_use = 0
+        self.overflow_in_use = 0
+        self.peak_in_use = 0
+        self.checkouts = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+        self.overflow_opened = 0
+        self.recycled = 0
+        self.resets = 0
+        self.reset_seconds = 0.0
+        self.routes = {}
+
+    def mysql_pool(self):
+        if self.pool is None:
+            with self.lock:
+                if self.pool is None:
+                    self.pool = mysql.connector.pooling.MySQLConnectionPool(**self.config)
+        return self.pool
+
+    def get_connection(self):
+        started = time.monotonic()
+        if not self.slots.acquire(timeout=self.timeout):
+            with self.lock:
+                self.timeouts += 1
+            raise PoolTimeoutError(f"No database connection free after {self.timeout}s")
 
-def get_db_connection():
+        try:
+            with self.lock:
+                overflow = self.pooled_in_use >= self.pool_size
+                if overflow:
+                    self.overflow_in_use += 1
+                else:
+                    self.pooled_in_use += 1
+            try:
+                if overflow:
+                    cnx = mysql.connector.connect(**self.connect_config)
+                else:
+                    cnx = self.mysql_pool().get_connection()
+                    self.recycle_if_stale(cnx)
+            except Exception:
+                with self.lock:
+                    if overflow:
+                        self.overflow_in_use -= 1
+                    else:
+                        self.pooled_in_use -= 1
+                raise
+        except Exception:
+            self.slots.release()
+            raise
+
+        waited = time.monotonic() - started
+        with self.lock:
+            self.checkouts += 1
+            if overflow:
+                self.overflow_opened += 1
+            if waited > 0.001:
+                self.waited += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            self.peak_in_use = max(self.peak_in_use, self.pooled_in_use + self.overflow_in_use)
+        route = request.endpoint or request.path if has_request_context() else 'background'
+        return TrackedConnection(self, cnx, overflow, route)
+
+    # The pool already pings a connection before handing it out. This also replaces connections that
+    # have been open longer than recycle seconds. _cnx is the pooled connection's real connection.
+    def recycle_if_stale(self, cnx):
+        key = id(cnx._cnx)
+        now = time.monotonic()
+        connected_at = self.connected_at.setdefault(key, now)
+        if self.recycle and now - connected_at > self.recycle:
+            cnx._cnx.reconnect()
+            self.connected_at[key] = time.monotonic()
+            with self.lock:
+                self.recycled += 1
+
+    def release(self, cnx, overflow, route, checked_out):
+        released = time.monotonic()
+        try:
+            # Closing a pooled connection resets its session and puts it back in the pool
+            cnx.close()
+        finally:
+            finished = time.monotonic()
+            with self.lock:
+                if overflow:
+                    self.overflow_in_use -= 1
+                else:
+                    self.pooled_in_use -= 1
+                    self.resets += 1
+                    self.reset_seconds += finished - released
+                held = released - checked_out
+                route_stats = self.routes.setdefault(route, {"checkouts": 0, "seconds": 0.0, "max_seconds": 0.0})
+                route_stats["checkouts"] += 1
+                route_stats["seconds"] += held
+                route_stats["max_seconds"] = max(route_stats["max_seconds"], held)
+            self.slots.release()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "pool_size": self.pool_size,
+                "max_overflow": self.max_overflow,
+                "timeout_seconds": self.timeout,
+                "in_use": self.pooled_in_use + self.overflow_in_use,
+                "overflow_in_use": self.overflow_in_use,
+                "peak_in_use": self.peak_in_use,
+                "checkouts": self.checkouts,
+                "waited": self.waited,
+                "average_wait_ms": round(self.wait_seconds / self.checkouts * 1000, 2) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+                "timeouts": self.timeouts,
+                "overflow_opened": self.overflow_opened,
+                "recycled": self.recycled,
+                "average_reset_ms": round(self.reset_seconds / self.resets * 1000, 2) if self.resets else 0.0,
+                "routes": {
+                    route: {
+                        "checkouts": route_stats["checkouts"],
+                        "average_ms": round(route_stats["seconds"] / route_stats["checkouts"] * 1000, 2),
+                        "max_ms": round(route_stats["max_seconds"] * 1000, 2)
+                    }
+                    for route, route_stats in sorted(self.routes.items(), key=lambda item: -item[1]["seconds"])
+                }
+            }
+
+# Using connection pool so that the app is more responsive
+connection_pool = InstrumentedPool(
+    pool_config,
+    max_overflow=int(os.getenv("DB_POOL_MAX_OVERFLOW", "5")),
+    timeout=float(os.getenv("DB_POOL_TIMEOUT", "5")),
+    recycle=float(os.getenv("DB_POOL_RECYCLE", "3600"))
+)
+
+# Optional read replica. When DB_REPLICA_HOST is set, dashboard, chart, chatbot and export reads go to
+# the replica. Everything else, including all writes, stays on the primary. Any other replica setting
+# that's left out is the same as the primary's.
+replica_pool = None
+if os.getenv("DB_REPLICA_HOST"):
+    try:
+        replica_pool = InstrumentedPool(
+            {
+                **pool_config,
+                "host": os.getenv("DB_REPLICA_HOST"),
+                "port": os.getenv("DB_REPLICA_PORT", pool_config["port"]),
+                "user": os.getenv("DB_REPLICA_USER", pool_config["user"]),
+                "password": os.getenv("DB_REPLICA_PASSWORD", pool_config["password"]),
+                "pool_size": int(os.getenv("DB_REPLICA_POOL_SIZE", str(pool_config["pool_size"]))),
+                "pool_name": "replica"
+            },
+            max_overflow=int(os.getenv("DB_POOL_MAX_OVERFLOW", "5")),
+            timeout=float(os.getenv("DB_POOL_TIMEOUT", "5")),
+            recycle=float(os.getenv("DB_POOL_RECYCLE", "3600"))
+        )
+    except Exception as e:
+        print(f"Could not set up the read replica, all reads will use the primary: {e}")
+
+# For this many seconds after a user writes, their reads go to the primary so they see their own
+# change even if the replica is behind
+REPLICA_STICKY_SECONDS = float(os.getenv("DB_REPLICA_STICKY_SECONDS", "5"))
+read_routing = {"replica": 0, "primary_sticky": 0, "primary_fallback": 0}
+read_routing_lock = threading.Lock()
+
+def count_read_route(route):
+    with read_routing_lock:
+        read_routing[route] += 1
+
+def recently_wrote():
+    return has_request_context() and time.time() - session.get('last_write_at', 0) < REPLICA_STICKY_SECONDS
+
+# Called from the write paths (unit_of_work commits and cache invalidation after a change) so only
+# requests that actually changed something make the user's next reads sticky to the primary
+def remember_write():
+    if replica_pool is not None and has_request_context() and session.get('user_id'):
+        session['last_write_at'] = time.time()
+
+# Whether reads for the current request may use the replica. Streaming responses call this before they
+# start, because the request (and its session) is gone by the time the generator runs.
+def can_read_replica():
+    return replica_pool is not None and not recently_wrote()
+
+# read_only=True sends the query to the replica when there is one. If the replica can't hand out a
+# connection the read falls back to the primary.
+def get_db_connection(read_only=False):
+    if read_only and replica_pool is not None:
+        if recently_wrote():
+            count_read_route("primary_sticky")
+        else:
+            try:
+                db = replica_pool.get_connection()
+                count_read_route("replica")
+                return db
+            except Exception as e:
+                count_read_route("primary_fallback")
+                print(f"Replica unavailable, reading from primary: {e}")
     return connection_pool.get_connection()
 
-# Getting Gemini ready
-try:
-    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-    genai.configure(api_key=GEMINI_API_KEY)
-    generation_config = genai.GenerationConfig(
-        max_output_tokens=1600,
-        response_mime_type="text/plain",
-    )
-
-    gemini_model = genai.GenerativeModel(
-        model_name='gemini-1.5-flash',
-        generation_config=generation_config
-    )
-except Exception as e:
-    gemini_model = None
+# Database time and query count for this request, shown in the browser's network timing panel
+@app.after_request
+def add_query_timing(response):
+    if DB_PROFILE:
+        queries, seconds = query_profiler.finish_request(request.endpoint or request.path)
+        if queries:
+            response.headers.add('Server-Timing', f'db;dur={seconds * 1000:.1f};desc="{queries} queries"')
+    return response
+
+# Run a group of writes as one transaction. The pool has autocommit on, so without this every statement
+# commits on its own and a failure half way leaves orphan rows. Commits when the block finishes and
+# rolls back if it raises. New ids come from cursor.lastrowid, which the server sends back with the
+# INSERT, so there's no need for a SELECT LAST_INSERT_ID() round trip. Pass db to use a connection
+# the caller already holds instead of taking another one from the pool. Returning from inside the block
+# still commits, so do validation that can reject the request before entering it.
+@contextmanager
+def unit_of_work(db=None, dictionary=False):
+    if db is None:
+        with get_db_connection() as db:
+            with unit_of_work(db, dictionary) as cursor:
+                yield cursor
+    else:
+        db.start_transaction()
+        cursor = db.cursor(dictionary=dictionary)
+        try:
+            yield cursor
+            db.commit()
+            remember_write()
+        except BaseException:
+            db.rollback()
+            raise
+        finally:
+            cursor.close()
+
+# Hot read queries, shared by the routes and the explain-queries check
+# An account's balance is the Account_Balance snapshot plus the ledger entries not yet compacted into it
+ACCOUNT_BALANCE_SQL = "a.Account_Balance + COALESCE((SELECT SUM(l.Amount) FROM account_ledger l WHERE l.Account_ID = a.Account_ID), 0)"
+USER_ACCOUNTS_QUERY = f"SELECT Account_ID, Account_Name, Account_Type, {ACCOUNT_BALANCE_SQL} AS Account_Balance FROM accounts a JOIN has h USING(Account_ID) WHERE h.User_ID = %s ORDER BY a.Account_Name ASC"
+BUDGET_GOAL_QUERY = "SELECT Goal_Target FROM goals WHERE Monthly_Budget = 1 AND Goal_ID IN (SELECT Goal_ID FROM sets WHERE User_ID = %s)"
+USER_CATEGORIES_QUERY = "SELECT Category_Name FROM categories JOIN selects USING (Category_ID) WHERE User_ID = %s ORDER BY Category_Name"
+SPENT_IN_RANGE_QUERY = "SELECT SUM(Total) AS total_spent FROM daily_spend WHERE User_ID = %s AND Day BETWEEN %s AND %s"
+CATEGORY_DAILY_SPEND_QUERY = "SELECT Category_Name, Day AS Transaction_Date, SUM(Total) AS Daily_Amount FROM daily_spend JOIN categories USING (Category_ID) WHERE User_ID = %s AND Day BETWEEN %s AND %s AND Count > 0 GROUP BY Category_Name, Day ORDER BY Day, Category_Name"
+CATEGORY_TOTALS_QUERY = "SELECT Category_Name, SUM(Total) AS Total_Amount, SUM(Count) AS Count FROM daily_spend JOIN categories USING (Category_ID) WHERE User_ID = %s AND Day BETWEEN %s AND %s GROUP BY Category_Name HAVING Total_Amount > 0 ORDER BY Total_Amount DESC"
+PERIOD_DAILY_TOTALS_QUERY = "SELECT Day, SUM(Total) AS total_spent FROM daily_spend WHERE User_ID = %s AND Day >= %s AND Day < %s GROUP BY Day"
+SPENDING_SUMMARY_QUERY = "SELECT SUM(Total) as total_spent, SUM(Count) as transaction_count FROM daily_spend WHERE User_ID = %s AND Day BETWEEN %s AND %s"
+
+# Lookups and writes used by the category, account, goal, batch edit, import and ledger code
+ACCOUNT_BALANCE_QUERY = f"SELECT {ACCOUNT_BALANCE_SQL} FROM accounts a WHERE a.Account_ID = %s"
+ACCOUNT_OWNER_QUERY = "SELECT 1 FROM has WHERE User_ID = %s AND Account_ID = %s"
+USER_CATEGORY_ID_QUERY = "SELECT Category_ID FROM categories JOIN selects USING (Category_ID) WHERE User_ID = %s AND Category_Name = %s"
+USER_GOALS_QUERY = "SELECT Goal_ID, Goal_Name, Goal_Date, Goal_Target, Current_Amount, Goal_Description FROM goals g JOIN sets s USING(Goal_ID) WHERE s.User_ID = %s AND g.Monthly_Budget = 0 ORDER BY g.Goal_Date ASC, g.Goal_Name ASC"
+GOAL_OWNER_QUERY = "SELECT 1 FROM sets WHERE User_ID = %s AND Goal_ID = %s"
+GOAL_DETAIL_QUERY = "SELECT g.* FROM goals g JOIN sets s ON g.Goal_ID = s.Goal_ID WHERE s.User_ID = %s AND g.Goal_ID = %s"
+TRANSACTION_EDIT_LOCK_QUERY = "SELECT Transaction_Amount, Transaction_Date FROM transactions WHERE Transaction_ID = %s FOR UPDATE"
+OWNED_TRANSACTIONS_QUERY = "SELECT t.Transaction_ID, t.Transaction_Amount, t.Transaction_Date, fu.Category_ID, mo.Account_ID FROM transactions t JOIN makes m ON t.Transaction_ID = m.Transaction_ID LEFT JOIN made_on mo ON t.Transaction_ID = mo.Transaction_ID LEFT JOIN falls_under fu ON t.Transaction_ID = fu.Transaction_ID WHERE m.User_ID = %s AND t.Transaction_ID IN ({ids}) FOR UPDATE"
+BATCH_UPDATE_QUERY = "UPDATE {table} SET {column} = %s WHERE Transaction_ID IN ({ids})"
+BATCH_DELETE_QUERY = "DELETE FROM {table} WHERE Transaction_ID IN ({ids})"
+IMPORT_CATEGORIES_QUERY = "SELECT Category_ID, Category_Name FROM categories JOIN selects USING (Category_ID) WHERE User_ID = %s"
+IMPORT_ACCOUNTS_QUERY = "SELECT Account_ID, Account_Name FROM accounts JOIN has USING (Account_ID) WHERE User_ID = %s"
+IMPORT_ID_CHECK_QUERY = "SELECT COUNT(*) FROM transactions WHERE User_ID = %s AND Transaction_ID BETWEEN %s AND %s"
+ACCOUNT_LEDGER_DELETE_QUERY = "DELETE FROM account_ledger WHERE Account_ID = %s"
+TOP_TRANSACTIONS_QUERY = "SELECT t.Transaction_Date, t.Transaction_Description, t.Transaction_Amount, c.Category_Name FROM transactions t JOIN falls_under fu ON t.Transaction_ID = fu.Transaction_ID JOIN categories c ON fu.Category_ID = c.Category_ID WHERE t.User_ID = %s AND t.Transaction_Date BETWEEN %s AND %s ORDER BY t.Transaction_Amount DESC LIMIT %s"
+TRANSACTION_LIST_QUERY = "SELECT t.Transaction_ID, t.Transaction_Date, t.Transaction_Description, t.Transaction_Amount, c.Category_Name, a.Account_Name FROM transactions t LEFT JOIN falls_under fu ON t.Transaction_ID = fu.Transaction_ID LEFT JOIN categories c ON fu.Category_ID = c.Category_ID LEFT JOIN made_on mo ON t.Transaction_ID = mo.Transaction_ID LEFT JOIN accounts a ON mo.Account_ID = a.Account_ID WHERE {where} {order}"
+
+# daily_spend keeps per-user, per-category, per-day totals so charts and summaries don't scan every
+# transaction. Transactions without a category are filed under Category_ID 0.
+DAILY_SPEND_SOURCE_QUERY = "SELECT m.User_ID, COALESCE(fu.Category_ID, 0) AS Category_ID, DATE(t.Transaction_Date) AS Day, SUM(t.Transaction_Amount) AS Total, COUNT(*) AS Count FROM transactions t JOIN makes m ON t.Transaction_ID = m.Transaction_ID LEFT JOIN falls_under fu ON t.Transaction_ID = fu.Transaction_ID {where} GROUP BY m.User_ID, COALESCE(fu.Category_ID, 0), DATE(t.Transaction_Date)"
+
+# Add (or with negative values, remove) a transaction from the rollup. Uses the caller's cursor so the
+# change commits or rolls back together with the transaction write.
+DAILY_SPEND_UPSERT = "INSERT INTO daily_spend (User_ID, Category_ID, Day, Total, Count) VALUES (%s, %s, DATE(%s), %s, %s) ON DUPLICATE KEY UPDATE Total = Total + VALUES(Total), Count = Count + VALUES(Count)"
+
+# Transaction_Amount is stored to the cent, so amounts are rounded the same way before they are written
+# anywhere. The rollup and ledger then move by exactly what the transactions row holds.
+def to_cents(value):
+    return Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+def apply_daily_spend(cursor, user_id, category_id, day, amount, count):
+    cursor.execute(DAILY_SPEND_UPSERT, (user_id, category_id or 0, day, amount, count))
+
+# Same as apply_daily_spend for a dict of {(category_id, day): (amount, count)} in one statement
+def apply_daily_spend_many(cursor, user_id, daily_changes):
+    if daily_changes:
+        cursor.executemany(DAILY_SPEND_UPSERT, [(user_id, category_id or 0, day, amount, count) for (category_id, day), (amount, count) in daily_changes.items()])
+
+# Balance changes are appended to account_ledger rather than written to the accounts row, so two
+# requests touching the same account never wait on each other. Callers add up the changes per
+# account first and write them with one multi-row insert.
+def add_balance_change(balance_changes, account_id, amount):
+    if account_id:
+        balance_changes[int(account_id)] = balance_changes.get(int(account_id), 0) + amount
+
+def apply_balance_changes(cursor, balance_changes):
+    entries = [(account_id, amount) for account_id, amount in balance_changes.items() if amount]
+    if entries:
+        cursor.executemany("INSERT INTO account_ledger (Account_ID, Amount) VALUES (%s, %s)", entries)
+
+# Fold ledger entries into the Account_Balance snapshots. The locking read waits for any entry that's
+# still being written inside the range, so nothing is deleted without having been counted.
+def compact_account_ledger(db):
+    cursor = db.cursor()
+    db.start_transaction()
+    try:
+        cursor.execute("SELECT COALESCE(MAX(Entry_ID), 0) FROM account_ledger")
+        last_entry_id = cursor.fetchone()[0]
+        cursor.execute("SELECT Account_ID, SUM(Amount), COUNT(*) FROM account_ledger WHERE Entry_ID <= %s GROUP BY Account_ID FOR UPDATE", (last_entry_id,))
+        totals = cursor.fetchall()
+        if totals:
+            cursor.executemany("UPDATE accounts SET Account_Balance = Account_Balance + %s WHERE Account_ID = %s", [(total, account_id) for account_id, total, _ in totals])
+            cursor.execute("DELETE FROM account_ledger WHERE Entry_ID <= %s", (last_entry_id,))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+    return len(totals), sum(count for _, _, count in totals)
+
+# Run from cron every few minutes to keep the ledger tail short
+@app.cli.command('compact-ledger')
+def compact_ledger_command():
+    with get_db_connection() as db:
+        accounts, entries = compact_account_ledger(db)
+    click.echo(f"Compacted {entries} ledger entries into {accounts} account balances.")
+
+# Rebuild daily_spend from the transactions table, for one user or everyone
+@app.cli.command('rebuild-daily-spend')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user.')
+def rebuild_daily_spend_command(user_id):
+    with get_db_connection() as db:
+        db.start_transaction()
+        cursor = db.cursor()
+        if user_id:
+            cursor.execute("DELETE FROM daily_spend WHERE User_ID = %s", (user_id,))
+            cursor.execute("INSERT INTO daily_spend (User_ID, Category_ID, Day, Total, Count) " + DAILY_SPEND_SOURCE_QUERY.format(where="WHERE m.User_ID = %s"), (user_id,))
+        else:
+            cursor.execute("DELETE FROM daily_spend")
+            cursor.execute("INSERT INTO daily_spend (User_ID, Category_ID, Day, Total, Count) " + DAILY_SPEND_SOURCE_QUERY.format(where=""))
+        rows = cursor.rowcount
+        db.commit()
+        cursor.close()
+    click.echo(f"Rebuilt daily_spend with {rows} rows.")
+
+# Compare daily_spend against the transactions table and list any days that don't match
+@app.cli.command('check-daily-spend')
+@click.option('--user-id', type=int, default=None, help='Only check this user.')
+def check_daily_spend_command(user_id):
+    where = "WHERE m.User_ID = %s" if user_id else ""
+    params = (user_id,) if user_id else ()
+    with get_db_connection() as db:
+        cursor = db.cursor()
+        cursor.execute(DAILY_SPEND_SOURCE_QUERY.format(where=where), params)
+        expected = {(row[0], row[1], row[2]): (Decimal(row[3]), int(row[4])) for row in cursor.fetchall()}
+        cursor.execute("SELECT User_ID, Category_ID, Day, Total, Count FROM daily_spend WHERE Count != 0 OR Total != 0" + (" AND User_ID = %s" if user_id else ""), params)
+        actual = {(row[0], row[1], row[2]): (Decimal(row[3]), int(row[4])) for row in cursor.fetchall()}
+        cursor.close()
+
+    mismatches = 0
+    for key in sorted(set(expected) | set(actual)):
+        if expected.get(key) != actual.get(key):
+            mismatches += 1
+            click.echo(f"User {key[0]}, category {key[1]}, {key[2]}: expected {expected.get(key)}, found {actual.get(key)}")
+    if mismatches:
+        click.echo(f"{mismatches} mismatched rows. Run rebuild-daily-spend to fix.")
+        raise SystemExit(1)
+    click.echo(f"daily_spend matches transactions ({len(expected)} rows checked).")
+
+# Add a transaction with cents through the real routes, edit it, delete it, and check that the
+# user's daily_spend row and account balance end up where they started
+@app.cli.command('check-amount-round-trip')
+@click.option('--user-id', type=int, required=True, help='User to add the test transaction for.')
+@click.option('--day', default=lambda: datetime.date.today().strftime('%Y-%m-%d'))
+def check_amount_round_trip_command(user_id, day):
+    categories = fetch_categories(user_id)
+    accounts = fetch_accounts(user_id)
+    if not categories or not accounts:
+        click.echo("The user needs at least one category and one account.")
+        raise SystemExit(1)
+    category_name, account_id = categories[0], accounts[0]['Account_ID']
+
+    def snapshot():
+        with get_db_connection() as db:
+            cursor = db.cursor()
+            cursor.execute("SELECT COALESCE(SUM(ds.Total), 0), COALESCE(SUM(ds.Count), 0) FROM daily_spend ds JOIN categories c ON ds.Category_ID = c.Category_ID WHERE ds.User_ID = %s AND ds.Day = %s AND c.Category_Name = %s", (user_id, day, category_name))
+            total, count = cursor.fetchone()
+            cursor.execute(ACCOUNT_BALANCE_QUERY, (account_id,))
+            balance = cursor.fetchone()[0]
+            cursor.close()
+        return to_cents(total), int(count), to_cents(balance)
+
+    before = snapshot()
+    client = app.test_client()
+    with client.session_transaction() as client_session:
+        client_session['user_id'] = user_id
+
+    client.post('/transaction', data={'amount': '12.34', 'description': 'round trip check', 'date': day, 'category': category_name, 'account': str(account_id)})
+    with get_db_connection() as db:
+        cursor = db.cursor()
+        cursor.execute("SELECT MAX(Transaction_ID) FROM transactions WHERE User_ID = %s AND Transaction_Description = 'round trip check'", (user_id,))
+        transaction_id = cursor.fetchone()[0]
+        cursor.close()
+    if transaction_id is None:
+        click.echo("The test transaction was not recorded.")
+        raise SystemExit(1)
+    added = snapshot()
+
+    client.post('/api/transactions/update', json={'transaction_id': transaction_id, 'amount': '3.50', 'description': 'round trip check', 'date': day, 'category': category_name, 'account': str(account_id)})
+    edited = snapshot()
+    client.delete(f'/api/transactions/delete/{transaction_id}')
+    after = snapshot()
+
+    failures = []
+    if added[0] - before[0] != Decimal('12.34') or added[2] - before[2] != Decimal('-12.34'):
+        failures.append(f"after insert: {before} -> {added}")
+    if edited[0] - before[0] != Decimal('3.50') or edited[2] - before[2] != Decimal('-3.50'):
+        failures.append(f"after edit: {before} -> {edited}")
+    if after != before:
+        failures.append(f"after delete: {before} -> {after}")
+    for failure in failures:
+        click.echo(f"Mismatch {failure} (daily total, count, balance)")
+    if failures:
+        raise SystemExit(1)
+    click.echo(f"Insert, edit and delete of 12.34 left daily_spend and the balance unchanged ({before}).")
+
+# Schema changes live in migrations/ as numbered .sql files applied on top of budgetbuddydb.sql.
+# Applied versions are recorded in schema_migrations so each file only runs once.
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+def load_migrations():
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = re.match(r'(\d+)_(\w+)\.sql$', filename)
+        if match:
+            with open(os.path.join(MIGRATIONS_DIR, filename), encoding='utf-8') as migration_file:
+                migrations.append((int(match.group(1)), match.group(2), migration_file.read()))
+    return migrations
+
+def split_sql_statements(sql):
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [statement.strip() for statement in "\n".join(lines).split(';') if statement.strip()]
+
+@app.cli.command('migrate')
+@click.option('--status', is_flag=True, help='Only list applied and pending migrations.')
+def migrate_command(status):
+    with get_db_connection() as db:
+        cursor = db.cursor()
+        cursor.execute("CREATE TABLE IF NOT EXISTS schema_migrations (Version int NOT NULL, Name varchar(100) NOT NULL, Applied_At datetime NOT NULL DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (Version))")
+        cursor.execute("SELECT Version FROM schema_migrations")
+        applied = {row[0] for row in cursor.fetchall()}
+        for version, name, sql in load_migrations():
+            label = f"{version:04d}_{name}"
+            if version in applied:
+                click.echo(f"{label}: applied")
+            elif status:
+                click.echo(f"{label}: pending")
+            else:
+                # MySQL commits DDL as it goes, so a migration that fails halfway has to be fixed by hand
+                for statement in split_sql_statements(sql):
+                    cursor.execute(statement)
+                cursor.execute("INSERT INTO schema_migrations (Version, Name) VALUES (%s, %s)", (version, name))
+                click.echo(f"{label}: applied now")
+        cursor.close()
+
+# Queries checked by explain-queries. Each entry is (name, sql, params), where params builds the
+# query's parameters from the sample user, date range and ids.
+EXPLAIN_QUERIES = [
+    ("user accounts", USER_ACCOUNTS_QUERY, lambda p: (p['user_id'],)),
+    ("monthly budget goal", BUDGET_GOAL_QUERY, lambda p: (p['user_id'],)),
+    ("user categories", USER_CATEGORIES_QUERY, lambda p: (p['user_id'],)),
+    ("spent in range", SPENT_IN_RANGE_QUERY, lambda p: (p['user_id'], p['start_date'], p['end_date'])),
+    ("category daily spend", CATEGORY_DAILY_SPEND_QUERY, lambda p: (p['user_id'], p['start_date'], p['end_date'])),
+    ("category totals", CATEGORY_TOTALS_QUERY, lambda p: (p['user_id'], p['start_date'], p['end_date'])),
+    ("prediction period totals", PERIOD_DAILY_TOTALS_QUERY, lambda p: (p['user_id'], p['start_date'], p['end_date'])),
+    ("spending summary", SPENDING_SUMMARY_QUERY, lambda p: (p['user_id'], p['start_date'], p['end_date'])),
+    ("top transactions", TOP_TRANSACTIONS_QUERY, lambda p: (p['user_id'], p['start_date'], p['end_date'], 5)),
+    ("transaction list", TRANSACTION_LIST_QUERY.format(where="t.User_ID = %s AND t.Transaction_Date >= %s AND t.Transaction_Date <= %s", order="ORDER BY t.Transaction_Date DESC, t.Transaction_ID DESC") + " LIMIT 201", lambda p: (p['user_id'], p['start_date'], p['end_date'])),
+    ("transaction owner check", "SELECT 1 FROM makes WHERE User_ID = %s AND Transaction_ID = %s", lambda p: (p['user_id'], p['transaction_id'])),
+    ("transaction links", "SELECT t.Transaction_Amount, mo.Account_ID, t.Transaction_Date, fu.Category_ID FROM transactions t JOIN makes m ON t.Transaction_ID = m.Transaction_ID LEFT JOIN made_on mo ON t.Transaction_ID = mo.Transaction_ID LEFT JOIN falls_under fu ON t.Transaction_ID = fu.Transaction_ID WHERE m.User_ID = %s AND t.Transaction_ID = %s", lambda p: (p['user_id'], p['transaction_id'])),
+    ("account in use", "SELECT 1 FROM made_on WHERE Account_ID = %s LIMIT 1", lambda p: (p['account_id'],)),
+    ("setup budget goal", "SELECT 1 FROM goals g JOIN sets s USING(Goal_ID) WHERE s.User_ID = %s AND g.Monthly_Budget = 1 LIMIT 1", lambda p: (p['user_id'],)),
+    ("account balance", ACCOUNT_BALANCE_QUERY, lambda p: (p['account_id'],)),
+    ("account owner check", ACCOUNT_OWNER_QUERY, lambda p: (p['user_id'], p['account_id'])),
+    ("category by name", USER_CATEGORY_ID_QUERY, lambda p: (p['user_id'], p['category_name'])),
+    ("transaction edit lock", TRANSACTION_EDIT_LOCK_QUERY, lambda p: (p['transaction_id'],)),
+    ("user goals", USER_GOALS_QUERY, lambda p: (p['user_id'],)),
+    ("goal owner check", GOAL_OWNER_QUERY, lambda p: (p['user_id'], p['goal_id'])),
+    ("goal detail", GOAL_DETAIL_QUERY, lambda p: (p['user_id'], p['goal_id'])),
+    ("batch owned transactions", OWNED_TRANSACTIONS_QUERY.format(ids="%s, %s"), lambda p: [p['user_id']] + p['transaction_ids']),
+    ("batch update amounts", BATCH_UPDATE_QUERY.format(table="transactions", column="Transaction_Amount", ids="%s, %s"), lambda p: [0] + p['transaction_ids']),
+    ("batch update categories", BATCH_UPDATE_QUERY.format(table="falls_under", column="Category_ID", ids="%s, %s"), lambda p: [0] + p['transaction_ids']),
+    ("batch update accounts", BATCH_UPDATE_QUERY.format(table="made_on", column="Account_ID", ids="%s, %s"), lambda p: [p['account_id']] + p['transaction_ids']),
+] + [
+    (f"batch delete {table}", BATCH_DELETE_QUERY.format(table=table, ids="%s, %s"), lambda p: p['transaction_ids'])
+    for table in ('falls_under', 'made_on', 'makes', 'transactions')
+] + [
+    ("import categories", IMPORT_CATEGORIES_QUERY, lambda p: (p['user_id'],)),
+    ("import accounts", IMPORT_ACCOUNTS_QUERY, lambda p: (p['user_id'],)),
+    ("import id check", IMPORT_ID_CHECK_QUERY, lambda p: (p['user_id'], p['transaction_id'], p['transaction_id'] + 500)),
+    ("account ledger reset", ACCOUNT_LEDGER_DELETE_QUERY, lambda p: (p['account_id'],)),
+]
+
+# Tables that grow with usage. A full table scan (type ALL) or a full index scan (type index) of any of
+# these counts as a regression.
+EXPLAIN_LARGE_TABLES = {'transactions', 'makes', 'falls_under', 'made_on', 'daily_spend', 'sets', 'has', 'selects', 'account_ledger', 'categories', 'accounts', 'goals'}
+EXPLAIN_FULL_SCAN_TYPES = {'ALL', 'index'}
+
+# Run EXPLAIN on every query in EXPLAIN_QUERIES and fail if one falls back to a full table or index scan.
+# Use a database with realistic data, since MySQL may choose to scan a nearly empty table.
+@app.cli.command('explain-queries')
+@click.option('--user-id', type=int, required=True, help='User to use as the sample parameter.')
+@click.option('--start-date', default=lambda: datetime.date.today().replace(day=1).strftime('%Y-%m-%d'))
+@click.option('--end-date', default=lambda: datetime.date.today().strftime('%Y-%m-%d'))
+@click.option('--transaction-id', type=int, default=1)
+@click.option('--account-id', type=int, default=1)
+@click.option('--goal-id', type=int, default=1)
+@click.option('--category-name', default='Food')
+def explain_queries_command(user_id, start_date, end_date, transaction_id, account_id, goal_id, category_name):
+    sample = {'user_id': user_id, 'start_date': start_date, 'end_date': end_date, 'transaction_id': transaction_id, 'transaction_ids': [transaction_id, transaction_id + 1], 'account_id': account_id, 'goal_id': goal_id, 'category_name': category_name}
+    failures = 0
+    with get_db_connection() as db:
+        cursor = db.cursor(dictionary=True)
+        for name, query, params in EXPLAIN_QUERIES:
+            cursor.execute("EXPLAIN " + query, params(sample))
+            plan = cursor.fetchall()
+            full_scans = [row['table'] for row in plan if row.get('type') in EXPLAIN_FULL_SCAN_TYPES and row.get('table') in EXPLAIN_LARGE_TABLES]
+            if full_scans:
+                failures += 1
+                click.echo(f"FAIL {name}: full scan of {', '.join(full_scans)}")
+            else:
+                click.echo(f"ok   {name}: " + ", ".join(f"{row.get('table')}={row.get('key') or row.get('type')}" for row in plan))
+        cursor.close()
+    if failures:
+        raise SystemExit(1)
+
+# Getting Gemini ready. Done on the first chatbot request so other workers never import the SDK.
+gemini_model = None
+gemini_model_lock = threading.Lock()
+
+def get_gemini_model():
+    global gemini_model
+    if gemini_model is None:
+        with gemini_model_lock:
+            if gemini_model is None:
+                try:
+                    import google.generativeai as genai
+                    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+                    genai.configure(api_key=GEMINI_API_KEY)
+                    generation_config = genai.GenerationConfig(
+                        max_output_tokens=1600,
+                        response_mime_type="text/plain",
+                    )
+
+                    gemini_model = genai.GenerativeModel(
+                        model_name='gemini-1.5-flash',
+                        generation_config=generation_config
+                    )
+                except Exception as e:
+                    return None
+    return gemini_model
+
+# Stand-in for Gemini with the same generate_content interface, for trying the chatbot locally without
+# an API key. Turned on with CHATBOT_MODEL=stub. CHATBOT_STUB_DELAY adds a pause before each chunk.
+class StubChatModel:
+    def __init__(self, delay):
+        self.delay = delay
+
+    def make_response(self, text):
+        return SimpleNamespace(text=text, parts=[SimpleNamespace(text=text)], prompt_feedback=None)
+
+    def stream_chunks(self, text):
+        for word in text.split(' '):
+            time.sleep(self.delay)
+            yield self.make_response(word + ' ')
+
+    def generate_content(self, prompt, stream=False):
+        summary_line = next((line.strip() for line in prompt.splitlines() if line.strip().startswith('Total Spent:')), 'no summary')
+        text = f"This is the stub model. It was sent a {len(prompt)} character prompt ({summary_line})."
+        if stream:
+            return self.stream_chunks(text)
+        time.sleep(self.delay)
+        return self.make_response(text)
+
+stub_chat_model = StubChatModel(float(os.getenv("CHATBOT_STUB_DELAY", 0.05)))
+
+def get_chat_model():
+    if os.getenv("CHATBOT_MODEL") == "stub":
+        return stub_chat_model
+    return get_gemini_model()
 
 # Used for decimals to JSON. Needed for charts and whatnot
 class DecimalEncoder(json.JSONEncoder):
@@ -68,8 +905,225 @@ class DecimalEncoder(json.JSONEncoder):
         return super(DecimalEncoder, self).default(obj)
 app.json_encoder = DecimalEncoder
 
+# Cache for rendered charts. Charts are keyed by a hash of the data and settings used to draw them,
+# so if the numbers haven't changed the PNG is reused and matplotlib is skipped entirely.
+# Least recently used charts are dropped once the byte budget is used up. Keys start with the id of the
+# user the chart was drawn for, so /charts/<key>.png can refuse keys that belong to someone else.
+class ChartCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def make_key(self, chart_name, *inputs):
+        user_id = session.get('user_id') if has_request_context() else None
+        payload = json.dumps([chart_name, inputs], sort_keys=True, default=str)
+        return f"{user_id}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def get(self, key):
+        with self.lock:
+            png_bytes = self.entries.get(key)
+            if png_bytes is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return png_bytes
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def put(self, key, png_bytes):
+        size = len(png_bytes)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.current_bytes -= len(self.entries.pop(key))
+            self.entries[key] = png_bytes
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+chart_cache = ChartCache(int(os.getenv("CHART_CACHE_MAX_BYTES", 32 * 1024 * 1024)))
+
+# Charts are drawn by a few separate processes running the functions in chart_renderer.py. matplotlib
+# holds the GIL while it draws, so a big chart drawn in the request thread would stall every other
+# request on the worker. render() gives up and returns None when too many charts are already waiting
+# or a chart takes longer than the timeout, and the caller shows a message image instead.
+# With CHART_RENDER_WORKERS=0 charts are drawn in the request thread like before.
+class ChartRenderPool:
+    def __init__(self, workers, max_queue, timeout):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.executor = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.render_seconds = 0.0
+        self.lock = threading.Lock()
+
+    # Start the render processes. Called when the dashboard page loads so the processes are ready by
+    # the time it asks for charts. CLI commands never start them. The web process runs request threads,
+    # so the processes come from a fork server (or spawn where there is none) instead of forking the web
+    # process and copying locks other threads were holding. The fork server preloads chart_renderer, and
+    # every process it forks runs warm_up once as it starts. Under python app.py the processes import
+    # app.py again as __mp_main__, which is safe because nothing there connects to the database until
+    # it is used. These start methods only launch a process when work arrives, so one no-op per worker
+    # gets them all running now.
+    def start(self):
+        if self.workers <= 0:
+            return None
+        with self.lock:
+            if self.executor is None:
+                if 'forkserver' in multiprocessing.get_all_start_methods():
+                    mp_context = multiprocessing.get_context('forkserver')
+                    mp_context.set_forkserver_preload(['chart_renderer'])
+                else:
+                    mp_context = multiprocessing.get_context('spawn')
+                self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=mp_context, initializer=chart_renderer.warm_up)
+                for _ in range(self.workers):
+                    self.executor.submit(chart_renderer.ready)
+            return self.executor
+
+    def discard(self, executor):
+        with self.lock:
+            if self.executor is executor:
+                self.executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # Runs when a render really finishes, which can be after render() stopped waiting for it,
+    # so a chart that timed out still counts against the queue until its process is free
+    def finished(self, future, started):
+        with self.lock:
+            self.in_flight -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failures += 1
+            else:
+                self.completed += 1
+                self.render_seconds += time.monotonic() - started
+
+    # Submit to the current executor. If it was broken, or another thread's discard() already shut it
+    # down (submit then raises RuntimeError), try once more on a fresh one.
+    def submit(self, render_func, *args):
+        executor = self.start()
+        try:
+            return executor, executor.submit(render_func, *args)
+        except RuntimeError:
+            self.discard(executor)
+            executor = self.start()
+            return executor, executor.submit(render_func, *args)
+
+    def render(self, render_func, *args):
+        if self.workers <= 0:
+            return render_func(*args)
+
+        with self.lock:
+            if self.in_flight >= self.workers + self.max_queue:
+                self.rejected += 1
+                return None
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+        started = time.monotonic()
+        try:
+            executor, future = self.submit(render_func, *args)
+        except Exception as e:
+            with self.lock:
+                self.in_flight -= 1
+                self.failures += 1
+            print(f"Could not queue chart render: {e}")
+            return None
+        future.add_done_callback(lambda done: self.finished(done, started))
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FuturesTimeoutError:
+            with self.lock:
+                self.timeouts += 1
+            return None
+        except BrokenProcessPool:
+            # A render process died, start a fresh pool on the next chart
+            self.discard(executor)
+            return None
+
+    def stats(self):
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "timeout_seconds": self.timeout,
+                "started": self.executor is not None,
+                "in_flight": self.in_flight,
+                "queued": max(0, self.in_flight - self.workers),
+                "peak_in_flight": self.peak_in_flight,
+                "completed": self.completed,
+                "failures": self.failures,
+                "timeouts": self.timeouts,
+                "rejected": self.rejected,
+                "avg_render_ms": round(self.render_seconds * 1000 / self.completed, 1) if self.completed else 0.0
+            }
+
+chart_render_pool = ChartRenderPool(
+    int(os.getenv("CHART_RENDER_WORKERS", 2)),
+    int(os.getenv("CHART_RENDER_QUEUE", 8)),
+    float(os.getenv("CHART_RENDER_TIMEOUT", 10))
+)
+
+def png_data_uri(png_bytes):
+    base64_str = base64.b64encode(png_bytes).decode('utf-8')
+    return f'data:image/png;base64,{base64_str}'
+
+# With ?delivery=url a chart is sent as a link to /charts/<key>.png instead of a data URI, so the
+# browser downloads the raw PNG and can keep it. Charts too big for the cache still go as data URIs.
+def chart_image_src(cache_key, png_bytes):
+    if has_request_context() and request.args.get('delivery') == 'url' and cache_key in chart_cache:
+        return url_for('get_chart_png', key=cache_key)
+    return png_data_uri(png_bytes)
+
+# JSON for a chart image. Links go under chart_url and inline images under chart_uri.
+def chart_payload(image_src):
+    if image_src.startswith('data:'):
+        return {"chart_uri": image_src}
+    return {"chart_url": image_src}
+
+# Placeholder images only depend on the message and size, and the same few messages come up all the
+# time (every new user gets "No spending data"), so each one is drawn once and then reused
+message_images = {}
+message_images_lock = threading.Lock()
+MESSAGE_IMAGE_LIMIT = 256
+
 # Use to create the message for when an image is not being displayed correctly
 def create_message_image(message, width=6, height=4, dpi=72): 
+    key = (message, width, height, dpi)
+    image_uri = message_images.get(key)
+    if image_uri:
+        return image_uri
+
     fig = None
     try:
         fig, ax = plt.subplots(figsize=(width, height), dpi=dpi)
@@ -79,14 +1133,18 @@ def create_message_image(message, width=6, height=4, dpi=72):
 
         buffer = io.BytesIO()
         fig.savefig(buffer, format='png', transparent=True)
-        buffer.seek(0)
         plt.close(fig)
-        base64_str = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        return f'data:image/png;base64,{base64_str}'
+        image_uri = png_data_uri(buffer.getvalue())
     except Exception as e:
         plt.close(fig)
+        # The fallback isn't kept so the next call tries to draw the message again
         return url_for('static', filename='error.png')
 
+    with message_images_lock:
+        if len(message_images) < MESSAGE_IMAGE_LIMIT:
+            message_images[key] = image_uri
+    return image_uri
+
 # The first route
 @app.route('/')
 def index():
@@ -122,6 +1180,7 @@ def login():
                     if check_password_hash(user["Password"], password):
                         session['user_id'] = user['User_ID']
                         session['user_name'] = user['Full_Name']
+                        session.pop('setup_complete', None)
                         if check_setup_complete(user['User_ID']):
                             return redirect(url_for('dashboard'))
                         else:
@@ -188,12 +1247,12 @@ def register():
                 db.commit()
 
                 # Load user credentials for session
-                cursor.execute("SELECT User_ID, Full_Name FROM users WHERE Email = %s", (email,))
-                user = cursor.fetchone()
+                user = {'User_ID': cursor.lastrowid, 'Full_Name': fullname} if cursor.lastrowid else None
                 cursor.close()
                 if user:
                     session['user_id'] = user['User_ID']
                     session['user_name'] = user['Full_Name']
+                    session.pop('setup_complete', None)
                     return redirect(url_for('setup'))
                 else:
                      flash('Registration succeeded but failed to log in automatically.', 'warning')
@@ -208,6 +1267,7 @@ def register():
 def logout():
     session.pop('user_id', None)
     session.pop('user_name', None)
+    session.pop('setup_complete', None)
     flash('You have been logged out!', 'success')
     return redirect(url_for('login'))
 
@@ -233,26 +1293,19 @@ def setup():
 
 
         try:
-            with get_db_connection() as db:
-                # Load initial user data into the database
-                cursor = db.cursor()
+            # Load initial user data into the database
+            with unit_of_work() as cursor:
                 cursor.execute("INSERT INTO accounts (Account_Name, Account_Balance, Account_Type) VALUES (%s, %s, %s)", (account_name, account_balance, account_type))
-                cursor.execute("SELECT LAST_INSERT_ID()")
-                account_id = cursor.fetchone()[0]
-                cursor.execute("INSERT INTO has (User_ID, Account_ID) VALUES (%s, %s)", (user_id, account_id))
+                cursor.execute("INSERT INTO has (User_ID, Account_ID) VALUES (%s, %s)", (user_id, cursor.lastrowid))
 
                 cursor.execute("INSERT INTO goals (Goal_Name, Goal_Date, Goal_Target, Goal_Description, Monthly_Budget) VALUES (%s, %s, %s, %s, %s)", ("Monthly Budget", "2000-01-01", budget, "Monthly Budget", 1))
-                cursor.execute("SELECT LAST_INSERT_ID()")
-                budget_goal_id = cursor.fetchone()[0]
-                cursor.execute("INSERT INTO sets (User_ID, Goal_ID) VALUES (%s, %s)", (user_id, budget_goal_id))
+                cursor.execute("INSERT INTO sets (User_ID, Goal_ID) VALUES (%s, %s)", (user_id, cursor.lastrowid))
 
                 cursor.execute("INSERT INTO goals (Goal_Name, Goal_Date, Goal_Target, Goal_Description, Monthly_Budget) VALUES (%s, %s, %s, %s, %s)", (goal, deadline, goal_target, "First Goal", 0))
-                cursor.execute("SELECT LAST_INSERT_ID()")
-                first_goal_id = cursor.fetchone()[0]
-                cursor.execute("INSERT INTO sets (User_ID, Goal_ID) VALUES (%s, %s)", (user_id, first_goal_id))
+                cursor.execute("INSERT INTO sets (User_ID, Goal_ID) VALUES (%s, %s)", (user_id, cursor.lastrowid))
 
-                db.commit()
-                cursor.close()
+            invalidate_metadata(user_id)
+            session['setup_complete'] = user_id
 
         except Exception as e:
             flash('An error occurred', 'error')
@@ -274,11 +1327,7 @@ def transaction():
 
     # Retrieve user's account data
     try:
-        with get_db_connection() as db:
-            cursor = db.cursor(dictionary=True)
-            cursor.execute("SELECT Account_ID, Account_Name, Account_Balance FROM accounts JOIN has USING (Account_ID) WHERE User_ID = %s", (user_id,))
-            accounts = cursor.fetchall()
-            cursor.close()
+        accounts = load_accounts(user_id)
     except Exception as e:
         flash('Could not load account data.', 'error')
 
@@ -290,36 +1339,34 @@ def transaction():
         account_id_form = request.form['account']
 
         try:
+            amount = to_cents(amount)
             with get_db_connection() as db:
-                cursor = db.cursor(dictionary=True)
-
-                # Check if selected category exists
-                cursor.execute("SELECT Category_ID FROM categories JOIN selects USING (Category_ID) WHERE User_ID = %s AND Category_Name = %s", (user_id, category_name))
+                # Check if selected category exists. This happens before the unit of work so a rejected
+                # form neither commits nor makes the user's reads sticky to the primary.
+                cursor = db.cursor()
+                cursor.execute(USER_CATEGORY_ID_QUERY, (user_id, category_name))
                 category_result = cursor.fetchone()
+                cursor.close()
                 if not category_result:
                      flash('Selected category not found.', 'error')
-                     cursor.close()
                      return render_template('transaction.html', categories=categories, accounts=accounts, user_name=session.get('user_name', 'User'))
-                category_id = category_result['Category_ID']
+                category_id = category_result[0]
 
                 # Record transaction in database
-                cursor.execute("INSERT INTO transactions (Transaction_Amount, Transaction_Description, Transaction_Date) VALUES (%s, %s, %s)", (amount, description, date))
-                cursor = db.cursor()
-                cursor.execute("SELECT LAST_INSERT_ID()")
-                transaction_id = cursor.fetchone()[0]
-                print("Transaction ID: ", transaction_id)
+                with unit_of_work(db) as cursor:
+                    cursor.execute("INSERT INTO transactions (User_ID, Transaction_Amount, Transaction_Description, Transaction_Date) VALUES (%s, %s, %s, %s)", (user_id, amount, description, date))
+                    transaction_id = cursor.lastrowid
 
-                cursor.execute("INSERT INTO makes (User_ID, Transaction_ID) VALUES (%s, %s)", (user_id, transaction_id))
-                cursor.execute("INSERT INTO falls_under (Transaction_ID, Category_ID) VALUES (%s, %s)", (transaction_id, category_id))
-                cursor.execute("INSERT INTO made_on (Transaction_ID, Account_ID) VALUES (%s, %s)", (transaction_id, account_id_form))
+                    cursor.execute("INSERT INTO makes (User_ID, Transaction_ID) VALUES (%s, %s)", (user_id, transaction_id))
+                    cursor.execute("INSERT INTO falls_under (Transaction_ID, Category_ID) VALUES (%s, %s)", (transaction_id, category_id))
+                    cursor.execute("INSERT INTO made_on (Transaction_ID, Account_ID) VALUES (%s, %s)", (transaction_id, account_id_form))
 
-                cursor.execute("UPDATE accounts SET Account_Balance = Account_Balance - %s WHERE Account_ID = %s", (amount, account_id_form))
+                    apply_balance_changes(cursor, {int(account_id_form): -amount})
+                    apply_daily_spend(cursor, user_id, category_id, date, amount, 1)
 
-                db.commit()
-                cursor.close()
-
-                flash('Transaction recorded', 'success')
-                return redirect(url_for('dashboard'))
+            invalidate_user_caches(user_id)
+            flash('Transaction recorded', 'success')
+            return redirect(url_for('dashboard'))
 
         except Exception as e:
             flash('Failed to save transaction. Please try again.', 'error')
@@ -349,16 +1396,14 @@ def category():
                     new_category_name = request.form['add_category'].strip()
                     # Check if category already exists
                     if new_category_name:
-                        cursor.execute("SELECT Category_ID FROM categories JOIN selects USING (Category_ID) WHERE User_ID = %s AND Category_Name = %s", (user_id, new_category_name))
+                        cursor.execute(USER_CATEGORY_ID_QUERY, (user_id, new_category_name))
                         if cursor.fetchone():
                              flash('Category already exists.', 'warning')
                         else:
-                            cursor = db.cursor()
-                            cursor.execute("INSERT INTO categories (Category_Name) VALUES (%s)", (new_category_name,))
-                            cursor.execute("SELECT LAST_INSERT_ID()")
-                            category_id = cursor.fetchone()[0]
-                            cursor.execute("INSERT INTO selects (User_ID, Category_ID) VALUES (%s, %s)", (user_id, category_id))
-                            db.commit()
+                            with unit_of_work(db) as write_cursor:
+                                write_cursor.execute("INSERT INTO categories (Category_Name) VALUES (%s)", (new_category_name,))
+                                write_cursor.execute("INSERT INTO selects (User_ID, Category_ID) VALUES (%s, %s)", (user_id, write_cursor.lastrowid))
+                            invalidate_metadata(user_id, 'categories')
                             flash('Category added.', 'success')
                             categories = load_categories(user_id)
                     else:
@@ -374,11 +1419,11 @@ def category():
                             new_name = new_name.strip()
 
                             if old_name and new_name and old_name != new_name:
-                                cursor.execute("SELECT Category_ID FROM categories JOIN selects USING (Category_ID) WHERE User_ID = %s AND Category_Name = %s", (user_id, old_name))
+                                cursor.execute(USER_CATEGORY_ID_QUERY, (user_id, old_name))
                                 category_result = cursor.fetchone()
                                 if category_result:
                                      category_id = category_result['Category_ID']
-                                     cursor.execute("SELECT Category_ID FROM categories JOIN selects USING (Category_ID) WHERE User_ID = %s AND Category_Name = %s AND Category_ID != %s", (user_id, new_name, category_id))
+                                     cursor.execute(USER_CATEGORY_ID_QUERY + " AND Category_ID != %s", (user_id, new_name, category_id))
                                      if cursor.fetchone():
                                          flash(f'Cannot rename "{old_name}" to "{new_name}", category already exists.', 'error')
                                      else:
@@ -386,6 +1431,7 @@ def category():
                                          updated_count += 1
                     if updated_count > 0:
                         db.commit()
+                        invalidate_metadata(user_id, 'categories', 'chat_summary')
                         flash(f'{updated_count} categor{"y" if updated_count == 1 else "ies"} updated.', 'success')
                         categories = load_categories(user_id)
                 # Delete category
@@ -398,13 +1444,14 @@ def category():
                             break
                     
                     if category_name_to_delete:
-                        cursor.execute("SELECT Category_ID FROM categories JOIN selects USING (Category_ID) WHERE User_ID = %s AND Category_Name = %s", (user_id, category_name_to_delete))
+                        cursor.execute(USER_CATEGORY_ID_QUERY, (user_id, category_name_to_delete))
                         category_result = cursor.fetchone()
                         if category_result:
                             category_id = category_result['Category_ID']
                             cursor.execute("DELETE FROM selects WHERE User_ID = %s AND Category_ID = %s", (user_id, category_id))
                             cursor.execute("DELETE FROM categories WHERE Category_ID = %s", (category_id,))
                             db.commit()
+                            invalidate_metadata(user_id, 'categories', 'chat_summary')
                             flash(f'Category "{category_name_to_delete}" deleted.', 'success')
                             categories = load_categories(user_id)
                         else:
@@ -418,25 +1465,97 @@ def category():
     return render_template('category.html', categories=categories, user_name=session.get('user_name', 'User'))
 
 
+# Per-user cache of category names and account rows. Nearly every page needs them, but they only change
+# through the category, account and transaction routes, which clear the user's entries. Those routes
+# only clear the cache of the worker that served them, so entries are kept for a few seconds: a change
+# made on one worker can take that long to show up on another, while a page load that reads the same
+# data several times still runs one query.
+# The chatbot's period summaries are kept here too, under kinds like ('chat_summary', start_date,
+# end_date, limit). Those keys come from the client, so the cache is an LRU capped at
+# METADATA_CACHE_SIZE entries, and expired entries are swept out whenever a new one is stored.
+METADATA_CACHE_TTL = float(os.getenv("METADATA_CACHE_TTL", 5))
+METADATA_CACHE_SIZE = int(os.getenv("METADATA_CACHE_SIZE", 5000))
+# Account rows carry balances, which every transaction write changes, and a write on one worker only
+# clears that worker's copy. Accounts are therefore kept for just a few seconds: other workers can show
+# a balance up to this old, and a burst of page loads still shares one query. Set it to 0 to always
+# read balances from the database.
+ACCOUNTS_CACHE_TTL = float(os.getenv("ACCOUNTS_CACHE_TTL", 5))
+# The chatbot's period summaries are spending totals, so they go stale on other workers the same way
+CHAT_SUMMARY_CACHE_TTL = float(os.getenv("CHAT_SUMMARY_CACHE_TTL", 5))
+metadata_cache = OrderedDict()
+metadata_generations = {}
+metadata_cache_lock = threading.Lock()
+
+def get_cached_metadata(user_id, kind, loader, ttl=None):
+    key = (user_id, kind)
+    now = time.monotonic()
+    with metadata_cache_lock:
+        entry = metadata_cache.get(key)
+        if entry and entry[0] > now:
+            metadata_cache.move_to_end(key)
+            return entry[1]
+        if entry:
+            del metadata_cache[key]
+        generation = metadata_generations.get(user_id, 0)
+
+    value = loader(user_id)
+    with metadata_cache_lock:
+        # Skip storing if the user's data was changed while we were loading it
+        if metadata_generations.get(user_id, 0) == generation:
+            metadata_cache[key] = (now + (METADATA_CACHE_TTL if ttl is None else ttl), value)
+            metadata_cache.move_to_end(key)
+        for expired_key in [k for k, cached in metadata_cache.items() if cached[0] <= now]:
+            del metadata_cache[expired_key]
+        while len(metadata_cache) > METADATA_CACHE_SIZE:
+            metadata_cache.popitem(last=False)
+    return value
+
+def metadata_kind(kind):
+    return kind[0] if isinstance(kind, tuple) else kind
+
+def invalidate_metadata(user_id, *kinds):
+    remember_write()
+    with metadata_cache_lock:
+        metadata_generations[user_id] = metadata_generations.get(user_id, 0) + 1
+        for key in [k for k in metadata_cache if k[0] == user_id and (not kinds or metadata_kind(k[1]) in kinds)]:
+            del metadata_cache[key]
+
+def fetch_categories(user_id):
+    with get_db_connection() as db:
+        cursor = db.cursor()
+        cursor.execute(USER_CATEGORIES_QUERY, (user_id,))
+        categories_tuples = cursor.fetchall()
+        cursor.close()
+    return tuple(category[0] for category in categories_tuples)
+
+def fetch_accounts(user_id):
+    with get_db_connection() as db:
+        cursor = db.cursor(dictionary=True)
+        cursor.execute(USER_ACCOUNTS_QUERY, (user_id,))
+        accounts = cursor.fetchall()
+        cursor.close()
+    return tuple(accounts)
+
 def load_categories(user_id):
     categories = []
     try:
-        with get_db_connection() as db:
-            cursor = db.cursor()
-            cursor.execute("SELECT Category_Name FROM categories JOIN selects USING (Category_ID) WHERE User_ID = %s ORDER BY Category_Name", (user_id,))
-            categories_tuples = cursor.fetchall()
-            cursor.close()
-            categories = [category[0] for category in categories_tuples]
+        categories = list(get_cached_metadata(user_id, 'categories', fetch_categories))
     except Exception as e:
         print(f"Error loading categories for user {user_id}: {e}")
     return categories
 
+# Load the user's accounts (id, name, type, balance) ordered by name. Raises if the DB can't be reached.
+def load_accounts(user_id):
+    return [dict(account) for account in get_cached_metadata(user_id, 'accounts', fetch_accounts, ACCOUNTS_CACHE_TTL)]
+
 @app.route('/dashboard', methods=['GET', 'POST'])
 def dashboard():
     user_id = session.get('user_id')
     if not user_id:
         return redirect(url_for('login'))
 
+    chart_render_pool.start()
+
     user_name = session.get('user_name', 'User')
     total_balance = 0.0
     total_spent = 0.0
@@ -481,23 +1600,20 @@ def dashboard():
         end_date_str = end_date_dt.strftime('%Y-%m-%d')
 
 
-        with get_db_connection() as db:
-            cursor = db.cursor(dictionary=True)
+        # Get total balance from all accounts
+        total_balance = sum(float(account['Account_Balance']) for account in load_accounts(user_id))
 
-            # Get total balance from all accounts
-            cursor.execute("SELECT SUM(Account_Balance) as total_balance FROM accounts JOIN has USING (Account_ID) WHERE User_ID = %s", (user_id,))
-            balance_result = cursor.fetchone()
-            if balance_result and balance_result['total_balance'] is not None:
-                total_balance = float(balance_result['total_balance'])
+        with get_db_connection(read_only=True) as db:
+            cursor = db.cursor(dictionary=True)
 
             # Get monthly budget goal
-            cursor.execute("SELECT Goal_Target FROM goals WHERE Monthly_Budget = 1 AND Goal_ID IN (SELECT Goal_ID FROM sets WHERE User_ID = %s)", (user_id,))
+            cursor.execute(BUDGET_GOAL_QUERY, (user_id,))
             budget_result = cursor.fetchone()
             monthly_budget_goal = 0.0
             if budget_result and budget_result['Goal_Target'] is not None:
                 monthly_budget_goal = float(budget_result['Goal_Target'])
 
-            cursor.execute("SELECT SUM(Transaction_Amount) as total_spent FROM transactions JOIN makes USING (Transaction_ID) WHERE User_ID = %s AND Transaction_Date BETWEEN %s AND %s", (user_id, start_date_str, end_date_str))
+            cursor.execute(SPENT_IN_RANGE_QUERY, (user_id, start_date_str, end_date_str))
 
             spent_result = cursor.fetchone()
             if spent_result and spent_result['total_spent'] is not None:
@@ -537,8 +1653,21 @@ def dashboard():
 def logged_in():
     return 'user_id' in session
 
-# Check is user completed initial setup
+# Internal stats endpoints are only served to callers holding the stats token. Behind a reverse proxy
+# on the same machine every request arrives from 127.0.0.1, so trusting loopback addresses is an
+# opt-in (INTERNAL_STATS_ALLOW_LOCAL=1) for setups where the app is reached directly.
+def is_internal_request():
+    stats_token = os.getenv("INTERNAL_STATS_TOKEN")
+    if stats_token and hmac.compare_digest(request.headers.get('X-Internal-Token', ''), stats_token):
+        return True
+    return os.getenv("INTERNAL_STATS_ALLOW_LOCAL") == "1" and request.remote_addr in ('127.0.0.1', '::1')
+
+# Check is user completed initial setup. Once it is, the answer is remembered in the session (as the
+# user id it applies to) so later page loads don't query for it again. Routes that could undo setup,
+# like deleting an account or goal, clear the flag.
 def check_setup_complete(user_id):
+    if session.get('setup_complete') == user_id:
+        return True
     try:
         with get_db_connection() as db:
             cursor = db.cursor(dictionary=True)
@@ -548,82 +1677,56 @@ def check_setup_complete(user_id):
             has_budget_goal = cursor.fetchone()
             cursor.close()
             has_setup = has_account and has_budget_goal
+            if has_setup:
+                session['setup_complete'] = user_id
             return has_setup
     except Exception as e:
         return False
 
+# Chart endpoints return the numbers behind the chart with ?format=data so the dashboard can draw it
+# in the browser. When there is nothing to draw the placeholder message image is sent instead.
+def wants_chart_data():
+    return request.args.get('format') == 'data'
+
+# The budget goal is monthly, so scale it to the length of the view
+def scale_budget_goal(monthly_budget_goal, view):
+    if view == 'year':
+        return monthly_budget_goal * 12
+    elif view == 'week':
+        return monthly_budget_goal / 4.33
+    return monthly_budget_goal
+
 # Create pie chart for budget
 def create_budget_pie_chart(current_spent, budget_total):
-    fig = None
     try:
         current_spent_f = max(0, float(current_spent))
         budget_total_f = max(0.01, float(budget_total))
 
-        fig, ax = plt.subplots(figsize=(5, 5), dpi=90)
-        ax.set_title('Spending vs Budget', fontsize=14, pad=15, weight='bold')
-
         if current_spent_f == 0 and budget_total_f <= 0.01:
-             plt.close(fig)
              return create_message_image("No Budget or\nSpending Data", width=5, height=5, dpi=90)
-        # Check is user overspent
-        if current_spent_f > budget_total_f:
-            overspent_amount = current_spent_f - budget_total_f
-            labels = [f'Budget (${budget_total_f:.2f})']
-            sizes = [1]
-            colors = ['#dc3545']
-            pie_labels = [f'Budget Used (${budget_total_f:.2f})']
-            ax.text(0, 0, f"Overspent\n+${overspent_amount:.2f}",
-                    ha='center', va='center', fontsize=14, weight='bold', color='#dc3545')
-        elif current_spent_f == 0 and budget_total_f > 0:
-            labels = [f'Budget Remaining (${budget_total_f:.2f})']
-            sizes = [1]
-            colors = ['#28a745']
-            pie_labels = labels
-        else:
-            remaining = budget_total_f - current_spent_f
-            labels = [f'Spent (${current_spent_f:.2f})', f'Remaining (${remaining:.2f})']
-            sizes = [current_spent_f, remaining]
-            colors = ['#dc3545', '#28a745']
-            pie_labels = labels
-
-
-        if sizes and sum(sizes) > 0:
-             wedges, texts = ax.pie(
-                sizes,
-                explode=(0.05,) * len(sizes) if len(sizes) > 1 else None,
-                labels=None,
-                colors=colors,
-                autopct=None,
-                shadow=False,
-                startangle=90,
-                wedgeprops=dict(width=0.4, edgecolor='w')
-            )
-
-             ax.legend(wedges, pie_labels,
-                      loc='upper center',
-                      bbox_to_anchor=(0.5, -0.05),
-                      fontsize='12',
-                      frameon=False,
-                      ncol=1)
-        else:
-             ax.text(0.5, 0.5, "No Data", ha='center', va='center', transform=ax.transAxes, fontsize=14, color='#cccccc')
 
-        ax.axis('equal')
-        fig.tight_layout(rect=[0, 0.05, 1, 1])
+        cache_key = chart_cache.make_key('budget_pie', round(current_spent_f, 2), round(budget_total_f, 2))
+        cached_png = chart_cache.get(cache_key)
+        if cached_png:
+            return chart_image_src(cache_key, cached_png)
 
-        buffer = io.BytesIO()
-        fig.savefig(buffer, format='png', transparent=True)
-        buffer.seek(0)
-        plt.close(fig)
-
-        base64_str = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        return f'data:image/png;base64,{base64_str}'
+        png_bytes = chart_render_pool.render(chart_renderer.render_budget_pie, current_spent_f, budget_total_f)
+        if png_bytes is None:
+            return create_message_image("Chart is busy,\ntry again shortly", width=5, height=5, dpi=90)
+        chart_cache.put(cache_key, png_bytes)
+        return chart_image_src(cache_key, png_bytes)
 
     except Exception as e:
-        if fig: 
-            plt.close(fig)
         return create_message_image("Error loading\nbudget chart", width=5, height=5, dpi=90)
 
+# Budget pie chart for a chart endpoint response, as chart data or an image
+def budget_pie_payload(total_spent, budget_goal):
+    if wants_chart_data():
+        if total_spent <= 0 and budget_goal <= 0.01:
+            return {"chart_data": None, "chart_uri": create_message_image("No Budget or\nSpending Data", width=5, height=5, dpi=90)}
+        return {"chart_data": {"spent": round(max(0, total_spent), 2), "budget": round(max(0.01, budget_goal), 2)}}
+    return chart_payload(create_budget_pie_chart(total_spent, budget_goal))
+
 # Get data for pie chart
 @app.route('/api/pie-chart')
 def get_pie_chart_data_api():
@@ -643,108 +1746,65 @@ def get_pie_chart_data_api():
     monthly_budget_goal = 0.0
 
     try:
-        with get_db_connection() as db:
+        with get_db_connection(read_only=True) as db:
             cursor = db.cursor(dictionary=True)
 
             # Get total amount spent
-            cursor.execute("SELECT SUM(Transaction_Amount) AS total FROM transactions JOIN makes USING (Transaction_ID) WHERE User_ID = %s AND Transaction_Date BETWEEN %s AND %s", (user_id, start_date_str, end_date_str))
+            cursor.execute(SPENT_IN_RANGE_QUERY, (user_id, start_date_str, end_date_str))
             spent_result = cursor.fetchone()
-            total_spent = float(spent_result['total'] or 0.0)
+            total_spent = float(spent_result['total_spent'] or 0.0)
 
             # Get montly budget goal
-            cursor.execute("SELECT Goal_Target FROM goals WHERE Monthly_Budget = 1 AND Goal_ID IN (SELECT Goal_ID FROM sets WHERE User_ID = %s)", (user_id,))
+            cursor.execute(BUDGET_GOAL_QUERY, (user_id,))
             budget_result = cursor.fetchone()
             monthly_budget_goal = float(budget_result['Goal_Target'] or 0.0)
 
             cursor.close()
 
-        if view == 'year':
-            budget_goal = monthly_budget_goal * 12
-        elif view == 'week':
-             budget_goal = monthly_budget_goal / 4.33
-        else:
-            budget_goal = monthly_budget_goal
-
-        chart_uri = create_budget_pie_chart(total_spent, budget_goal)
-        if chart_uri:
-            return jsonify({"chart_uri": chart_uri})
-        else:
-            return jsonify({"error": "Chart generation failed"}), 500
+        budget_goal = scale_budget_goal(monthly_budget_goal, view)
+        return jsonify(budget_pie_payload(total_spent, budget_goal))
 
     except Exception as e:
         return jsonify({"error": f"Internal server error: {e}", "chart_uri": create_message_image("API Error", width=5, height=5, dpi=90)}), 500
 
+# Get daily spending per category in a date range
+def fetch_category_daily_spending(user_id, start_date, end_date):
+    with get_db_connection(read_only=True) as db:
+        cursor = db.cursor(dictionary=True)
+        cursor.execute(CATEGORY_DAILY_SPEND_QUERY, (user_id, start_date, end_date))
+        transactions = cursor.fetchall()
+        cursor.close()
+    return transactions
+
 # Create line chart for spending by category
-def create_line_chart_for_categories(user_id, start_date, end_date):
-    fig = None
+def create_line_chart_for_categories(transactions, start_date, end_date):
     try:
-        start_dt = datetime.datetime.strptime(start_date, '%Y-%m-%d').date()
-        end_dt = datetime.datetime.strptime(end_date, '%Y-%m-%d').date()
-        date_range_days = (end_dt - start_dt).days + 1
-
-        # Get 
-        with get_db_connection() as db:
-            cursor = db.cursor(dictionary=True)
-            cursor.execute("SELECT Category_Name, Transaction_Date, SUM(Transaction_Amount) AS Daily_Amount FROM transactions JOIN falls_under USING (Transaction_ID) JOIN categories USING (Category_ID) JOIN makes USING (Transaction_ID) WHERE User_ID = %s AND Transaction_Date BETWEEN %s AND %s GROUP BY Category_Name, Transaction_Date ORDER BY Transaction_Date, Category_Name", (user_id, start_date, end_date))
-            transactions = cursor.fetchall()
-            cursor.close()
-
-        fig, ax = plt.subplots(figsize=(7, 4), dpi=96)
-
         if not transactions:
-             plt.close(fig)
              return create_message_image("No spending data in this period.", width=7, height=4, dpi=96)
 
-        df = pd.DataFrame(transactions)
-        df['Transaction_Date'] = pd.to_datetime(df['Transaction_Date']).dt.date
-        df['Daily_Amount'] = df['Daily_Amount'].astype(float)
-        pivot_df = df.pivot_table(index='Transaction_Date', columns='Category_Name', values='Daily_Amount', fill_value=0)
-        all_dates = pd.date_range(start=start_dt, end=end_dt, freq='D').date
-        pivot_df = pivot_df.reindex(all_dates, fill_value=0)
-        colors = plt.cm.tab10.colors
-        categories = pivot_df.columns
-
-        for i, category in enumerate(categories):
-            color = colors[i % len(colors)]
-            total_spend = pivot_df[category].sum()
-            if total_spend > 0:
-                ax.plot(pivot_df.index, pivot_df[category], marker='.', markersize=4,
-                       linestyle='-', linewidth=1.2,
-                       label=f"{category} (${total_spend:.2f})", color=color)
-
-        ax.set_xlabel('Date', fontsize=10)
-        ax.set_ylabel('Spending ($)', fontsize=10)
-        ax.set_title('Daily Spending by Category', fontsize=12, fontweight='bold')
-
-        if date_range_days <= 10: locator, formatter = mdates.DayLocator(), mdates.DateFormatter('%a %d')
-        elif date_range_days <= 60: locator, formatter = mdates.DayLocator(interval=max(1, date_range_days // 7)), mdates.DateFormatter('%b %d')
-        elif date_range_days <= 730: locator, formatter = mdates.MonthLocator(), mdates.DateFormatter('%b %y')
-        else: locator, formatter = mdates.YearLocator(), mdates.DateFormatter('%Y')
-
-        ax.xaxis.set_major_locator(locator)
-        ax.xaxis.set_major_formatter(formatter)
-        fig.autofmt_xdate(rotation=30, ha='right')
-        ax.tick_params(axis='both', which='major', labelsize=9)
-
-        if len(categories) > 0:
-             ax.legend(loc='upper left', bbox_to_anchor=(1.01, 1), borderaxespad=0., fontsize=8.5)
-
-        ax.grid(True, alpha=0.3, linestyle=':')
-        ax.set_ylim(bottom=0)
-        fig.tight_layout(rect=[0, 0, 0.88, 1])
+        cache_key = chart_cache.make_key('category_line', start_date, end_date, transactions)
+        cached_png = chart_cache.get(cache_key)
+        if cached_png:
+            return chart_image_src(cache_key, cached_png)
 
-        buffer = io.BytesIO()
-        fig.savefig(buffer, format='png', dpi=96)
-        buffer.seek(0)
-        plt.close(fig)
-        base64_str = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        return f'data:image/png;base64,{base64_str}'
+        series_data = chart_renderer.category_line_series(transactions, start_date, end_date)
+        png_bytes = chart_render_pool.render(chart_renderer.render_category_line, series_data)
+        if png_bytes is None:
+            return create_message_image("Chart is busy, try again shortly.", width=7, height=4, dpi=96)
+        chart_cache.put(cache_key, png_bytes)
+        return chart_image_src(cache_key, png_bytes)
 
     except Exception as e:
-        if fig: 
-            plt.close(fig)
         return create_message_image("Error loading category spending chart", width=7, height=4, dpi=96)
 
+# Category line chart for a chart endpoint response, as chart data or an image
+def line_chart_payload(transactions, start_date, end_date):
+    if wants_chart_data():
+        if not transactions:
+            return {"chart_data": None, "chart_uri": create_message_image("No spending data in this period.", width=7, height=4, dpi=96)}
+        return {"chart_data": chart_renderer.category_line_series(transactions, start_date, end_date)}
+    return chart_payload(create_line_chart_for_categories(transactions, start_date, end_date))
+
 # Get data for line chart
 @app.route('/api/line-chart')
 def get_line_chart_data_api():
@@ -754,54 +1814,61 @@ def get_line_chart_data_api():
     end_date = request.args.get('end_date')
     if not start_date or not end_date: return jsonify({"error": "Missing start or end date"}), 400
     try:
-        chart_uri = create_line_chart_for_categories(user_id, start_date, end_date)
-        return jsonify({"chart_uri": chart_uri})
+        transactions = fetch_category_daily_spending(user_id, start_date, end_date)
+        return jsonify(line_chart_payload(transactions, start_date, end_date))
     except Exception as e:
         return jsonify({"error": f"Internal server error: {e}", "chart_uri": create_message_image("API Error", width=7, height=4, dpi=96)}), 500
 
+# Get total spending per category in a date range, largest first
+def fetch_category_totals(user_id, start_date, end_date):
+    with get_db_connection(read_only=True) as db:
+        cursor = db.cursor(dictionary=True)
+        cursor.execute(CATEGORY_TOTALS_QUERY, (user_id, start_date, end_date))
+        category_spending = cursor.fetchall()
+        cursor.close()
+    return category_spending
+
 # Create pie chart for spending by category
-def create_category_spending_pie_chart(user_id, start_date, end_date):
-    fig = None
+def create_category_spending_pie_chart(category_spending):
     try:
-        with get_db_connection() as db:
-            cursor = db.cursor(dictionary=True)
-            cursor.execute("SELECT Category_Name, SUM(Transaction_Amount) AS Total_Amount FROM transactions JOIN falls_under USING (Transaction_ID) JOIN categories USING (Category_ID) JOIN makes USING (Transaction_ID) WHERE User_ID = %s AND Transaction_Date BETWEEN %s AND %s GROUP BY Category_Name HAVING Total_Amount > 0 ORDER BY Total_Amount DESC", (user_id, start_date, end_date))
-            category_spending = cursor.fetchall()
-            cursor.close()
-
-        fig, ax = plt.subplots(figsize=(5, 5), dpi=90)
-        ax.set_title('Spending by Category', fontsize=14, pad=15, weight='bold')
-
         if not category_spending:
-            plt.close(fig)
             return create_message_image("No Spending Data\nfor Categories", width=5, height=5, dpi=90)
 
-        labels = [f"{item['Category_Name']} (${float(item['Total_Amount']):.2f})" for item in category_spending]
-        sizes = [float(item['Total_Amount']) for item in category_spending]
-        colors = plt.cm.viridis(np.linspace(0.1, 0.9, len(sizes)))
+        cache_key = chart_cache.make_key('category_pie', category_spending)
+        cached_png = chart_cache.get(cache_key)
+        if cached_png:
+            return chart_image_src(cache_key, cached_png)
 
-        wedges, texts = ax.pie(
-            sizes, labels=None, colors=colors, autopct=None, shadow=False, startangle=90,
-            wedgeprops=dict(width=0.4, edgecolor='w')
-        )
-
-        ax.legend(wedges, labels, loc='upper center', bbox_to_anchor=(0.5, -0.05),
-                  fontsize='12', frameon=False, ncol=1)
-        ax.axis('equal')
-        fig.tight_layout(rect=[0, 0.05, 1, 1])
-
-        buffer = io.BytesIO()
-        fig.savefig(buffer, format='png', transparent=True)
-        buffer.seek(0)
-        plt.close(fig)
-        base64_str = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        return f'data:image/png;base64,{base64_str}'
+        pie_data = [(item['Category_Name'], float(item['Total_Amount'])) for item in category_spending]
+        png_bytes = chart_render_pool.render(chart_renderer.render_category_pie, pie_data)
+        if png_bytes is None:
+            return create_message_image("Chart is busy,\ntry again shortly", width=5, height=5, dpi=90)
+        chart_cache.put(cache_key, png_bytes)
+        return chart_image_src(cache_key, png_bytes)
 
     except Exception as e:
-        if fig: 
-            plt.close(fig)
         return create_message_image("Error loading\ncategory pie chart", width=5, height=5, dpi=90)
 
+# Category totals from the daily category rows, in the same shape as CATEGORY_TOTALS_QUERY returns,
+# so the dashboard bundle can draw both category charts from one query
+def sum_category_spending(transactions):
+    totals = {}
+    for row in transactions:
+        totals[row['Category_Name']] = totals.get(row['Category_Name'], 0.0) + float(row['Daily_Amount'] or 0.0)
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+    return [{'Category_Name': name, 'Total_Amount': round(total, 2)} for name, total in ranked if total > 0]
+
+# Category pie chart for a chart endpoint response, as chart data or an image
+def category_pie_payload(category_spending):
+    if wants_chart_data():
+        if not category_spending:
+            return {"chart_data": None, "chart_uri": create_message_image("No Spending Data\nfor Categories", width=5, height=5, dpi=90)}
+        return {"chart_data": {
+            "categories": [item['Category_Name'] for item in category_spending],
+            "totals": [round(float(item['Total_Amount']), 2) for item in category_spending]
+        }}
+    return chart_payload(create_category_spending_pie_chart(category_spending))
+
 # Get data for spending by category pie chart
 @app.route('/api/category-pie-chart')
 def get_category_pie_chart_api():
@@ -811,75 +1878,287 @@ def get_category_pie_chart_api():
     end_date = request.args.get('end_date')
     if not start_date or not end_date: return jsonify({"error": "Missing start or end date"}), 400
     try:
-        chart_uri = create_category_spending_pie_chart(user_id, start_date, end_date)
-        return jsonify({"chart_uri": chart_uri})
+        category_spending = fetch_category_totals(user_id, start_date, end_date)
+        return jsonify(category_pie_payload(category_spending))
     except Exception as e:
         return jsonify({"error": f"Internal server error: {e}", "chart_uri": create_message_image("API Error", width=5, height=5, dpi=90)}), 500
 
-# Get data for prediction analysis
-def get_prediction_data(user_id, view_type, current_start_date_str):
-    num_historical_periods = 0
-    period_delta = None
-    period_name = ""
-    period_format_label = lambda d: d.strftime('%Y-%m-%d')
-
+# Chart images by cache key. The key is a hash of everything the chart was drawn from, so the image
+# behind a URL never changes and the browser can keep it for good. If the chart has since been
+# dropped from the cache this returns 404 and the dashboard asks the chart endpoint again.
+@app.route('/charts/<key>.png')
+def get_chart_png(key):
+    user_id = session.get('user_id')
+    if not user_id: return jsonify({"error": "Not authenticated"}), 401
+    # Someone else's chart gets the same 404 as a missing one
+    if key.split('-', 1)[0] != str(user_id): return jsonify({"error": "Chart not found"}), 404
+    if key in request.if_none_match:
+        response = Response(status=304)
+    else:
+        png_bytes = chart_cache.get(key)
+        if png_bytes is None: return jsonify({"error": "Chart not found"}), 404
+        response = Response(png_bytes, mimetype='image/png')
+    response.set_etag(key)
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+# Hit/miss counters for the chart cache, used to size CHART_CACHE_MAX_BYTES
+@app.route('/internal/chart-cache')
+def chart_cache_stats_api():
+    if not is_internal_request(): return jsonify({"error": "Forbidden"}), 403
+    return jsonify(chart_cache.stats())
+
+# Queue depth, timeouts and rejections for the chart render processes, used to size CHART_RENDER_WORKERS
+@app.route('/internal/chart-render')
+def chart_render_stats_api():
+    if not is_internal_request(): return jsonify({"error": "Forbidden"}), 403
+    return jsonify(chart_render_pool.stats())
+
+# Connection wait times, overflow use and per-route checkout times, used to size DB_POOL_SIZE. With a
+# replica configured it also shows where reads went.
+@app.route('/internal/db-pool')
+def db_pool_stats_api():
+    if not is_internal_request(): return jsonify({"error": "Forbidden"}), 403
+    stats = {"primary": connection_pool.stats()}
+    if replica_pool is not None:
+        stats["replica"] = replica_pool.stats()
+        with read_routing_lock:
+            stats["reads"] = dict(read_routing)
+    return jsonify(stats)
+
+# Slowest statements, per-route query counts and N+1 patterns from the query profiler
+@app.route('/internal/query-stats')
+def query_stats_api():
+    if not is_internal_request(): return jsonify({"error": "Forbidden"}), 403
+    return jsonify(query_profiler.stats())
+
+# Add daily totals into the periods starting at each date in period_starts (sorted oldest first)
+def bucket_daily_totals(daily_totals, period_starts):
+    period_amounts = [0.0] * len(period_starts)
+    for row in daily_totals:
+        index = bisect.bisect_right(period_starts, row['Day']) - 1
+        if index >= 0:
+            period_amounts[index] += float(row['total_spent'] or 0.0)
+    return period_amounts
+
+# Least squares trend line over evenly spaced periods. Gives the same slope and prediction as
+# LinearRegression without loading sklearn. weights makes some periods count more than others,
+# season_length takes out a repeating pattern before fitting, and confidence (e.g. 0.9) adds a
+# prediction interval for the next period using a normal approximation.
+def fit_trend(amounts, weights=None, season_length=None, confidence=None):
+    y = np.asarray(amounts, dtype=float)
+    n = len(y)
+    x = np.arange(n, dtype=float)
+    w = np.ones(n) if weights is None else np.asarray(weights, dtype=float)
+
+    seasonal = np.zeros(n)
+    next_seasonal = 0.0
+    if season_length and n >= 2 * season_length:
+        offsets = np.array([y[i::season_length].mean() for i in range(season_length)]) - y.mean()
+        seasonal = offsets[np.arange(n) % season_length]
+        next_seasonal = offsets[n % season_length]
+    adjusted = y - seasonal
+
+    w_sum = w.sum()
+    x_mean = (w * x).sum() / w_sum
+    y_mean = (w * adjusted).sum() / w_sum
+    sxx = (w * (x - x_mean) ** 2).sum()
+    slope = (w * (x - x_mean) * (adjusted - y_mean)).sum() / sxx if sxx else 0.0
+    intercept = y_mean - slope * x_mean
+    prediction = intercept + slope * n + next_seasonal
+
+    trend = {
+        'slope': float(slope),
+        'intercept': float(intercept),
+        'prediction': float(prediction),
+        'mean': float(y.mean()),
+        'std': float(y.std())
+    }
+
+    if confidence and n > 2 and sxx:
+        residuals = adjusted - (intercept + slope * x)
+        sigma = np.sqrt((w * residuals ** 2).sum() / (n - 2))
+        margin = NormalDist().inv_cdf(0.5 + confidence / 2) * sigma * np.sqrt(1 + 1 / w_sum + (n - x_mean) ** 2 / sxx)
+        trend['lower'] = float(prediction - margin)
+        trend['upper'] = float(prediction + margin)
+
+    return trend
+
+# Run a statement in fresh Python processes started in the project directory, so modules imported by
+# this process don't hide the cost. Returns the median seconds over runs.
+def time_in_fresh_interpreter(statement, runs):
+    code = f"import time\nstarted = time.perf_counter()\n{statement}\nprint(time.perf_counter() - started)"
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return median(timings)
+
+# Compare fit_trend with the pandas + LinearRegression code it replaced: import cost in a fresh process
+# and time per call on a year of monthly totals. scikit-learn and pandas are no longer dependencies, so
+# the comparison half only runs where they are installed.
+@app.cli.command('bench-trend')
+@click.option('--runs', type=int, default=5, help='Fresh processes per import timing.')
+@click.option('--calls', type=int, default=2000, help='Calls per fitting timing.')
+def bench_trend_command(runs, calls):
+    amounts = [820.0, 760.5, 905.25, 870.0, 940.1, 1010.0, 980.75, 1045.3, 1100.0, 1072.4, 1150.9, 1198.2]
+    try:
+        import pandas as pd
+        from sklearn.linear_model import LinearRegression
+    except ImportError:
+        LinearRegression = None
+
+    click.echo(f"import numpy                  {time_in_fresh_interpreter('import numpy', runs) * 1000:9.1f} ms")
+    if LinearRegression:
+        click.echo(f"import sklearn.linear_model   {time_in_fresh_interpreter('import pandas, sklearn.linear_model', runs) * 1000:9.1f} ms (with pandas)")
+
+    fit_trend(amounts)
+    click.echo(f"fit_trend                     {timeit.timeit(lambda: fit_trend(amounts), number=calls) / calls * 1e6:9.1f} us/call")
+    if not LinearRegression:
+        click.echo("Install scikit-learn and pandas to compare against LinearRegression.")
+        return
+
+    def linear_regression_trend():
+        df = pd.DataFrame({'period_index': range(len(amounts)), 'amount': amounts})
+        model = LinearRegression()
+        model.fit(df[['period_index']], df['amount'])
+        return model.coef_[0], model.predict(pd.DataFrame({'period_index': [len(amounts)]}))[0]
+
+    slope, prediction = linear_regression_trend()
+    click.echo(f"DataFrame + LinearRegression  {timeit.timeit(linear_regression_trend, number=calls) / calls * 1e6:9.1f} us/call")
+    trend = fit_trend(amounts)
+    click.echo(f"Difference from LinearRegression: slope {abs(trend['slope'] - slope):.2e}, prediction {abs(trend['prediction'] - prediction):.2e}")
+
+# Libraries app.py used to import at startup and now loads on first use
+LAZY_LIBRARIES = ['numpy', 'pandas', 'matplotlib.pyplot', 'sklearn.linear_model', 'google.generativeai']
+
+# Cold start of a worker: importing app in a fresh process, next to importing it together with the
+# heavy libraries it used to load eagerly. The database pool is created on first use, so no database
+# is needed.
+@app.cli.command('bench-startup')
+@click.option('--runs', type=int, default=5, help='Fresh processes per timing.')
+def bench_startup_command(runs):
+    installed = [name for name in LAZY_LIBRARIES if find_spec(name.split('.')[0]) is not None]
+    lazy_seconds = time_in_fresh_interpreter('import app', runs)
+    eager_seconds = time_in_fresh_interpreter('import app, ' + ', '.join(installed), runs)
+    click.echo(f"import app                         {lazy_seconds * 1000:9.1f} ms")
+    click.echo(f"import app + {', '.join(installed)}")
+    click.echo(f"  (what startup used to load)      {eager_seconds * 1000:9.1f} ms")
+
+    check = "import sys, app\nprint('loaded:' + ','.join(name for name in %r if name in sys.modules))" % (installed,)
+    result = subprocess.run([sys.executable, '-c', check], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    loaded = [line[len('loaded:'):] for line in result.stdout.splitlines() if line.startswith('loaded:')]
+    click.echo(f"Heavy libraries loaded by import app: {loaded[-1] or 'none'}")
+
+# Work out which past periods a prediction looks at. Returns (period_starts, period_labels, period_name),
+# or None for an unknown view type.
+def get_prediction_periods(view_type, current_start_date_str, num_periods=None):
     current_start_date = datetime.datetime.strptime(current_start_date_str, '%Y-%m-%d').date()
 
     if view_type == 'week': num_historical_periods, period_delta, period_name, period_format_label = 8, relativedelta(weeks=1), "Week", lambda d: f"W {d.strftime('%U')}"
     elif view_type == 'month': num_historical_periods, period_delta, period_name, period_format_label = 12, relativedelta(months=1), "Month", lambda d: d.strftime('%b %y')
     elif view_type == 'year': num_historical_periods, period_delta, period_name, period_format_label = 5, relativedelta(years=1), "Year", lambda d: d.strftime('%Y')
-    else: return None, "Invalid view type for prediction."
+    else: return None
 
-    historical_data = []
+    if num_periods:
+        num_historical_periods = num_periods
+
+    period_starts = [current_start_date - (period_delta * i) for i in range(num_historical_periods, 0, -1)]
+    period_labels = [period_format_label(d) for d in period_starts]
+    return period_starts, period_labels, period_name
+
+# Fit the trend over the periods' daily totals and write up the analysis
+def analyze_prediction(period_starts, period_labels, period_name, daily_totals):
     analysis_text = f"**Prediction Analysis ({period_name}ly Trend)**\n\n"
+
+    period_amounts = bucket_daily_totals(daily_totals, period_starts)
+    historical_data = [{'period_label': label, 'amount': amount} for label, amount in zip(period_labels, period_amounts)]
+
+    if len(period_amounts) < 3: return None, f"Not enough historical data (need at least 3 {period_name.lower()}s)."
+
+    trend_fit = fit_trend(period_amounts)
+    prediction = max(0, trend_fit['prediction'])
+    prediction_data = {'period_label': f"Next {period_name}", 'amount': prediction}
+
+    avg_historical = trend_fit['mean']
+    std_dev_historical = trend_fit['std']
+    last_period_amount = period_amounts[-1]
+    trend = trend_fit['slope']
+    pred_diff = prediction - last_period_amount
+    pred_diff_perc = (pred_diff / (last_period_amount + 0.01)) * 100 if last_period_amount else (100 if prediction > 0 else 0)
+
+    analysis_text += f"*   **Historical Average:** ${avg_historical:.2f} per {period_name.lower()} (Std Dev: ${std_dev_historical:.2f}).\n"
+    analysis_text += f"*   **Last Period's Spending:** ${last_period_amount:.2f}.\n"
+    analysis_text += f"*   **Linear Trend:** Spending changed by approx. **${trend:+.2f}** per {period_name.lower()}. "
+    analysis_text += f"{'Suggests increase.' if trend > 0.01 else ('Suggests decrease.' if trend < -0.01 else 'Relatively stable.')}\n"
+    analysis_text += f"*   **Prediction for Next {period_name}:** **${prediction:.2f}**. Change of ${pred_diff:+.2f} ({pred_diff_perc:+.1f}%).\n\n"
+
+    return {'historical': historical_data, 'prediction': prediction_data}, analysis_text
+
+# Get data for prediction analysis
+def get_prediction_data(user_id, view_type, current_start_date_str, num_periods=None):
+    periods = get_prediction_periods(view_type, current_start_date_str, num_periods)
+    if periods is None: return None, "Invalid view type for prediction."
+
     try:
-        with get_db_connection() as db:
+        period_starts = periods[0]
+        # One grouped query over the daily rollup covers every period, so more periods don't add round-trips
+        with get_db_connection(read_only=True) as db:
             cursor = db.cursor(dictionary=True)
-            period_labels = []
-            period_amounts = []
-            for i in range(num_historical_periods, 0, -1):
-                hist_end_date = current_start_date - (period_delta * (i-1)) - relativedelta(days=1)
-                hist_start_date = current_start_date - (period_delta * i)
-                period_label = period_format_label(hist_start_date)
-                period_labels.append(period_label)
-                cursor.execute("SELECT SUM(Transaction_Amount) as total_spent FROM transactions JOIN makes USING (Transaction_ID) WHERE User_ID = %s AND Transaction_Date BETWEEN %s AND %s ", (user_id, hist_start_date.strftime('%Y-%m-%d'), hist_end_date.strftime('%Y-%m-%d')))
-                result = cursor.fetchone()
-                amount = float(result['total_spent'] or 0.0)
-                historical_data.append({'period_label': period_label, 'amount': amount})
-                period_amounts.append(amount)
+            cursor.execute(PERIOD_DAILY_TOTALS_QUERY, (user_id, period_starts[0].strftime('%Y-%m-%d'), current_start_date_str))
+            daily_totals = cursor.fetchall()
             cursor.close()
 
-        if len(period_amounts) < 3: return None, f"Not enough historical data (need at least 3 {period_name.lower()}s)."
+        return analyze_prediction(*periods, daily_totals)
 
-        df = pd.DataFrame({'period_index': range(num_historical_periods), 'amount': period_amounts})
-        X = df[['period_index']]
-        y = df['amount']
-        model = LinearRegression()
-        model.fit(X, y)
-        prediction = max(0, model.predict(np.array([[num_historical_periods]]))[0])
-        prediction_data = {'period_label': f"Next {period_name}", 'amount': prediction}
-
-        avg_historical = np.mean(period_amounts)
-        std_dev_historical = np.std(period_amounts) if len(period_amounts) > 1 else 0
-        last_period_amount = period_amounts[-1]
-        trend = model.coef_[0]
-        pred_diff = prediction - last_period_amount
-        pred_diff_perc = (pred_diff / (last_period_amount + 0.01)) * 100 if last_period_amount else (100 if prediction > 0 else 0)
+    except Exception as e:
+        return None, "Could not generate prediction data due to an error."
 
-        analysis_text += f"*   **Historical Average:** ${avg_historical:.2f} per {period_name.lower()} (Std Dev: ${std_dev_historical:.2f}).\n"
-        analysis_text += f"*   **Last Period's Spending:** ${last_period_amount:.2f}.\n"
-        analysis_text += f"*   **Linear Trend:** Spending changed by approx. **${trend:+.2f}** per {period_name.lower()}. "
-        analysis_text += f"{'Suggests increase.' if trend > 0.01 else ('Suggests decrease.' if trend < -0.01 else 'Relatively stable.')}\n"
-        analysis_text += f"*   **Prediction for Next {period_name}:** **${prediction:.2f}**. Change of ${pred_diff:+.2f} ({pred_diff_perc:+.1f}%).\n\n"
+# Short lived per-user memo of prediction results. The dashboard asks for the prediction chart and
+# the analysis text at the same time, so the second request waits on the first instead of repeating it.
+PREDICTION_MEMO_TTL = float(os.getenv("PREDICTION_MEMO_TTL", 30))
+prediction_memo = {}
+prediction_memo_lock = threading.Lock()
+
+def get_prediction_data_cached(user_id, view_type, current_start_date_str):
+    key = (user_id, view_type, current_start_date_str)
+    now = time.monotonic()
+    with prediction_memo_lock:
+        entry = prediction_memo.get(key)
+        if entry and entry[0] > now:
+            future = entry[1]
+            owner = False
+        else:
+            for stale_key in [k for k, (expires, _) in prediction_memo.items() if expires <= now]:
+                del prediction_memo[stale_key]
+            future = Future()
+            prediction_memo[key] = (now + PREDICTION_MEMO_TTL, future)
+            owner = True
 
-        return {'historical': historical_data, 'prediction': prediction_data}, analysis_text
+    if not owner:
+        return future.result()
 
+    try:
+        result = get_prediction_data(user_id, view_type, current_start_date_str)
     except Exception as e:
-        return None, "Could not generate prediction data due to an error."
+        result = (None, "Could not generate prediction data due to an error.")
+    future.set_result(result)
+    # Errors aren't kept so the next request tries again
+    if result[0] is None:
+        with prediction_memo_lock:
+            if key in prediction_memo and prediction_memo[key][1] is future:
+                del prediction_memo[key]
+    return result
+
+# Drop cached results that depend on a user's transactions. Called after every transaction write.
+def invalidate_user_caches(user_id):
+    with prediction_memo_lock:
+        for key in [k for k in prediction_memo if k[0] == user_id]:
+            del prediction_memo[key]
+    invalidate_metadata(user_id, 'accounts', 'chat_summary')
 
 # Create line chart with prediction 
 def create_prediction_line_chart(prediction_result):
-    fig = None
     if not prediction_result or 'historical' not in prediction_result or 'prediction' not in prediction_result:
         return create_message_image("Not enough data\nfor prediction chart.", width=7, height=4, dpi=96)
 
@@ -888,47 +2167,28 @@ def create_prediction_line_chart(prediction_result):
     if not historical: return create_message_image("No historical data\nfor prediction.", width=7, height=4, dpi=96)
 
     try:
-        fig, ax = plt.subplots(figsize=(7, 4), dpi=96)
-
-        hist_labels = [h['period_label'] for h in historical]
-        hist_amounts = [h['amount'] for h in historical]
-        hist_indices = range(len(historical))
-
-        ax.plot(hist_indices, hist_amounts, marker='o', markersize=5, linestyle='-', color='royalblue', label='Historical Spending')
-
-        pred_index = len(historical)
-        pred_amount = prediction['amount']
-        pred_label = prediction['period_label']
-
-        ax.plot(pred_index, pred_amount, marker='*', markersize=12, color='orangered', linestyle='none', label=f'Predicted: ${pred_amount:.2f}')
-        ax.plot([hist_indices[-1], pred_index], [hist_amounts[-1], pred_amount], linestyle=':', color='grey', alpha=0.7)
-
-        all_labels = hist_labels + [pred_label]
-        all_indices = list(hist_indices) + [pred_index]
+        cache_key = chart_cache.make_key('prediction_line', historical, prediction)
+        cached_png = chart_cache.get(cache_key)
+        if cached_png:
+            return chart_image_src(cache_key, cached_png)
 
-        ax.set_xticks(all_indices)
-        ax.set_xticklabels(all_labels, rotation=30, ha='right', fontsize=9)
-
-        ax.set_ylabel('Spending ($)', fontsize=10)
-        ax.set_title('Spending Trend and Prediction', fontsize=12, fontweight='bold')
-        ax.legend(fontsize=9)
-        ax.grid(True, alpha=0.3, linestyle=':')
-        ax.set_ylim(bottom=0)
-        ax.tick_params(axis='y', labelsize=10)
-
-        fig.tight_layout()
-
-        buffer = io.BytesIO()
-        fig.savefig(buffer, format='png', dpi=96)
-        buffer.seek(0)
-        plt.close(fig)
-        base64_str = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        return f'data:image/png;base64,{base64_str}'
+        png_bytes = chart_render_pool.render(chart_renderer.render_prediction_line, historical, prediction)
+        if png_bytes is None:
+            return create_message_image("Chart is busy,\ntry again shortly.", width=7, height=4, dpi=96)
+        chart_cache.put(cache_key, png_bytes)
+        return chart_image_src(cache_key, png_bytes)
 
     except Exception as e:
-        if fig: plt.close(fig)
         return create_message_image("Error generating\nprediction chart.", width=7, height=4, dpi=96)
 
+# Chart data for the prediction chart, or the placeholder image when there isn't enough history
+def prediction_chart_payload(prediction_data):
+    if wants_chart_data() and prediction_data and prediction_data.get('historical'):
+        return {"chart_data": prediction_data}
+    if wants_chart_data():
+        return {"chart_data": None, "chart_uri": create_prediction_line_chart(prediction_data)}
+    return chart_payload(create_prediction_line_chart(prediction_data))
+
 # Get data for prediction line chart
 @app.route('/api/prediction-chart')
 def get_prediction_chart_api():
@@ -938,9 +2198,8 @@ def get_prediction_chart_api():
     start_date_str = request.args.get('start_date')
     if not view_type or not start_date_str: return jsonify({"error": "Missing view type or start date"}), 400
     try:
-        prediction_data, _ = get_prediction_data(user_id, view_type, start_date_str)
-        chart_uri = create_prediction_line_chart(prediction_data)
-        return jsonify({"chart_uri": chart_uri})
+        prediction_data, _ = get_prediction_data_cached(user_id, view_type, start_date_str)
+        return jsonify(prediction_chart_payload(prediction_data))
     except Exception as e:
         return jsonify({"error": f"Internal server error: {e}", "chart_uri": create_message_image("API Error", width=7, height=4, dpi=96)}), 500
 
@@ -953,51 +2212,108 @@ def get_spending_prediction_api():
     start_date_str = request.args.get('start_date')
     if not view_type or not start_date_str: return jsonify({"error": "Missing view type or start date"}), 400
     try:
-        _, analysis_text = get_prediction_data(user_id, view_type, start_date_str)
+        _, analysis_text = get_prediction_data_cached(user_id, view_type, start_date_str)
         return jsonify({"analysis_text": analysis_text})
     except Exception as e:
         return jsonify({"analysis_text": f"Error loading analysis: {e}"}), 500
 
-# Get data for AI chatbot
-def get_data_for_chatbot(user_id, start_date, end_date, limit=5):
-    context_data = {}
+# Get prediction chart and analysis together so the dashboard only needs one request
+@app.route('/api/prediction')
+def get_prediction_api():
+    user_id = session.get('user_id')
+    if not user_id: return jsonify({"error": "Not authenticated"}), 401
+    view_type = request.args.get('view')
+    start_date_str = request.args.get('start_date')
+    if not view_type or not start_date_str: return jsonify({"error": "Missing view type or start date"}), 400
     try:
-        with get_db_connection() as db:
+        prediction_data, analysis_text = get_prediction_data_cached(user_id, view_type, start_date_str)
+        payload = prediction_chart_payload(prediction_data)
+        payload["analysis_text"] = analysis_text
+        return jsonify(payload)
+    except Exception as e:
+        return jsonify({"error": f"Internal server error: {e}", "chart_uri": create_message_image("API Error", width=7, height=4, dpi=96), "analysis_text": f"Error loading analysis: {e}"}), 500
+
+# Everything the dashboard's charts need in one request. Three queries on one connection cover all
+# of it: the budget goal, the period's daily spending per category (for both category charts), and
+# daily totals from the first prediction period to the end of the view (for the prediction and the
+# budget pie). Takes the same format and delivery options as the single chart endpoints.
+@app.route('/api/dashboard-bundle')
+def get_dashboard_bundle_api():
+    user_id = session.get('user_id')
+    if not user_id: return jsonify({"error": "Not authenticated"}), 401
+    view = request.args.get('view', 'month')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    if not start_date or not end_date: return jsonify({"error": "Missing start or end date"}), 400
+
+    try:
+        periods = get_prediction_periods(view, start_date)
+        history_start = periods[0][0].strftime('%Y-%m-%d') if periods else start_date
+        history_end = (datetime.datetime.strptime(end_date, '%Y-%m-%d').date() + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+
+        with get_db_connection(read_only=True) as db:
             cursor = db.cursor(dictionary=True)
-            cursor.execute("SELECT SUM(Transaction_Amount) as total_spent, COUNT(*) as transaction_count FROM transactions JOIN makes USING (Transaction_ID) WHERE User_ID = %s AND Transaction_Date BETWEEN %s AND %s", (user_id, start_date, end_date))
-            summary = cursor.fetchone()
-            context_data['total_spent'] = float(summary['total_spent'] or 0.0)
-            context_data['transaction_count'] = int(summary['transaction_count'] or 0)
-            cursor.execute("SELECT Goal_Target FROM goals WHERE Monthly_Budget = 1 AND Goal_ID IN (SELECT Goal_ID FROM sets WHERE User_ID = %s)", (user_id,))
+            cursor.execute(BUDGET_GOAL_QUERY, (user_id,))
             budget_result = cursor.fetchone()
-            context_data['monthly_budget_goal'] = float(budget_result['Goal_Target'] or 0.0)
-            cursor.execute("SELECT c.Category_Name, SUM(t.Transaction_Amount) AS Amount, COUNT(*) as Count FROM transactions t JOIN falls_under fu ON t.Transaction_ID = fu.Transaction_ID JOIN categories c ON fu.Category_ID = c.Category_ID JOIN makes m ON t.Transaction_ID = m.Transaction_ID WHERE m.User_ID = %s AND t.Transaction_Date BETWEEN %s AND %s GROUP BY c.Category_Name HAVING Amount > 0 ORDER BY Amount DESC ", (user_id, start_date, end_date))
-            categories = cursor.fetchall()
-            context_data['category_spending'] = { c['Category_Name']: {'total': float(c['Amount']), 'count': int(c['Count'])} for c in categories }
-            cursor.execute("SELECT t.Transaction_Date, t.Transaction_Description, t.Transaction_Amount, c.Category_Name FROM transactions t JOIN falls_under fu ON t.Transaction_ID = fu.Transaction_ID JOIN categories c ON fu.Category_ID = c.Category_ID JOIN makes m ON t.Transaction_ID = m.Transaction_ID WHERE m.User_ID = %s AND t.Transaction_Date BETWEEN %s AND %s ORDER BY t.Transaction_Amount DESC LIMIT %s ", (user_id, start_date, end_date, limit))
-            top_transactions = cursor.fetchall()
-            context_data['top_transactions'] = [ {'date': t['Transaction_Date'].strftime('%Y-%m-%d'), 'desc': t['Transaction_Description'], 'amount': float(t['Transaction_Amount']), 'category': t['Category_Name']} for t in top_transactions ]
+            cursor.execute(CATEGORY_DAILY_SPEND_QUERY, (user_id, start_date, end_date))
+            transactions = cursor.fetchall()
+            cursor.execute(PERIOD_DAILY_TOTALS_QUERY, (user_id, history_start, history_end))
+            daily_totals = cursor.fetchall()
             cursor.close()
-        return context_data
-    except Exception as e:
-        return {"error": "Could not retrieve detailed data for analysis."}
 
+        view_start = datetime.datetime.strptime(start_date, '%Y-%m-%d').date()
+        total_spent = sum(float(row['total_spent'] or 0.0) for row in daily_totals if row['Day'] >= view_start)
+        budget_goal = scale_budget_goal(float(budget_result['Goal_Target'] or 0.0) if budget_result else 0.0, view)
 
-@app.route('/api/chatbot', methods=['POST'])
-def chatbot_api():
-    user_id = session.get('user_id')
-    if not user_id or not gemini_model: return jsonify({"error": "Chatbot unavailable or user not authenticated"}), 403
+        if periods:
+            prediction_data, analysis_text = analyze_prediction(*periods, [row for row in daily_totals if row['Day'] < view_start])
+        else:
+            prediction_data, analysis_text = None, "Invalid view type for prediction."
+
+        return jsonify({
+            "budget_pie": budget_pie_payload(total_spent, budget_goal),
+            "line_chart": line_chart_payload(transactions, start_date, end_date),
+            "category_pie": category_pie_payload(sum_category_spending(transactions)),
+            "prediction_chart": prediction_chart_payload(prediction_data),
+            "analysis_text": analysis_text,
+            "total_spent": round(total_spent, 2),
+            "budget_goal": round(budget_goal, 2)
+        })
+    except Exception as e:
+        return jsonify({"error": f"Internal server error: {e}"}), 500
 
-    data = request.json
-    user_prompt = data.get('prompt')
-    start_date = data.get('start_date')
-    end_date = data.get('end_date')
-    view_type = data.get('view_type')
-    if not user_prompt or not start_date or not end_date or not view_type: return jsonify({"error": "Missing required data"}), 400
+# Get data for AI chatbot
+def fetch_chatbot_summary(user_id, start_date, end_date, limit=5):
+    context_data = {}
+    with get_db_connection(read_only=True) as db:
+        cursor = db.cursor(dictionary=True)
+        cursor.execute(SPENDING_SUMMARY_QUERY, (user_id, start_date, end_date))
+        summary = cursor.fetchone()
+        context_data['total_spent'] = float(summary['total_spent'] or 0.0)
+        context_data['transaction_count'] = int(summary['transaction_count'] or 0)
+        cursor.execute(BUDGET_GOAL_QUERY, (user_id,))
+        budget_result = cursor.fetchone()
+        context_data['monthly_budget_goal'] = float(budget_result['Goal_Target'] or 0.0)
+        cursor.execute(CATEGORY_TOTALS_QUERY, (user_id, start_date, end_date))
+        categories = cursor.fetchall()
+        context_data['category_spending'] = { c['Category_Name']: {'total': float(c['Total_Amount']), 'count': int(c['Count'])} for c in categories }
+        cursor.execute(TOP_TRANSACTIONS_QUERY, (user_id, start_date, end_date, limit))
+        top_transactions = cursor.fetchall()
+        context_data['top_transactions'] = [ {'date': t['Transaction_Date'].strftime('%Y-%m-%d'), 'desc': t['Transaction_Description'], 'amount': float(t['Transaction_Amount']), 'category': t['Category_Name']} for t in top_transactions ]
+        cursor.close()
+    return context_data
+
+# Period summary for the chatbot, cached per user and period until their transactions change.
+# Errors aren't cached.
+def get_data_for_chatbot(user_id, start_date, end_date, limit=5):
+    try:
+        return get_cached_metadata(user_id, ('chat_summary', start_date, end_date, limit), lambda _: fetch_chatbot_summary(user_id, start_date, end_date, limit), CHAT_SUMMARY_CACHE_TTL)
+    except Exception as e:
+        return {"error": "Could not retrieve detailed data for analysis."}
 
-    period_data = get_data_for_chatbot(user_id, start_date, end_date)
-    if "error" in period_data: return jsonify({"response": period_data["error"]})
 
+# Build the prompt sent to the model from the user's question and the period summary
+def build_chatbot_prompt(user_prompt, start_date, end_date, view_type, period_data):
     period_budget = period_data['monthly_budget_goal']
     period_name = f"{start_date} to {end_date}"
     if view_type == 'year':
@@ -1010,7 +2326,7 @@ def chatbot_api():
     elif view_type == 'month':
         period_name = f"the month starting {start_date}"
 
-    system_instruction = f""" You are a friendly financial analysis assistant. Analyze the user's spending for {period_name}. Be concise and focus ONLY on the provided data summary. Do not make up info. Also answer any additional questions the user asks related to money to the best of your ability. Give good examples and tips.
+    return f""" You are a friendly financial analysis assistant. Analyze the user's spending for {period_name}. Be concise and focus ONLY on the provided data summary. Do not make up info. Also answer any additional questions the user asks related to money to the best of your ability. Give good examples and tips.
 
     Data Summary:
     Total Spent: ${period_data['total_spent']:.2f} ({period_data['transaction_count']} transactions)
@@ -1022,16 +2338,205 @@ def chatbot_api():
 
     Answer based ONLY on the summary. If details aren't present (e.g., specific transaction not in top 5), state that but offer analysis based on available data. """
 
+def response_text(response):
+    return "".join(part.text for part in response.parts) if response.parts else ""
+
+# Answers are reused when the same question is asked about the same numbers. The key is the normalized
+# question, the period and a hash of the summary, so any change to the data gives a new key and old
+# answers just age out after CHATBOT_RESPONSE_TTL seconds.
+CHATBOT_RESPONSE_TTL = float(os.getenv("CHATBOT_RESPONSE_TTL", 600))
+CHATBOT_RESPONSE_CACHE_SIZE = 1000
+chatbot_responses = OrderedDict()
+chatbot_responses_lock = threading.Lock()
+
+def chatbot_response_key(user_prompt, start_date, end_date, view_type, period_data):
+    normalized_prompt = " ".join(user_prompt.lower().split()).rstrip('?!. ')
+    summary_hash = hashlib.sha256(json.dumps(period_data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return (normalized_prompt, start_date, end_date, view_type, summary_hash)
+
+def get_cached_chatbot_response(key):
+    with chatbot_responses_lock:
+        entry = chatbot_responses.get(key)
+        if not entry:
+            return None
+        if entry[0] <= time.monotonic():
+            del chatbot_responses[key]
+            return None
+        chatbot_responses.move_to_end(key)
+        return entry[1]
+
+def cache_chatbot_response(key, text):
+    with chatbot_responses_lock:
+        chatbot_responses[key] = (time.monotonic() + CHATBOT_RESPONSE_TTL, text)
+        chatbot_responses.move_to_end(key)
+        while len(chatbot_responses) > CHATBOT_RESPONSE_CACHE_SIZE:
+            chatbot_responses.popitem(last=False)
+
+# Model calls run on these threads instead of the request thread, at most CHATBOT_WORKERS at a time,
+# and each user can have CHATBOT_USER_LIMIT questions in progress. The executor's own queue has no
+# limit, so chatbot_admission caps running plus waiting questions at CHATBOT_WORKERS + CHATBOT_QUEUE_LIMIT
+# and anything past that gets a 503 straight away.
+CHATBOT_WORKERS = int(os.getenv("CHATBOT_WORKERS", 4))
+CHATBOT_QUEUE_LIMIT = int(os.getenv("CHATBOT_QUEUE_LIMIT", 8))
+CHATBOT_USER_LIMIT = int(os.getenv("CHATBOT_USER_LIMIT", 1))
+CHATBOT_TIMEOUT = float(os.getenv("CHATBOT_TIMEOUT", 60))
+chatbot_executor = ThreadPoolExecutor(max_workers=CHATBOT_WORKERS, thread_name_prefix='chatbot')
+chatbot_admission = threading.BoundedSemaphore(CHATBOT_WORKERS + CHATBOT_QUEUE_LIMIT)
+chatbot_active = {}
+chatbot_active_lock = threading.Lock()
+
+def acquire_chat_slot(user_id):
+    with chatbot_active_lock:
+        if chatbot_active.get(user_id, 0) >= CHATBOT_USER_LIMIT:
+            return False
+        chatbot_active[user_id] = chatbot_active.get(user_id, 0) + 1
+        return True
+
+def release_chat_slot(user_id):
+    with chatbot_active_lock:
+        chatbot_active[user_id] -= 1
+        if chatbot_active[user_id] <= 0:
+            del chatbot_active[user_id]
+
+# Read the chatbot request body. Returns (fields, error response).
+def parse_chatbot_request():
+    data = request.json or {}
+    fields = (data.get('prompt'), data.get('start_date'), data.get('end_date'), data.get('view_type'))
+    if not all(fields): return None, (jsonify({"error": "Missing required data"}), 400)
+    return fields, None
+
+@app.route('/api/chatbot', methods=['POST'])
+def chatbot_api():
+    user_id = session.get('user_id')
+    model = get_chat_model() if user_id else None
+    if not user_id or not model: return jsonify({"error": "Chatbot unavailable or user not authenticated"}), 403
+
+    fields, error_response = parse_chatbot_request()
+    if error_response: return error_response
+    user_prompt, start_date, end_date, view_type = fields
+
+    period_data = get_data_for_chatbot(user_id, start_date, end_date)
+    if "error" in period_data: return jsonify({"response": period_data["error"]})
+
+    response_key = chatbot_response_key(user_prompt, start_date, end_date, view_type, period_data)
+    cached_response = get_cached_chatbot_response(response_key)
+    if cached_response: return jsonify({"response": cached_response})
+
+    system_instruction = build_chatbot_prompt(user_prompt, start_date, end_date, view_type, period_data)
+
+    if not acquire_chat_slot(user_id): return jsonify({"error": "Please wait for your previous question to finish"}), 429
     try:
-        response = gemini_model.generate_content(system_instruction)
+        response = model.generate_content(system_instruction)
         bot_response = ""
-        if response.parts: bot_response = "".join(part.text for part in response.parts).strip()
+        if response.parts:
+            bot_response = response_text(response).strip()
+            cache_chatbot_response(response_key, bot_response)
         elif response.prompt_feedback and response.prompt_feedback.block_reason: bot_response = f"Blocked: {response.prompt_feedback.block_reason}"
         else: bot_response = "Sorry, empty response."
         return jsonify({"response": bot_response})
     except Exception as e:
         error_detail = str(e)
         return jsonify({"response": f"Sorry, error generating analysis."}), 500
+    finally:
+        release_chat_slot(user_id)
+
+# Runs on a chatbot thread. Puts ('chunk', text) on the queue for each piece of the answer, then
+# ('done', None) or ('error', message). Stops early once stop is set (the browser went away or gave up
+# waiting). The user's slot and the admission slot are freed once the model is finished.
+def run_chat_model(model, prompt, user_id, chunks, response_key, stop):
+    try:
+        response = model.generate_content(prompt, stream=True)
+        sent_text = []
+        for chunk in response:
+            if stop.is_set():
+                return
+            text = response_text(chunk)
+            if text:
+                sent_text.append(text)
+                chunks.put(('chunk', text))
+        if sent_text:
+            cache_chatbot_response(response_key, "".join(sent_text).strip())
+        else:
+            prompt_feedback = getattr(response, 'prompt_feedback', None)
+            if prompt_feedback and prompt_feedback.block_reason:
+                chunks.put(('chunk', f"Blocked: {prompt_feedback.block_reason}"))
+            else:
+                chunks.put(('chunk', "Sorry, empty response."))
+        chunks.put(('done', None))
+    except Exception as e:
+        chunks.put(('error', "Sorry, error generating analysis."))
+    finally:
+        release_chat_slot(user_id)
+        chatbot_admission.release()
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Same as /api/chatbot but the answer is streamed back as server-sent events while the model writes
+# it: "chunk" events with {"text": ...}, then "done", or "error" with {"error": ...}
+@app.route('/api/chatbot/stream', methods=['POST'])
+def chatbot_stream_api():
+    user_id = session.get('user_id')
+    model = get_chat_model() if user_id else None
+    if not user_id or not model: return jsonify({"error": "Chatbot unavailable or user not authenticated"}), 403
+
+    fields, error_response = parse_chatbot_request()
+    if error_response: return error_response
+    user_prompt, start_date, end_date, view_type = fields
+
+    period_data = get_data_for_chatbot(user_id, start_date, end_date)
+    if "error" in period_data: return jsonify({"error": period_data["error"]}), 500
+
+    response_key = chatbot_response_key(user_prompt, start_date, end_date, view_type, period_data)
+    cached_response = get_cached_chatbot_response(response_key)
+    if cached_response:
+        cached_events = sse_event('chunk', {"text": cached_response}) + sse_event('done', {})
+        return Response(cached_events, mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+    system_instruction = build_chatbot_prompt(user_prompt, start_date, end_date, view_type, period_data)
+
+    if not acquire_chat_slot(user_id): return jsonify({"error": "Please wait for your previous question to finish"}), 429
+    if not chatbot_admission.acquire(blocking=False):
+        release_chat_slot(user_id)
+        return jsonify({"error": "Chatbot is busy, please try again"}), 503
+    chunks = queue.Queue()
+    stop = threading.Event()
+    try:
+        future = chatbot_executor.submit(run_chat_model, model, system_instruction, user_id, chunks, response_key, stop)
+    except Exception as e:
+        release_chat_slot(user_id)
+        chatbot_admission.release()
+        return jsonify({"error": "Chatbot is busy, please try again"}), 503
+
+    # Runs when the response is closed, whether the answer finished or the browser disconnected. A
+    # question still waiting for a thread is cancelled and gives its slots back here, since
+    # run_chat_model will never run to free them. One that is running stops at its next chunk.
+    def close_stream():
+        stop.set()
+        if future.cancel():
+            release_chat_slot(user_id)
+            chatbot_admission.release()
+
+    def generate():
+        deadline = time.monotonic() + CHATBOT_TIMEOUT
+        while True:
+            try:
+                kind, text = chunks.get(timeout=max(0.1, deadline - time.monotonic()))
+            except queue.Empty:
+                yield sse_event('error', {"error": "Sorry, the analysis took too long."})
+                return
+            if kind == 'chunk':
+                yield sse_event('chunk', {"text": text})
+            elif kind == 'done':
+                yield sse_event('done', {})
+                return
+            else:
+                yield sse_event('error', {"error": text})
+                return
+
+    response = Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(close_stream)
+    return response
 
 # Update an existing transaction
 @app.route('/api/transactions/update', methods=['POST'])
@@ -1054,7 +2559,9 @@ def update_transaction_api():
     
     # Find matching transaction and update data accordingly
     try:
+        amount = to_cents(amount)
         with get_db_connection() as db:
+            db.start_transaction()
             cursor = db.cursor()
             
             cursor.execute("SELECT 1 FROM makes WHERE User_ID = %s AND Transaction_ID = %s", 
@@ -1062,12 +2569,13 @@ def update_transaction_api():
             if not cursor.fetchone():
                 return jsonify({"error": "Transaction not found or access denied"}), 403
             
-            cursor.execute("SELECT Transaction_Amount FROM transactions WHERE Transaction_ID = %s", 
-                         (transaction_id,))
+            # Lock the row so two edits of the same transaction can't both work from the old amount
+            cursor.execute(TRANSACTION_EDIT_LOCK_QUERY, (transaction_id,))
             old_amount_result = cursor.fetchone()
-            old_amount = float(old_amount_result[0]) if old_amount_result else 0
+            old_amount = to_cents(old_amount_result[0]) if old_amount_result else Decimal('0.00')
+            old_date = old_amount_result[1] if old_amount_result else date
             
-            cursor.execute("SELECT Category_ID FROM categories WHERE Category_Name = %s", (category,))
+            cursor.execute(USER_CATEGORY_ID_QUERY, (user_id, category))
             category_result = cursor.fetchone()
             if not category_result:
                 return jsonify({"error": f"Category '{category}' not found"}), 400
@@ -1083,27 +2591,26 @@ def update_transaction_api():
             elif not current_category:
                 cursor.execute("INSERT INTO falls_under (Transaction_ID, Category_ID) VALUES (%s, %s)", 
                              (transaction_id, category_id))
-            
-            amount_diff = float(old_amount) - float(amount)
+
+            apply_daily_spend(cursor, user_id, current_category[0] if current_category else 0, old_date, -old_amount, -1)
+            apply_daily_spend(cursor, user_id, category_id, date, amount, 1)
             
             cursor.execute("SELECT Account_ID FROM made_on WHERE Transaction_ID = %s", (transaction_id,))
             current_account = cursor.fetchone()
             current_account_id = current_account[0] if current_account else None
-            
+
+            # The old amount goes back to the old account and the new amount comes out of the new one
+            balance_changes = {}
+            add_balance_change(balance_changes, current_account_id or account, old_amount)
+            add_balance_change(balance_changes, account, -amount)
+            apply_balance_changes(cursor, balance_changes)
+
             if current_account_id and str(current_account_id) != str(account):
-                cursor.execute("UPDATE accounts SET Account_Balance = Account_Balance + %s WHERE Account_ID = %s", 
-                             (old_amount, current_account_id))
-                
-                cursor.execute("UPDATE accounts SET Account_Balance = Account_Balance - %s WHERE Account_ID = %s", 
-                             (amount, account))
-                
                 cursor.execute("UPDATE made_on SET Account_ID = %s WHERE Transaction_ID = %s", 
                              (account, transaction_id))
-            else:
-                cursor.execute("UPDATE accounts SET Account_Balance = Account_Balance + %s WHERE Account_ID = %s", 
-                             (amount_diff, current_account_id if current_account_id else account))
             
             db.commit()
+            invalidate_user_caches(user_id)
             return jsonify({"success": True, "message": "Transaction updated successfully"})
             
     except Exception as e:
@@ -1119,20 +2626,22 @@ def delete_transaction_api(transaction_id):
     # Find transaction and delete it
     try:
         with get_db_connection() as db:
+            db.start_transaction()
             cursor = db.cursor()
             
-            cursor.execute("SELECT t.Transaction_Amount, mo.Account_ID FROM transactions t JOIN makes m ON t.Transaction_ID = m.Transaction_ID LEFT JOIN made_on mo ON t.Transaction_ID = mo.Transaction_ID WHERE m.User_ID = %s AND t.Transaction_ID = %s", (user_id, transaction_id))
+            cursor.execute("SELECT t.Transaction_Amount, mo.Account_ID, t.Transaction_Date, fu.Category_ID FROM transactions t JOIN makes m ON t.Transaction_ID = m.Transaction_ID LEFT JOIN made_on mo ON t.Transaction_ID = mo.Transaction_ID LEFT JOIN falls_under fu ON t.Transaction_ID = fu.Transaction_ID WHERE m.User_ID = %s AND t.Transaction_ID = %s FOR UPDATE", (user_id, transaction_id))
             
             transaction = cursor.fetchone()
             if not transaction:
                 return jsonify({"error": "Transaction not found or access denied"}), 403
             
-            amount = float(transaction[0]) if transaction[0] else 0
+            amount = to_cents(transaction[0]) if transaction[0] else Decimal('0.00')
             account_id = transaction[1]
             
             if account_id:
-                cursor.execute("UPDATE accounts SET Account_Balance = Account_Balance + %s WHERE Account_ID = %s", 
-                             (amount, account_id))
+                apply_balance_changes(cursor, {account_id: amount})
+
+            apply_daily_spend(cursor, user_id, transaction[3], transaction[2], -amount, -1)
             
             cursor.execute("DELETE FROM falls_under WHERE Transaction_ID = %s", (transaction_id,))
             cursor.execute("DELETE FROM made_on WHERE Transaction_ID = %s", (transaction_id,))
@@ -1141,31 +2650,199 @@ def delete_transaction_api(transaction_id):
             cursor.execute("DELETE FROM transactions WHERE Transaction_ID = %s", (transaction_id,))
             
             db.commit()
+            invalidate_user_caches(user_id)
             return jsonify({"success": True, "message": "Transaction deleted successfully"})
             
     except Exception as e:
         return jsonify({"error": f"Failed to delete transaction: {str(e)}"}), 500
 
-# Retrieve user's transactions
-@app.route('/api/transactions')
-def get_transactions_api():
+# Batch edits from the transaction list. Ownership of every id is checked with one IN query that also
+# locks the rows, the changes are made with set-based statements, and balance and daily_spend changes
+# are added up per account and per category and day before they're written. All of it is one commit.
+TRANSACTION_BATCH_MAX = 1000
+
+def in_placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+# Read the transaction_ids list from a batch request, or return an error message
+def parse_transaction_batch_ids(data):
+    transaction_ids = data.get('transaction_ids') if isinstance(data, dict) else None
+    if not isinstance(transaction_ids, list) or not transaction_ids:
+        return None, "Missing transaction ids"
+    if len(transaction_ids) > TRANSACTION_BATCH_MAX:
+        return None, f"At most {TRANSACTION_BATCH_MAX} transactions can be changed at once"
+    try:
+        return sorted(set(int(transaction_id) for transaction_id in transaction_ids)), None
+    except (TypeError, ValueError):
+        return None, "Invalid transaction id"
+
+# Lock and return (Transaction_ID, Amount, Date, Category_ID, Account_ID) for each id, or None if any
+# of them doesn't belong to the user
+def fetch_owned_transactions(cursor, user_id, transaction_ids):
+    cursor.execute(OWNED_TRANSACTIONS_QUERY.format(ids=in_placeholders(transaction_ids)), [user_id] + transaction_ids)
+    rows = cursor.fetchall()
+    if len(set(row[0] for row in rows)) != len(transaction_ids):
+        return None
+    return rows
+
+def add_daily_change(daily_changes, category_id, day, amount, count):
+    key = (category_id or 0, day.date() if isinstance(day, datetime.datetime) else day)
+    total, total_count = daily_changes.get(key, (0, 0))
+    daily_changes[key] = (total + amount, total_count + count)
+
+# Apply the same changes to many transactions. Body: {"transaction_ids": [...], "changes": {...}}
+# where changes can have category (name), account (id) and amount.
+@app.route('/api/transactions/batch-update', methods=['POST'])
+def batch_update_transactions_api():
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({"error": "Not authenticated"}), 401
 
-    # Apply filters to search for transactions
-    filter_category = request.args.get('category', None)
-    filter_account = request.args.get('account', None)
-    filter_start_date = request.args.get('start_date', None)
-    filter_end_date = request.args.get('end_date', None)
-    filter_description = request.args.get('description', None)
-    filter_min_amount = request.args.get('min_amount', None)
-    filter_max_amount = request.args.get('max_amount', None)
-    filter_sort = request.args.get('sort', 'date_desc')
+    data = request.get_json(silent=True)
+    transaction_ids, error = parse_transaction_batch_ids(data)
+    if error:
+        return jsonify({"error": error}), 400
+    changes = data.get('changes')
+    if not isinstance(changes, dict):
+        return jsonify({"error": "changes must be an object"}), 400
+    category = changes.get('category')
+    account = changes.get('account')
+    amount = changes.get('amount')
+    if category is None and account is None and amount is None:
+        return jsonify({"error": "Nothing to change"}), 400
+    if category is not None and not isinstance(category, str):
+        return jsonify({"error": "Invalid category"}), 400
+
+    try:
+        amount = to_cents(amount) if amount is not None else None
+        account = int(account) if account is not None else None
+    except Exception:
+        return jsonify({"error": "Invalid amount or account"}), 400
+
+    try:
+        with get_db_connection() as db:
+            db.start_transaction()
+            cursor = db.cursor()
+
+            rows = fetch_owned_transactions(cursor, user_id, transaction_ids)
+            if rows is None:
+                db.rollback()
+                return jsonify({"error": "Transaction not found or access denied"}), 403
+
+            category_id = None
+            if category is not None:
+                cursor.execute(USER_CATEGORY_ID_QUERY, (user_id, category))
+                category_result = cursor.fetchone()
+                if not category_result:
+                    db.rollback()
+                    return jsonify({"error": f"Category '{category}' not found"}), 400
+                category_id = category_result[0]
+
+            if account is not None:
+                cursor.execute(ACCOUNT_OWNER_QUERY, (user_id, account))
+                if not cursor.fetchone():
+                    db.rollback()
+                    return jsonify({"error": "Account not found or access denied"}), 403
+
+            id_list = in_placeholders(transaction_ids)
+            if amount is not None:
+                cursor.execute(BATCH_UPDATE_QUERY.format(table="transactions", column="Transaction_Amount", ids=id_list), [amount] + transaction_ids)
+            if category_id is not None:
+                cursor.execute(BATCH_UPDATE_QUERY.format(table="falls_under", column="Category_ID", ids=id_list), [category_id] + transaction_ids)
+                uncategorized = [(row[0], category_id) for row in rows if row[3] is None]
+                if uncategorized:
+                    cursor.executemany("INSERT INTO falls_under (Transaction_ID, Category_ID) VALUES (%s, %s)", uncategorized)
+            if account is not None:
+                cursor.execute(BATCH_UPDATE_QUERY.format(table="made_on", column="Account_ID", ids=id_list), [account] + transaction_ids)
+                unlinked = [(row[0], account) for row in rows if row[4] is None]
+                if unlinked:
+                    cursor.executemany("INSERT INTO made_on (Transaction_ID, Account_ID) VALUES (%s, %s)", unlinked)
+
+            # Each transaction gives its old amount back to its old account and takes the new amount
+            # from its new account; the same swap happens in daily_spend
+            balance_changes = {}
+            daily_changes = {}
+            for _, old_amount, day, old_category_id, old_account_id in rows:
+                old_amount = to_cents(old_amount or 0)
+                new_amount = amount if amount is not None else old_amount
+                new_category_id = category_id if category_id is not None else old_category_id
+                add_balance_change(balance_changes, old_account_id, old_amount)
+                add_balance_change(balance_changes, account if account is not None else old_account_id, -new_amount)
+                add_daily_change(daily_changes, old_category_id, day, -old_amount, -1)
+                add_daily_change(daily_changes, new_category_id, day, new_amount, 1)
+            apply_balance_changes(cursor, balance_changes)
+            apply_daily_spend_many(cursor, user_id, {key: change for key, change in daily_changes.items() if change != (0, 0)})
+
+            db.commit()
+            cursor.close()
+        invalidate_user_caches(user_id)
+        return jsonify({"success": True, "updated": len(transaction_ids)})
+    except Exception as e:
+        return jsonify({"error": f"Failed to update transactions: {str(e)}"}), 500
+
+# Delete many transactions. Body: {"transaction_ids": [...]}
+@app.route('/api/transactions/batch-delete', methods=['POST'])
+def batch_delete_transactions_api():
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+
+    transaction_ids, error = parse_transaction_batch_ids(request.get_json(silent=True))
+    if error:
+        return jsonify({"error": error}), 400
+
+    try:
+        with get_db_connection() as db:
+            db.start_transaction()
+            cursor = db.cursor()
+
+            rows = fetch_owned_transactions(cursor, user_id, transaction_ids)
+            if rows is None:
+                db.rollback()
+                return jsonify({"error": "Transaction not found or access denied"}), 403
+
+            balance_changes = {}
+            daily_changes = {}
+            for _, amount, day, category_id, account_id in rows:
+                add_balance_change(balance_changes, account_id, amount or 0)
+                add_daily_change(daily_changes, category_id, day, -(amount or 0), -1)
+            apply_balance_changes(cursor, balance_changes)
+            apply_daily_spend_many(cursor, user_id, daily_changes)
 
-    where_clauses = ["m.User_ID = %s"]
+            id_list = in_placeholders(transaction_ids)
+            for table in ('falls_under', 'made_on', 'makes', 'transactions'):
+                cursor.execute(BATCH_DELETE_QUERY.format(table=table, ids=id_list), transaction_ids)
+
+            db.commit()
+            cursor.close()
+        invalidate_user_caches(user_id)
+        return jsonify({"success": True, "deleted": len(transaction_ids)})
+    except Exception as e:
+        return jsonify({"error": f"Failed to delete transactions: {str(e)}"}), 500
+
+# Sort orders for the transaction list. Each ends in Transaction_ID so the order is total, which keyset
+# pagination needs to pick up exactly where the previous page stopped.
+TRANSACTION_SORT_ORDERS = {
+    'date_desc': [('t.Transaction_Date', 'DESC'), ('t.Transaction_ID', 'DESC')],
+    'date_asc': [('t.Transaction_Date', 'ASC'), ('t.Transaction_ID', 'ASC')],
+    'amount_desc': [('t.Transaction_Amount', 'DESC'), ('t.Transaction_Date', 'DESC'), ('t.Transaction_ID', 'DESC')],
+    'amount_asc': [('t.Transaction_Amount', 'ASC'), ('t.Transaction_Date', 'DESC'), ('t.Transaction_ID', 'DESC')]
+}
+TRANSACTION_PAGE_MAX = 500
+
+# Build the WHERE clause for the transaction filters shared by the list and export endpoints
+def build_transaction_filters(args, user_id):
+    where_clauses = ["t.User_ID = %s"]
     params = [user_id]
 
+    filter_category = args.get('category', None)
+    filter_account = args.get('account', None)
+    filter_start_date = args.get('start_date', None)
+    filter_end_date = args.get('end_date', None)
+    filter_description = args.get('description', None)
+    filter_min_amount = args.get('min_amount', None)
+    filter_max_amount = args.get('max_amount', None)
+
     if filter_category:
         where_clauses.append("c.Category_Name = %s")
         params.append(filter_category)
@@ -1188,34 +2865,438 @@ def get_transactions_api():
         where_clauses.append("t.Transaction_Amount <= %s")
         params.append(filter_max_amount)
 
+    return where_clauses, params
+
+# Keyset condition for rows that come after the cursor values in the given sort order
+def keyset_condition(sort_columns, cursor_values):
+    alternatives = []
+    params = []
+    for i, (column, direction) in enumerate(sort_columns):
+        parts = [f"{previous} = %s" for previous, _ in sort_columns[:i]]
+        parts.append(f"{column} {'<' if direction == 'DESC' else '>'} %s")
+        alternatives.append("(" + " AND ".join(parts) + ")")
+        params.extend(cursor_values[:i + 1])
+    return "(" + " OR ".join(alternatives) + ")", params
+
+def encode_page_cursor(row, sort_columns):
+    values = [str(row[column.split('.')[1]]) for column, _ in sort_columns]
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_page_cursor(page_cursor):
+    return json.loads(base64.urlsafe_b64decode(page_cursor.encode('ascii')).decode('utf-8'))
+
+def format_transaction_row(t):
+    if isinstance(t['Transaction_Date'], datetime.date):
+        t['Transaction_Date'] = t['Transaction_Date'].strftime('%Y-%m-%d')
+    return t
+
+# Retrieve user's transactions. Without a limit this returns the whole list like before. With limit
+# (and the next_cursor from the previous page) it returns one page at a time, and format=ndjson
+# streams one JSON row per line straight off the DB cursor.
+@app.route('/api/transactions')
+def get_transactions_api():
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+
+    # Apply filters to search for transactions
+    where_clauses, params = build_transaction_filters(request.args, user_id)
+    filter_sort = request.args.get('sort', 'date_desc')
+    sort_columns = TRANSACTION_SORT_ORDERS.get(filter_sort, TRANSACTION_SORT_ORDERS['date_desc'])
+
+    limit = request.args.get('limit', type=int)
+    page_cursor = request.args.get('cursor')
+    if page_cursor:
+        try:
+            cursor_values = decode_page_cursor(page_cursor)
+            if len(cursor_values) != len(sort_columns): raise ValueError("Cursor does not match sort order")
+        except Exception as e:
+            return jsonify({"error": "Invalid cursor"}), 400
+        condition, condition_params = keyset_condition(sort_columns, cursor_values)
+        where_clauses.append(condition)
+        params.extend(condition_params)
+
     sql_where = " AND ".join(where_clauses)
+    order_clause = "ORDER BY " + ", ".join(f"{column} {direction}" for column, direction in sort_columns)
+    query = TRANSACTION_LIST_QUERY.format(where=sql_where, order=order_clause)
 
-    order_clause = ""
-    if filter_sort == 'date_asc':
-        order_clause = "ORDER BY t.Transaction_Date ASC, t.Transaction_ID ASC"
-    elif filter_sort == 'amount_desc':
-        order_clause = "ORDER BY t.Transaction_Amount DESC, t.Transaction_Date DESC"
-    elif filter_sort == 'amount_asc':
-        order_clause = "ORDER BY t.Transaction_Amount ASC, t.Transaction_Date DESC"
-    else:
-        order_clause = "ORDER BY t.Transaction_Date DESC, t.Transaction_ID DESC"
+    if request.args.get('format') == 'ndjson':
+        return Response(stream_transaction_rows(query, params, read_only=can_read_replica()), mimetype='application/x-ndjson')
 
-    query = f"SELECT t.Transaction_ID, t.Transaction_Date, t.Transaction_Description, t.Transaction_Amount, c.Category_Name, a.Account_Name FROM transactions t JOIN makes m ON t.Transaction_ID = m.Transaction_ID LEFT JOIN falls_under fu ON t.Transaction_ID = fu.Transaction_ID LEFT JOIN categories c ON fu.Category_ID = c.Category_ID LEFT JOIN made_on mo ON t.Transaction_ID = mo.Transaction_ID LEFT JOIN accounts a ON mo.Account_ID = a.Account_ID WHERE {sql_where} {order_clause}"
+    if limit:
+        limit = max(1, min(limit, TRANSACTION_PAGE_MAX))
+        query += " LIMIT %s"
+        params.append(limit + 1)
 
     transactions = []
     try:
-        with get_db_connection() as db:
+        with get_db_connection(read_only=True) as db:
             cursor = db.cursor(dictionary=True)
             cursor.execute(query, params)
             transactions = cursor.fetchall()
-            for t in transactions:
-                if isinstance(t['Transaction_Date'], datetime.date):
-                    t['Transaction_Date'] = t['Transaction_Date'].strftime('%Y-%m-%d')
             cursor.close()
-        return jsonify(transactions)
+
+        if not limit:
+            return jsonify([format_transaction_row(t) for t in transactions])
+
+        next_cursor = None
+        if len(transactions) > limit:
+            transactions = transactions[:limit]
+            next_cursor = encode_page_cursor(transactions[-1], sort_columns)
+        return jsonify({"transactions": [format_transaction_row(t) for t in transactions], "next_cursor": next_cursor})
     except Exception as e:
         return jsonify({"error": f"Failed to load transactions: {str(e)}"}), 500
 
+# Read query results in batches from an unbuffered cursor, so only one batch is in memory at a time.
+# If a download is abandoned part way, the rest of the result is read off and dropped so the
+# connection goes back to the pool clean.
+def iter_transaction_batches(query, params, batch_size=500, read_only=False):
+    with get_db_connection(read_only=read_only) as db:
+        cursor = db.cursor(dictionary=True, buffered=False)
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            if db.unread_result:
+                db.consume_results()
+            cursor.close()
+
+# Yield transactions as NDJSON lines while reading the cursor in small batches, so memory stays flat
+def stream_transaction_rows(query, params, batch_size=500, read_only=False):
+    try:
+        for rows in iter_transaction_batches(query, params, batch_size, read_only):
+            yield "".join(json.dumps(format_transaction_row(t), default=str) + "\n" for t in rows)
+    except Exception as e:
+        yield json.dumps({"error": f"Failed to load transactions: {str(e)}"}) + "\n"
+
+EXPORT_COLUMNS = ['Transaction_ID', 'Transaction_Date', 'Transaction_Description', 'Transaction_Amount', 'Category_Name', 'Account_Name']
+
+def stream_transaction_csv(query, params, read_only=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    try:
+        for rows in iter_transaction_batches(query, params, read_only=read_only):
+            writer.writerows([format_transaction_row(t)[column] for column in EXPORT_COLUMNS] for t in rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    except Exception as e:
+        writer.writerow([f"Failed to load transactions: {str(e)}"])
+    yield buffer.getvalue()
+
+# File object for ParquetWriter that hands back whatever has been written since the last drain, so
+# each row group can be sent as soon as it's written
+class ExportSink(io.RawIOBase):
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+# One Parquet row group per batch. A failure part way leaves the file without its footer, so the
+# download shows up as broken rather than silently short.
+def stream_transaction_parquet(query, params, pa, pq, read_only=False):
+    schema = pa.schema([
+        ('Transaction_ID', pa.int64()),
+        ('Transaction_Date', pa.timestamp('s')),
+        ('Transaction_Description', pa.string()),
+        ('Transaction_Amount', pa.float64()),
+        ('Category_Name', pa.string()),
+        ('Account_Name', pa.string())
+    ])
+    sink = ExportSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for rows in iter_transaction_batches(query, params, batch_size=5000, read_only=read_only):
+        for t in rows:
+            t['Transaction_Amount'] = float(t['Transaction_Amount'] or 0)
+        writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+# Download the user's transactions as csv, ndjson or parquet, with the same filters and sort as
+# /api/transactions. Rows are streamed as they're read, so large histories don't build up in memory.
+# Parquet needs pyarrow installed.
+@app.route('/api/transactions/export')
+def export_transactions_api():
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+
+    file_format = request.args.get('format', 'csv')
+    if file_format not in EXPORT_FORMATS:
+        return jsonify({"error": "Unsupported export format"}), 400
+
+    where_clauses, params = build_transaction_filters(request.args, user_id)
+    sort_columns = TRANSACTION_SORT_ORDERS.get(request.args.get('sort', 'date_desc'), TRANSACTION_SORT_ORDERS['date_desc'])
+    order_clause = "ORDER BY " + ", ".join(f"{column} {direction}" for column, direction in sort_columns)
+    query = TRANSACTION_LIST_QUERY.format(where=" AND ".join(where_clauses), order=order_clause)
+
+    read_only = can_read_replica()
+    if file_format == 'parquet':
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            return jsonify({"error": "Parquet export needs the pyarrow package"}), 501
+        body = stream_transaction_parquet(query, params, pa, pq, read_only)
+    elif file_format == 'ndjson':
+        body = stream_transaction_rows(query, params, read_only=read_only)
+    else:
+        body = stream_transaction_csv(query, params, read_only)
+
+    filename = f"transactions-{datetime.date.today().isoformat()}.{file_format}"
+    return Response(body, mimetype=EXPORT_FORMATS[file_format], headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no'
+    })
+
+# Bulk import of bank exports. Rows are parsed as the file is read and written IMPORT_BATCH_SIZE at a
+# time. Each batch is one DB transaction with multi-row inserts, one balance update per account and
+# one daily_spend update per category and day.
+IMPORT_BATCH_SIZE = 500
+IMPORT_MAX_ERRORS = 20
+IMPORT_DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%Y/%m/%d', '%Y%m%d')
+
+# CSV headers are matched loosely, so "Transaction Date" and "date" both work
+IMPORT_CSV_COLUMNS = {
+    'date': ('date', 'transaction_date', 'posted_date'),
+    'description': ('description', 'transaction_description', 'memo', 'name', 'payee'),
+    'amount': ('amount', 'transaction_amount'),
+    'category': ('category', 'category_name'),
+    'account': ('account', 'account_name')
+}
+
+def parse_import_date(value):
+    value = value.strip()
+    for date_format in IMPORT_DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    raise ValueError(f"unrecognised date '{value}'")
+
+def parse_import_amount(value):
+    cleaned = value.strip().replace('$', '').replace(',', '')
+    if cleaned.startswith('(') and cleaned.endswith(')'):
+        cleaned = '-' + cleaned[1:-1]
+    try:
+        return to_cents(cleaned)
+    except Exception:
+        raise ValueError(f"unrecognised amount '{value}'")
+
+# Turn one raw row into (day, amount, description, category_id, account_id). Unknown categories are
+# imported uncategorized and unknown accounts go to the default account.
+def parse_import_row(raw, category_ids, account_ids, default_account_id):
+    day = parse_import_date(raw.get('date') or '')
+    amount = parse_import_amount(raw.get('amount') or '')
+    description = (raw.get('description') or '').strip()[:45]
+    category_id = category_ids.get((raw.get('category') or '').strip().lower(), 0)
+    account_id = account_ids.get((raw.get('account') or '').strip().lower(), default_account_id)
+    return day, amount, description, category_id, account_id
+
+# Yields (line_number, raw_row) from a CSV with a header row. Amounts are spending, like the add
+# transaction form.
+def read_csv_transactions(text_stream):
+    reader = csv.DictReader(text_stream)
+    columns = {}
+    for field in reader.fieldnames or []:
+        normalized = field.strip().lower().replace(' ', '_')
+        for name, aliases in IMPORT_CSV_COLUMNS.items():
+            if normalized in aliases and name not in columns:
+                columns[name] = field
+    if 'date' not in columns or 'amount' not in columns:
+        raise ValueError("The CSV needs a date and an amount column")
+    for row in reader:
+        yield reader.line_num, {name: row.get(field) or '' for name, field in columns.items()}
+
+# Yields (line_number, raw_row) for each STMTTRN in an OFX/QFX statement. OFX amounts are negative for
+# money going out, which is what the app records as spending, so deposits come through as None (skipped).
+def read_ofx_transactions(text_stream):
+    entry = None
+    entry_line = 0
+    for line_number, line in enumerate(text_stream, 1):
+        for tag, value in re.findall(r'<(/?\w+)>([^<\r\n]*)', line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                entry = {}
+                entry_line = line_number
+            elif tag == '/STMTTRN' and entry is not None:
+                try:
+                    spent = -Decimal(entry.get('TRNAMT', ''))
+                except Exception:
+                    spent = None
+                if spent is not None and spent <= 0:
+                    yield entry_line, None
+                else:
+                    yield entry_line, {'date': entry.get('DTPOSTED', '')[:8], 'amount': str(spent) if spent is not None else entry.get('TRNAMT', ''), 'description': entry.get('NAME') or entry.get('MEMO', '')}
+                entry = None
+            elif entry is not None and not tag.startswith('/'):
+                entry[tag] = value.strip()
+
+def read_import_rows(text_stream, file_format):
+    if file_format in ('ofx', 'qfx'):
+        return read_ofx_transactions(text_stream)
+    return read_csv_transactions(text_stream)
+
+def write_import_batch(db, cursor, user_id, batch):
+    db.start_transaction()
+    try:
+        # executemany sends this as one multi-row INSERT. InnoDB gives a multi-row insert consecutive ids
+        # unless an INSERT ... SELECT into the same table runs at the same moment, which the app never
+        # does, so the ids follow on from lastrowid. The count makes sure of it before anything is linked.
+        cursor.executemany("INSERT INTO transactions (User_ID, Transaction_Amount, Transaction_Description, Transaction_Date) VALUES (%s, %s, %s, %s)", [(user_id, amount, description, day) for day, amount, description, _, _ in batch])
+        transaction_ids = list(range(cursor.lastrowid, cursor.lastrowid + len(batch)))
+        cursor.execute(IMPORT_ID_CHECK_QUERY, (user_id, transaction_ids[0], transaction_ids[-1]))
+        if cursor.fetchone()[0] != len(batch):
+            raise RuntimeError("Imported transaction ids were not consecutive")
+
+        cursor.executemany("INSERT INTO makes (User_ID, Transaction_ID) VALUES (%s, %s)", [(user_id, transaction_id) for transaction_id in transaction_ids])
+        categorized = [(transaction_id, row[3]) for transaction_id, row in zip(transaction_ids, batch) if row[3]]
+        if categorized:
+            cursor.executemany("INSERT INTO falls_under (Transaction_ID, Category_ID) VALUES (%s, %s)", categorized)
+        cursor.executemany("INSERT INTO made_on (Transaction_ID, Account_ID) VALUES (%s, %s)", [(transaction_id, row[4]) for transaction_id, row in zip(transaction_ids, batch)])
+
+        balance_changes = {}
+        daily_changes = {}
+        for day, amount, _, category_id, account_id in batch:
+            balance_changes[account_id] = balance_changes.get(account_id, 0) + amount
+            total, count = daily_changes.get((category_id, day), (0, 0))
+            daily_changes[(category_id, day)] = (total + amount, count + 1)
+        apply_balance_changes(cursor, {account_id: -total for account_id, total in balance_changes.items()})
+        apply_daily_spend_many(cursor, user_id, daily_changes)
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+# Import (line_number, raw_row) pairs for a user. Rows that can't be parsed are skipped and listed in
+# errors. If a batch fails to write, the batches before it stay imported and the import stops there.
+# on_batch(imported, seconds) is called after each batch so the CLI can show progress.
+def import_transactions(user_id, rows, default_account_id, on_batch=None):
+    started = time.monotonic()
+    result = {"imported": 0, "skipped": 0, "errors": []}
+
+    with get_db_connection() as db:
+        cursor = db.cursor()
+        cursor.execute(IMPORT_CATEGORIES_QUERY, (user_id,))
+        category_ids = {name.lower(): category_id for category_id, name in cursor.fetchall()}
+        cursor.execute(IMPORT_ACCOUNTS_QUERY, (user_id,))
+        user_accounts = cursor.fetchall()
+        account_ids = {name.lower(): account_id for account_id, name in user_accounts}
+        if default_account_id not in [account_id for account_id, _ in user_accounts]:
+            raise ValueError("Account not found or access denied")
+
+        batch = []
+        batch_line = 0
+        try:
+            for line_number, raw in rows:
+                if raw is None:
+                    result["skipped"] += 1
+                    continue
+                try:
+                    parsed = parse_import_row(raw, category_ids, account_ids, default_account_id)
+                except ValueError as e:
+                    result["skipped"] += 1
+                    if len(result["errors"]) < IMPORT_MAX_ERRORS:
+                        result["errors"].append(f"Line {line_number}: {e}")
+                    continue
+                if not batch:
+                    batch_line = line_number
+                batch.append(parsed)
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    write_import_batch(db, cursor, user_id, batch)
+                    result["imported"] += len(batch)
+                    batch = []
+                    if on_batch:
+                        on_batch(result["imported"], time.monotonic() - started)
+            if batch:
+                write_import_batch(db, cursor, user_id, batch)
+                result["imported"] += len(batch)
+        except ValueError:
+            # A file that can't be read at all (e.g. a CSV without the needed columns)
+            raise
+        except Exception as e:
+            result["error"] = f"Import stopped at the batch starting on line {batch_line}: {e}"
+        cursor.close()
+
+    if result["imported"]:
+        invalidate_user_caches(user_id)
+    elapsed = time.monotonic() - started
+    result["seconds"] = round(elapsed, 3)
+    result["rows_per_second"] = round(result["imported"] / elapsed, 1) if elapsed else 0.0
+    return result
+
+# Upload a CSV or OFX/QFX file as "file", with "account_id" for rows that don't name one of the
+# user's accounts. "format" can be csv or ofx; otherwise the file extension decides.
+@app.route('/api/transactions/import', methods=['POST'])
+def import_transactions_api():
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+
+    upload = request.files.get('file')
+    account_id = request.form.get('account_id', type=int)
+    if not upload or not account_id:
+        return jsonify({"error": "Missing file or account"}), 400
+    file_format = (request.form.get('format') or os.path.splitext(upload.filename or '')[1].lstrip('.') or 'csv').lower()
+    if file_format not in ('csv', 'ofx', 'qfx'):
+        return jsonify({"error": "Unsupported file format"}), 400
+
+    try:
+        text_stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', errors='replace', newline='')
+        result = import_transactions(user_id, read_import_rows(text_stream, file_format), account_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Failed to import transactions: {str(e)}"}), 500
+    return jsonify(result), (500 if result.get("error") else 200)
+
+# Import a CSV or OFX/QFX file from the command line, printing progress after each batch
+@app.cli.command('import-transactions')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user-id', type=int, required=True)
+@click.option('--account-id', type=int, required=True, help='Account for rows that do not name one of the user\'s accounts.')
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ofx']), default=None, help='Defaults to the file extension.')
+def import_transactions_command(path, user_id, account_id, file_format):
+    file_format = file_format or ('ofx' if path.lower().endswith(('.ofx', '.qfx')) else 'csv')
+    with open(path, encoding='utf-8-sig', errors='replace', newline='') as import_file:
+        result = import_transactions(user_id, read_import_rows(import_file, file_format), account_id,
+                                     on_batch=lambda imported, seconds: click.echo(f"{imported} rows ({imported / seconds:.0f} rows/s)"))
+    for error in result["errors"]:
+        click.echo(error)
+    click.echo(f"Imported {result['imported']} rows and skipped {result['skipped']} in {result['seconds']}s ({result['rows_per_second']} rows/s).")
+    if result.get("error"):
+        click.echo(result["error"])
+        raise SystemExit(1)
+
 # Load transactions to UI
 @app.route('/manage_transaction')
 def manage_transaction():
@@ -1230,13 +3311,9 @@ def manage_transaction():
     filter_categories = load_categories(user_id)
     
     accounts = []
-    # Find user's transactions
+    # Find user's accounts
     try:
-        with get_db_connection() as db:
-            cursor = db.cursor(dictionary=True)
-            cursor.execute("SELECT Account_ID, Account_Name FROM accounts JOIN has USING (Account_ID) WHERE User_ID = %s", (user_id,))
-            accounts = cursor.fetchall()            
-            cursor.close()
+        accounts = load_accounts(user_id)
     except Exception as e:
         flash('Could not load account data.', 'error')
 
@@ -1261,16 +3338,11 @@ def record_goal():
 
         # Create new goal
         try:
-            with get_db_connection() as db:
-                cursor = db.cursor()
+            with unit_of_work() as cursor:
                 cursor.execute("INSERT INTO goals (Goal_Name, Goal_Date, Goal_Target, Current_Amount, Goal_Description, Monthly_Budget) VALUES (%s, %s, %s, %s, %s, 0)", (goal_name, goal_deadline, goal_target, current_amount, goal_description))
-                cursor.execute("SELECT LAST_INSERT_ID()")
-                goal_id = cursor.fetchone()[0]
-                cursor.execute("INSERT INTO sets (User_ID, Goal_ID) VALUES (%s, %s)", (user_id, goal_id))
-                db.commit()
-                cursor.close()
-                flash('New goal added', 'success')
-                return redirect(url_for('manage_goals'))
+                cursor.execute("INSERT INTO sets (User_ID, Goal_ID) VALUES (%s, %s)", (user_id, cursor.lastrowid))
+            flash('New goal added', 'success')
+            return redirect(url_for('manage_goals'))
         except Exception as e:
             flash('Failed to record goal', 'error')
 
@@ -1287,7 +3359,7 @@ def manage_goals():
     try:
         with get_db_connection() as db:
             cursor = db.cursor(dictionary=True)
-            cursor.execute("SELECT Goal_ID, Goal_Name, Goal_Date, Goal_Target, Current_Amount, Goal_Description FROM goals g JOIN sets s USING(Goal_ID) WHERE s.User_ID = %s AND g.Monthly_Budget = 0 ORDER BY g.Goal_Date ASC, g.Goal_Name ASC", (user_id,))
+            cursor.execute(USER_GOALS_QUERY, (user_id,))
             goals = cursor.fetchall()
             cursor.close()
     except Exception as e:
@@ -1314,7 +3386,7 @@ def update_goal_progress():
     try:
         with get_db_connection() as db:
             cursor = db.cursor()
-            cursor.execute("SELECT 1 FROM sets WHERE User_ID = %s AND Goal_ID = %s", (user_id, goal_id))
+            cursor.execute(GOAL_OWNER_QUERY, (user_id, goal_id))
             if not cursor.fetchone():
                  flash('Goal not found or access denied.', 'error')
             else:
@@ -1337,13 +3409,14 @@ def delete_goal(goal_id):
     try:
         with get_db_connection() as db:
             cursor = db.cursor()
-            cursor.execute("SELECT 1 FROM sets WHERE User_ID = %s AND Goal_ID = %s", (user_id, goal_id))
+            cursor.execute(GOAL_OWNER_QUERY, (user_id, goal_id))
             if not cursor.fetchone():
                  flash('Goal not found or access denied.', 'error')
             else:
                 cursor.execute("DELETE FROM sets WHERE User_ID = %s AND Goal_ID = %s", (user_id, goal_id))
                 cursor.execute("DELETE FROM goals WHERE Goal_ID = %s", (goal_id,))
                 db.commit()
+                session.pop('setup_complete', None)
                 flash('Goal deleted successfully.', 'success')
             cursor.close()
     except Exception as e:
@@ -1361,7 +3434,7 @@ def edit_goal(goal_id):
     try:
         with get_db_connection() as db:
             cursor = db.cursor(dictionary=True)
-            cursor.execute("SELECT g.* FROM goals g JOIN sets s ON g.Goal_ID = s.Goal_ID WHERE s.User_ID = %s AND g.Goal_ID = %s", (user_id, goal_id))
+            cursor.execute(GOAL_DETAIL_QUERY, (user_id, goal_id))
             goal = cursor.fetchone()
             cursor.close()
             
@@ -1401,11 +3474,7 @@ def manage_accounts():
 
     accounts = []
     try:
-        with get_db_connection() as db:
-            cursor = db.cursor(dictionary=True)
-            cursor.execute("SELECT Account_ID, Account_Name, Account_Type, Account_Balance FROM accounts a JOIN has h USING(Account_ID) WHERE h.User_ID = %s ORDER BY a.Account_Name ASC", (user_id,))
-            accounts = cursor.fetchall()
-            cursor.close()
+        accounts = load_accounts(user_id)
     except Exception as e:
         flash('Could not load your accounts.', 'error')
 
@@ -1429,15 +3498,11 @@ def add_account():
         return redirect(url_for('manage_accounts'))
 
     try:
-        with get_db_connection() as db:
-            cursor = db.cursor()
+        with unit_of_work() as cursor:
             cursor.execute("INSERT INTO accounts (Account_Name, Account_Type, Account_Balance) VALUES (%s, %s, %s)", (account_name, account_type, account_balance))
-            cursor.execute("SELECT LAST_INSERT_ID()")
-            account_id = cursor.fetchone()[0]
-            cursor.execute("INSERT INTO has (User_ID, Account_ID) VALUES (%s, %s)", (user_id, account_id))
-            db.commit()
-            cursor.close()
-            flash('Account added successfully.', 'success')
+            cursor.execute("INSERT INTO has (User_ID, Account_ID) VALUES (%s, %s)", (user_id, cursor.lastrowid))
+        invalidate_metadata(user_id, 'accounts')
+        flash('Account added successfully.', 'success')
     except Exception as e:
         flash('Failed to add account.', 'error')
 
@@ -1461,12 +3526,15 @@ def edit_account(account_id):
     try:
         with get_db_connection() as db:
             cursor = db.cursor()
-            cursor.execute("SELECT 1 FROM has WHERE User_ID = %s AND Account_ID = %s", (user_id, account_id))
+            cursor.execute(ACCOUNT_OWNER_QUERY, (user_id, account_id))
             if not cursor.fetchone():
                  flash('Account not found or access denied.', 'error')
             else:
-                cursor.execute("UPDATE accounts SET Account_Name = %s, Account_Type = %s, Account_Balance = %s WHERE Account_ID = %s", (account_name, account_type, account_balance, account_id))
-                db.commit()
+                # The balance typed in replaces the snapshot, so the ledger entries before it no longer apply
+                with unit_of_work(db) as write_cursor:
+                    write_cursor.execute(ACCOUNT_LEDGER_DELETE_QUERY, (account_id,))
+                    write_cursor.execute("UPDATE accounts SET Account_Name = %s, Account_Type = %s, Account_Balance = %s WHERE Account_ID = %s", (account_name, account_type, account_balance, account_id))
+                invalidate_metadata(user_id, 'accounts')
                 flash('Account updated successfully.', 'success')
             cursor.close()
     except Exception as e:
@@ -1484,7 +3552,7 @@ def delete_account(account_id):
     try:
         with get_db_connection() as db:
             cursor = db.cursor()
-            cursor.execute("SELECT 1 FROM has WHERE User_ID = %s AND Account_ID = %s", (user_id, account_id))
+            cursor.execute(ACCOUNT_OWNER_QUERY, (user_id, account_id))
             if not cursor.fetchone():
                  flash('Account not found or access denied.', 'error')
             else:
@@ -1492,9 +3560,12 @@ def delete_account(account_id):
                 if cursor.fetchone():
                     flash('Cannot delete account because it has associated transactions. Reassign transactions first.', 'warning')
                 else:
-                    cursor.execute("DELETE FROM has WHERE User_ID = %s AND Account_ID = %s", (user_id, account_id))
-                    cursor.execute("DELETE FROM accounts WHERE Account_ID = %s", (account_id,))
-                    db.commit()
+                    with unit_of_work(db) as write_cursor:
+                        write_cursor.execute(ACCOUNT_LEDGER_DELETE_QUERY, (account_id,))
+                        write_cursor.execute("DELETE FROM has WHERE User_ID = %s AND Account_ID = %s", (user_id, account_id))
+                        write_cursor.execute("DELETE FROM accounts WHERE Account_ID = %s", (account_id,))
+                    invalidate_metadata(user_id, 'accounts')
+                    session.pop('setup_complete', None)
                     flash('Account deleted successfully.', 'success')
             cursor.close()
     except Exception as e:
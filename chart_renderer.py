@@ -0,0 +1,223 @@
+import io
+import datetime
+
+# Chart drawing for the dashboard. Everything here takes plain data and returns PNG bytes, so it can
+# run in the chart render processes started by app.py as well as in the web process itself.
+# This module must not import app. Render processes only need the drawing code, and app.py's connection
+# pools are created lazily so that re-importing it as __mp_main__ doesn't connect either.
+
+_pyplot = None
+
+# matplotlib is only imported the first time a chart is drawn
+def get_pyplot():
+    global _pyplot
+    if _pyplot is None:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        _pyplot = plt
+    return _pyplot
+
+# Runs once in every render process when it starts. Drawing and saving a small figure loads the
+# font cache, text layout and PNG writer so the first real chart doesn't pay for them.
+def warm_up():
+    plt = get_pyplot()
+    import matplotlib.dates
+    fig, ax = plt.subplots(figsize=(2, 2), dpi=72)
+    ax.plot([0, 1], [0, 1], marker='o', label='warm up')
+    ax.pie([1, 1])
+    ax.set_title('warm up', fontweight='bold')
+    ax.legend()
+    save_figure_png(fig)
+    return True
+
+# Does nothing. The app submits one of these per render process to get them all started early.
+def ready():
+    return True
+
+# Save a finished figure as PNG bytes and free it
+def save_figure_png(fig, **savefig_kwargs):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', **savefig_kwargs)
+    get_pyplot().close(fig)
+    return buffer.getvalue()
+
+# Turn daily category rows into one value per day for each category that has spending
+def category_line_series(transactions, start_date, end_date):
+    start_dt = datetime.datetime.strptime(start_date, '%Y-%m-%d').date()
+    end_dt = datetime.datetime.strptime(end_date, '%Y-%m-%d').date()
+    dates = [start_dt + datetime.timedelta(days=i) for i in range((end_dt - start_dt).days + 1)]
+    date_index = {day: i for i, day in enumerate(dates)}
+
+    values = {}
+    for row in transactions:
+        day = row['Transaction_Date']
+        if isinstance(day, datetime.datetime):
+            day = day.date()
+        i = date_index.get(day)
+        if i is None:
+            continue
+        values.setdefault(row['Category_Name'], [0.0] * len(dates))[i] += float(row['Daily_Amount'] or 0.0)
+
+    series = []
+    for category, amounts in sorted(values.items()):
+        total = sum(amounts)
+        if total > 0:
+            series.append({'category': category, 'values': [round(a, 2) for a in amounts], 'total': round(total, 2)})
+    return {'dates': [day.isoformat() for day in dates], 'series': series}
+
+# Pie chart of spending against the budget
+def render_budget_pie(current_spent, budget_total):
+    plt = get_pyplot()
+    fig, ax = plt.subplots(figsize=(5, 5), dpi=90)
+    try:
+        ax.set_title('Spending vs Budget', fontsize=14, pad=15, weight='bold')
+
+        # Check is user overspent
+        if current_spent > budget_total:
+            overspent_amount = current_spent - budget_total
+            sizes = [1]
+            colors = ['#dc3545']
+            pie_labels = [f'Budget Used (${budget_total:.2f})']
+            ax.text(0, 0, f"Overspent\n+${overspent_amount:.2f}",
+                    ha='center', va='center', fontsize=14, weight='bold', color='#dc3545')
+        elif current_spent == 0 and budget_total > 0:
+            sizes = [1]
+            colors = ['#28a745']
+            pie_labels = [f'Budget Remaining (${budget_total:.2f})']
+        else:
+            remaining = budget_total - current_spent
+            sizes = [current_spent, remaining]
+            colors = ['#dc3545', '#28a745']
+            pie_labels = [f'Spent (${current_spent:.2f})', f'Remaining (${remaining:.2f})']
+
+        if sizes and sum(sizes) > 0:
+            wedges, texts = ax.pie(
+                sizes,
+                explode=(0.05,) * len(sizes) if len(sizes) > 1 else None,
+                labels=None,
+                colors=colors,
+                autopct=None,
+                shadow=False,
+                startangle=90,
+                wedgeprops=dict(width=0.4, edgecolor='w')
+            )
+
+            ax.legend(wedges, pie_labels,
+                      loc='upper center',
+                      bbox_to_anchor=(0.5, -0.05),
+                      fontsize='12',
+                      frameon=False,
+                      ncol=1)
+        else:
+            ax.text(0.5, 0.5, "No Data", ha='center', va='center', transform=ax.transAxes, fontsize=14, color='#cccccc')
+
+        ax.axis('equal')
+        fig.tight_layout(rect=[0, 0.05, 1, 1])
+        return save_figure_png(fig, transparent=True)
+    except Exception:
+        plt.close(fig)
+        raise
+
+# Line chart of daily spending per category, drawn from category_line_series output
+def render_category_line(series_data):
+    plt = get_pyplot()
+    import matplotlib.dates as mdates
+    fig, ax = plt.subplots(figsize=(7, 4), dpi=96)
+    try:
+        dates = [datetime.date.fromisoformat(day) for day in series_data['dates']]
+        date_range_days = len(dates)
+        colors = plt.cm.tab10.colors
+
+        for i, series in enumerate(series_data['series']):
+            ax.plot(dates, series['values'], marker='.', markersize=4,
+                    linestyle='-', linewidth=1.2,
+                    label=f"{series['category']} (${series['total']:.2f})", color=colors[i % len(colors)])
+
+        ax.set_xlabel('Date', fontsize=10)
+        ax.set_ylabel('Spending ($)', fontsize=10)
+        ax.set_title('Daily Spending by Category', fontsize=12, fontweight='bold')
+
+        if date_range_days <= 10: locator, formatter = mdates.DayLocator(), mdates.DateFormatter('%a %d')
+        elif date_range_days <= 60: locator, formatter = mdates.DayLocator(interval=max(1, date_range_days // 7)), mdates.DateFormatter('%b %d')
+        elif date_range_days <= 730: locator, formatter = mdates.MonthLocator(), mdates.DateFormatter('%b %y')
+        else: locator, formatter = mdates.YearLocator(), mdates.DateFormatter('%Y')
+
+        ax.xaxis.set_major_locator(locator)
+        ax.xaxis.set_major_formatter(formatter)
+        fig.autofmt_xdate(rotation=30, ha='right')
+        ax.tick_params(axis='both', which='major', labelsize=9)
+
+        if series_data['series']:
+            ax.legend(loc='upper left', bbox_to_anchor=(1.01, 1), borderaxespad=0., fontsize=8.5)
+
+        ax.grid(True, alpha=0.3, linestyle=':')
+        ax.set_ylim(bottom=0)
+        fig.tight_layout(rect=[0, 0, 0.88, 1])
+        return save_figure_png(fig, dpi=96)
+    except Exception:
+        plt.close(fig)
+        raise
+
+# Pie chart of spending per category. category_spending is a list of (name, total) pairs.
+def render_category_pie(category_spending):
+    plt = get_pyplot()
+    import numpy as np
+    fig, ax = plt.subplots(figsize=(5, 5), dpi=90)
+    try:
+        ax.set_title('Spending by Category', fontsize=14, pad=15, weight='bold')
+
+        labels = [f"{name} (${total:.2f})" for name, total in category_spending]
+        sizes = [total for _, total in category_spending]
+        colors = plt.cm.viridis(np.linspace(0.1, 0.9, len(sizes)))
+
+        wedges, texts = ax.pie(
+            sizes, labels=None, colors=colors, autopct=None, shadow=False, startangle=90,
+            wedgeprops=dict(width=0.4, edgecolor='w')
+        )
+
+        ax.legend(wedges, labels, loc='upper center', bbox_to_anchor=(0.5, -0.05),
+                  fontsize='12', frameon=False, ncol=1)
+        ax.axis('equal')
+        fig.tight_layout(rect=[0, 0.05, 1, 1])
+        return save_figure_png(fig, transparent=True)
+    except Exception:
+        plt.close(fig)
+        raise
+
+# Line chart of past periods with the predicted next period
+def render_prediction_line(historical, prediction):
+    plt = get_pyplot()
+    fig, ax = plt.subplots(figsize=(7, 4), dpi=96)
+    try:
+        hist_labels = [h['period_label'] for h in historical]
+        hist_amounts = [h['amount'] for h in historical]
+        hist_indices = range(len(historical))
+
+        ax.plot(hist_indices, hist_amounts, marker='o', markersize=5, linestyle='-', color='royalblue', label='Historical Spending')
+
+        pred_index = len(historical)
+        pred_amount = prediction['amount']
+        pred_label = prediction['period_label']
+
+        ax.plot(pred_index, pred_amount, marker='*', markersize=12, color='orangered', linestyle='none', label=f'Predicted: ${pred_amount:.2f}')
+        ax.plot([hist_indices[-1], pred_index], [hist_amounts[-1], pred_amount], linestyle=':', color='grey', alpha=0.7)
+
+        all_labels = hist_labels + [pred_label]
+        all_indices = list(hist_indices) + [pred_index]
+
+        ax.set_xticks(all_indices)
+        ax.set_xticklabels(all_labels, rotation=30, ha='right', fontsize=9)
+
+        ax.set_ylabel('Spending ($)', fontsize=10)
+        ax.set_title('Spending Trend and Prediction', fontsize=12, fontweight='bold')
+        ax.legend(fontsize=9)
+        ax.grid(True, alpha=0.3, linestyle=':')
+        ax.set_ylim(bottom=0)
+        ax.tick_params(axis='y', labelsize=10)
+
+        fig.tight_layout()
+        return save_figure_png(fig, dpi=96)
+    except Exception:
+        plt.close(fig)
+        raise
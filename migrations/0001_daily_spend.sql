@@ -0,0 +1,18 @@
+-- Per-user daily spending rollup read by the dashboard, charts, prediction and chatbot.
+-- The backfill uses REPLACE so it also corrects a table filled earlier by rebuild-daily-spend.
+
+CREATE TABLE IF NOT EXISTS `daily_spend` (
+  `User_ID` int NOT NULL,
+  `Category_ID` int NOT NULL,
+  `Day` date NOT NULL,
+  `Total` decimal(20,2) NOT NULL DEFAULT '0.00',
+  `Count` int NOT NULL DEFAULT '0',
+  PRIMARY KEY (`User_ID`,`Day`,`Category_ID`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+REPLACE INTO `daily_spend` (`User_ID`, `Category_ID`, `Day`, `Total`, `Count`)
+SELECT m.User_ID, COALESCE(fu.Category_ID, 0), DATE(t.Transaction_Date), SUM(t.Transaction_Amount), COUNT(*)
+FROM transactions t
+JOIN makes m ON t.Transaction_ID = m.Transaction_ID
+LEFT JOIN falls_under fu ON t.Transaction_ID = fu.Transaction_ID
+GROUP BY m.User_ID, COALESCE(fu.Category_ID, 0), DATE(t.Transaction_Date);
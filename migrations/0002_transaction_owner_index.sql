@@ -0,0 +1,13 @@
+-- Copy the owning user onto transactions so per-user date range lookups use a single index
+-- instead of joining makes and scanning every row the user has. makes stays the ownership record.
+-- Transactions_ID_UNIQUE duplicated the primary key and only slowed down inserts.
+
+ALTER TABLE `transactions`
+  ADD COLUMN `User_ID` int DEFAULT NULL AFTER `Transaction_ID`,
+  ADD KEY `idx_transactions_user_date` (`User_ID`,`Transaction_Date`),
+  ADD KEY `idx_transactions_date` (`Transaction_Date`),
+  DROP INDEX `Transactions_ID_UNIQUE`;
+
+UPDATE transactions t
+JOIN makes m ON t.Transaction_ID = m.Transaction_ID
+SET t.User_ID = m.User_ID;
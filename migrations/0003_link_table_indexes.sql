@@ -0,0 +1,8 @@
+-- The link tables are keyed with User_ID or Transaction_ID first. These indexes cover the
+-- lookups that start from the other column (deletes, account checks, category joins).
+
+ALTER TABLE `makes` ADD KEY `idx_makes_transaction` (`Transaction_ID`);
+ALTER TABLE `falls_under` ADD KEY `idx_falls_under_category` (`Category_ID`);
+ALTER TABLE `made_on` ADD KEY `idx_made_on_account` (`Account_ID`);
+ALTER TABLE `has` ADD KEY `idx_has_account` (`Account_ID`);
+ALTER TABLE `selects` ADD KEY `idx_selects_category` (`Category_ID`);
@@ -0,0 +1,6 @@
+-- sets.Goal_ID was a varchar joined against goals.Goal_ID (int), which forced a conversion on
+-- every row and kept the goal lookups from using an index.
+
+ALTER TABLE `sets`
+  MODIFY `Goal_ID` int NOT NULL,
+  ADD KEY `idx_sets_goal` (`Goal_ID`);
@@ -0,0 +1,13 @@
+-- Balance changes from transactions are appended to account_ledger instead of updating
+-- accounts.Account_Balance in place, so concurrent writes never wait on the account row.
+-- An account's balance is Account_Balance (the snapshot) plus the sum of its ledger entries.
+-- flask --app app compact-ledger folds the entries back into the snapshot.
+
+CREATE TABLE IF NOT EXISTS `account_ledger` (
+  `Entry_ID` bigint NOT NULL AUTO_INCREMENT,
+  `Account_ID` int NOT NULL,
+  `Amount` decimal(20,2) NOT NULL,
+  `Created_At` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`Entry_ID`),
+  KEY `idx_account_ledger_account` (`Account_ID`,`Amount`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
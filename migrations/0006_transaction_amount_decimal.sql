@@ -0,0 +1,5 @@
+-- Transaction_Amount was an int, so amounts with cents were rounded when stored while daily_spend
+-- and account_ledger (both decimal(20,2)) kept the exact value and drifted away from the transactions.
+-- Store amounts to the cent like every other money column.
+
+ALTER TABLE `transactions` MODIFY `Transaction_Amount` decimal(20,2) NOT NULL;
@@ -34,6 +34,12 @@ let currentOffset = parseInt(hiddenOffsetInput.value || '0');
 let currentStartDate = hiddenStartDateInput.value || null;
 let currentEndDate = hiddenEndDateInput.value || null;
 
+// Charts are drawn in the browser when Chart.js loaded, otherwise the server sends PNGs
+const clientChartsEnabled = typeof window.Chart !== 'undefined';
+const chartInstances = {};
+const categoryColors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf'];
+const categoryPieColors = ['#472d7b', '#3b528b', '#2c728e', '#21918c', '#28ae80', '#5ec962', '#addc30', '#fde725'];
+
 function formatDateISO(date) {
     if (!date || !(date instanceof Date)) return null;
     try { 
@@ -43,13 +49,236 @@ function formatDateISO(date) {
     }
 }
 
-async function loadChart(imgElement, loadingIndicator, apiUrl, params = {}, altTextBase = "Chart") {
+function formatMoney(amount) {
+    return `$${Number(amount).toFixed(2)}`;
+}
+
+function formatShortDate(isoDate) {
+    return new Date(`${isoDate}T00:00:00`).toLocaleDateString('en-US', { month: 'short', day: 'numeric' });
+}
+
+function budgetPieConfig(data) {
+    let labels, sizes, colors;
+    const overspent = data.spent > data.budget;
+    if (overspent) {
+        labels = [`Budget Used (${formatMoney(data.budget)})`];
+        sizes = [1];
+        colors = ['#dc3545'];
+    } else if (data.spent === 0) {
+        labels = [`Budget Remaining (${formatMoney(data.budget)})`];
+        sizes = [1];
+        colors = ['#28a745'];
+    } else {
+        labels = [`Spent (${formatMoney(data.spent)})`, `Remaining (${formatMoney(data.budget - data.spent)})`];
+        sizes = [data.spent, data.budget - data.spent];
+        colors = ['#dc3545', '#28a745'];
+    }
+
+    return {
+        type: 'doughnut',
+        data: { labels: labels, datasets: [{ data: sizes, backgroundColor: colors, borderColor: '#fff' }] },
+        options: {
+            aspectRatio: 1,
+            cutout: '60%',
+            plugins: {
+                title: { display: true, text: 'Spending vs Budget', font: { size: 14, weight: 'bold' } },
+                subtitle: { display: overspent, text: `Overspent +${formatMoney(data.spent - data.budget)}`, color: '#dc3545', font: { size: 13, weight: 'bold' } },
+                legend: { position: 'bottom' },
+                tooltip: { enabled: sizes.length > 1 }
+            }
+        }
+    };
+}
+
+function categoryPieConfig(data) {
+    return {
+        type: 'doughnut',
+        data: {
+            labels: data.categories.map((name, i) => `${name} (${formatMoney(data.totals[i])})`),
+            datasets: [{ data: data.totals, backgroundColor: data.categories.map((_, i) => categoryPieColors[i % categoryPieColors.length]), borderColor: '#fff' }]
+        },
+        options: {
+            aspectRatio: 1,
+            cutout: '60%',
+            plugins: {
+                title: { display: true, text: 'Spending by Category', font: { size: 14, weight: 'bold' } },
+                legend: { position: 'bottom' }
+            }
+        }
+    };
+}
+
+function categoryLineConfig(data) {
+    return {
+        type: 'line',
+        data: {
+            labels: data.dates.map(formatShortDate),
+            datasets: data.series.map((series, i) => ({
+                label: `${series.category} (${formatMoney(series.total)})`,
+                data: series.values,
+                borderColor: categoryColors[i % categoryColors.length],
+                backgroundColor: categoryColors[i % categoryColors.length],
+                borderWidth: 1.2,
+                pointRadius: 2
+            }))
+        },
+        options: {
+            aspectRatio: 7 / 4,
+            scales: {
+                x: { title: { display: true, text: 'Date' }, ticks: { maxRotation: 30, autoSkip: true, maxTicksLimit: 12 } },
+                y: { beginAtZero: true, title: { display: true, text: 'Spending ($)' } }
+            },
+            plugins: {
+                title: { display: true, text: 'Daily Spending by Category', font: { size: 13, weight: 'bold' } },
+                legend: { position: 'right', labels: { boxWidth: 12, font: { size: 11 } } }
+            }
+        }
+    };
+}
+
+function predictionChartConfig(data) {
+    const historical = data.historical;
+    const prediction = data.prediction;
+    const lastIndex = historical.length - 1;
+    // The predicted series starts at the last real period so the two are joined by a dotted line
+    const predictedValues = historical.map(() => null).concat(prediction.amount);
+    predictedValues[lastIndex] = historical[lastIndex].amount;
+
+    return {
+        type: 'line',
+        data: {
+            labels: historical.map(h => h.period_label).concat(prediction.period_label),
+            datasets: [
+                {
+                    label: 'Historical Spending',
+                    data: historical.map(h => h.amount).concat(null),
+                    borderColor: 'royalblue',
+                    backgroundColor: 'royalblue',
+                    pointRadius: 4
+                },
+                {
+                    label: `Predicted: ${formatMoney(prediction.amount)}`,
+                    data: predictedValues,
+                    borderColor: 'grey',
+                    backgroundColor: 'orangered',
+                    borderDash: [4, 4],
+                    pointStyle: 'star',
+                    pointBorderColor: 'orangered',
+                    pointRadius: predictedValues.map((_, i) => i === lastIndex + 1 ? 10 : 0)
+                }
+            ]
+        },
+        options: {
+            aspectRatio: 7 / 4,
+            scales: {
+                x: { ticks: { maxRotation: 30 } },
+                y: { beginAtZero: true, title: { display: true, text: 'Spending ($)' } }
+            },
+            plugins: {
+                title: { display: true, text: 'Spending Trend and Prediction', font: { size: 13, weight: 'bold' } },
+                legend: { labels: { font: { size: 11 } } }
+            }
+        }
+    };
+}
+
+function drawChart(imgElement, loadingIndicator, config) {
+    const canvas = document.getElementById(`${imgElement.id}Canvas`);
+    hideChartCanvas(imgElement);
+    imgElement.style.display = 'none';
+    canvas.classList.add('active');
+    chartInstances[imgElement.id] = new Chart(canvas, config);
+    loadingIndicator.style.display = 'none';
+}
+
+function hideChartCanvas(imgElement) {
+    if (chartInstances[imgElement.id]) {
+        chartInstances[imgElement.id].destroy();
+        delete chartInstances[imgElement.id];
+    }
+    const canvas = document.getElementById(`${imgElement.id}Canvas`);
+    if (canvas) canvas.classList.remove('active');
+    imgElement.style.display = '';
+}
+
+// Chart images come as /charts/<key>.png links the browser can cache. If a link stops working
+// (the server dropped the chart from its cache) the chart is fetched again as an inline image.
+function chartRequestParams(params, useChartData, useChartUrl) {
+    if (useChartData) return { ...params, format: 'data' };
+    if (useChartUrl) return { ...params, delivery: 'url' };
+    return params;
+}
+
+function resetChart(imgElement, loadingIndicator, altTextBase) {
+    hideChartCanvas(imgElement);
     loadingIndicator.style.display = 'block';
     imgElement.classList.remove('visible');
     imgElement.src = "data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7";
     imgElement.alt = `Loading ${altTextBase}...`;
+}
+
+// Show one chart from the dashboard bundle. Anything that goes wrong falls back to reload(),
+// which asks that chart's own endpoint for an inline image.
+function showChart(imgElement, loadingIndicator, data, altTextBase, buildConfig, reload) {
+    if (clientChartsEnabled && data && data.chart_data) {
+        try {
+            drawChart(imgElement, loadingIndicator, buildConfig(data.chart_data));
+            imgElement.alt = `${altTextBase}`;
+        } catch (error) {
+            reload();
+        }
+        return;
+    }
+    if (!data || !(data.chart_url || data.chart_uri)) {
+        reload();
+        return;
+    }
+    imgElement.onload = () => { loadingIndicator.style.display = 'none'; imgElement.classList.add('visible'); imgElement.alt = `${altTextBase}`; imgElement.onload = null; };
+    imgElement.onerror = () => { imgElement.onerror = null; reload(); };
+    imgElement.src = data.chart_url || data.chart_uri;
+}
+
+async function loadDashboardBundle(params) {
+    const charts = [
+        [pieChartImage, pieLoadingIndicator, '/api/pie-chart', 'budget_pie', "Budget vs Spending Chart", budgetPieConfig],
+        [lineChartCategoryImage, lineChartCategoryLoadingIndicator, '/api/line-chart', 'line_chart', "Category Spending Line Chart", categoryLineConfig],
+        [categoryPieChartImage, categoryPieLoadingIndicator, '/api/category-pie-chart', 'category_pie', "Category Spending Pie Chart", categoryPieConfig],
+        [predictionChartImage, predictionChartLoadingIndicator, '/api/prediction-chart', 'prediction_chart', "Spending Prediction Chart", predictionChartConfig]
+    ];
+    charts.forEach(([imgElement, loadingIndicator, , , altTextBase]) => resetChart(imgElement, loadingIndicator, altTextBase));
+    predictionAnalysisLoadingIndicator.style.display = 'block';
+    predictionAnalysisTextDiv.innerHTML = '';
+
+    const queryParams = new URLSearchParams(chartRequestParams(params, clientChartsEnabled, true)).toString();
+
+    try {
+        const response = await fetch(`/api/dashboard-bundle?${queryParams}`);
+        const bundle = await response.json();
+        if (!response.ok) {
+            throw new Error(bundle.error || `HTTP error! status: ${response.status}`);
+        }
+
+        charts.forEach(([imgElement, loadingIndicator, apiUrl, key, altTextBase, buildConfig]) => {
+            showChart(imgElement, loadingIndicator, bundle[key], altTextBase, buildConfig,
+                () => loadChart(imgElement, loadingIndicator, apiUrl, params, altTextBase, null, false));
+        });
+        predictionAnalysisTextDiv.innerHTML = formatAnalysisText(bundle.analysis_text || '');
+        predictionAnalysisLoadingIndicator.style.display = 'none';
+
+    } catch (error) {
+        // Load each chart on its own instead
+        loadChart(pieChartImage, pieLoadingIndicator, '/api/pie-chart', params, "Budget vs Spending Chart", budgetPieConfig);
+        loadChart(lineChartCategoryImage, lineChartCategoryLoadingIndicator, '/api/line-chart', params, "Category Spending Line Chart", categoryLineConfig);
+        loadChart(categoryPieChartImage, categoryPieLoadingIndicator, '/api/category-pie-chart', params, "Category Spending Pie Chart", categoryPieConfig);
+        loadPredictionChartAndText({ view: params.view, start_date: params.start_date });
+    }
+}
 
-    const queryParams = new URLSearchParams(params).toString();
+async function loadChart(imgElement, loadingIndicator, apiUrl, params = {}, altTextBase = "Chart", buildConfig = null, useChartUrl = true) {
+    const useChartData = clientChartsEnabled && buildConfig !== null;
+    resetChart(imgElement, loadingIndicator, altTextBase);
+
+    const queryParams = new URLSearchParams(chartRequestParams(params, useChartData, useChartUrl)).toString();
     const fullUrl = `${apiUrl}?${queryParams}`;
 
     try {
@@ -59,20 +288,34 @@ async function loadChart(imgElement, loadingIndicator, apiUrl, params = {}, altT
         if (!response.ok) {
             throw new Error(data.error || `HTTP error! status: ${response.status}`);
         }
-        if (!data || !data.chart_uri) {
+        if (useChartData && data.chart_data) {
+            drawChart(imgElement, loadingIndicator, buildConfig(data.chart_data));
+            imgElement.alt = `${altTextBase}`;
+            return;
+        }
+        if (!data || !(data.chart_url || data.chart_uri)) {
             throw new Error("Invalid chart data received from server.");
         }
 
         imgElement.onload = () => { loadingIndicator.style.display = 'none'; imgElement.classList.add('visible'); imgElement.alt = `${altTextBase}`; imgElement.onload = null; };
         imgElement.onerror = () => { 
+            if (data.chart_url && useChartUrl) {
+                imgElement.onerror = null;
+                loadChart(imgElement, loadingIndicator, apiUrl, params, altTextBase, null, false);
+                return;
+            }
             loadingIndicator.innerText = 'Display Error'; loadingIndicator.style.display = 'block'; 
             imgElement.alt = `Error displaying ${altTextBase}`; 
             imgElement.src = "data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' width='100' height='100' viewBox='0 0 100 100'%3E%3Crect width='100' height='100' fill='%23eee'/%3E%3Ctext x='50' y='55' font-family='Arial' font-size='12' fill='%23aaa' text-anchor='middle'%3EError%3C/text%3E%3C/svg%3E"; 
             imgElement.onload = null; 
             imgElement.onerror = null; };
-        imgElement.src = data.chart_uri;
+        imgElement.src = data.chart_url || data.chart_uri;
 
     } catch (error) {
+        // Fall back to the server rendered PNG if the chart couldn't be drawn here
+        if (useChartData) {
+            return loadChart(imgElement, loadingIndicator, apiUrl, params, altTextBase);
+        }
         loadingIndicator.innerText = `Load Error`; loadingIndicator.style.display = 'block';
         imgElement.alt = `Error loading ${altTextBase}: ${error.message}`;
         imgElement.src = "data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' width='100' height='100' viewBox='0 0 100 100'%3E%3Crect width='100' height='100' fill='%23eee'/%3E%3Ctext x='50' y='55' font-family='Arial' font-size='12' fill='%23aaa' text-anchor='middle'%3EError%3C/text%3E%3C/svg%3E";
@@ -80,7 +323,12 @@ async function loadChart(imgElement, loadingIndicator, apiUrl, params = {}, altT
     }
 }
 
-async function loadPredictionChartAndText(params = {}) {
+function formatAnalysisText(text) {
+    return text.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>').replace(/\*(.*?)\*/g, '<em>$1</em>').replace(/\n/g, '<br>');
+}
+
+async function loadPredictionChartAndText(params = {}, useChartData = clientChartsEnabled, useChartUrl = true) {
+    hideChartCanvas(predictionChartImage);
     predictionChartLoadingIndicator.style.display = 'block';
     predictionChartImage.classList.remove('visible');
     predictionChartImage.src = "data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7";
@@ -88,21 +336,25 @@ async function loadPredictionChartAndText(params = {}) {
     predictionAnalysisLoadingIndicator.style.display = 'block';
     predictionAnalysisTextDiv.innerHTML = '';
 
-    const chartParams = new URLSearchParams(params).toString();
-    const chartApiUrl = `/api/prediction-chart?${chartParams}`;
-    const analysisApiUrl = `/api/spending-prediction?${chartParams}`;
+    const predictionParams = new URLSearchParams(chartRequestParams(params, useChartData, useChartUrl)).toString();
+    const predictionApiUrl = `/api/prediction?${predictionParams}`;
 
     try {
-        const [chartResponse, analysisResponse] = await Promise.all([
-            fetch(chartApiUrl),
-            fetch(analysisApiUrl)
-        ]);
-
-        const chartData = await chartResponse.json();
-        if (!chartResponse.ok) { 
-            throw new Error(chartData.error || `Chart HTTP error! status: ${chartResponse.status}`); 
+        const predictionResponse = await fetch(predictionApiUrl);
+        const predictionData = await predictionResponse.json();
+        if (!predictionResponse.ok) { 
+            throw new Error(predictionData.error || `Prediction HTTP error! status: ${predictionResponse.status}`); 
+        }
+        if (typeof predictionData.analysis_text === 'undefined') { 
+            throw new Error("Invalid prediction analysis data received."); 
         }
-        if (!chartData || !chartData.chart_uri) { 
+
+        if (useChartData && predictionData.chart_data) {
+            drawChart(predictionChartImage, predictionChartLoadingIndicator, predictionChartConfig(predictionData.chart_data));
+            predictionAnalysisTextDiv.innerHTML = formatAnalysisText(predictionData.analysis_text);
+            return;
+        }
+        if (!predictionData || !(predictionData.chart_url || predictionData.chart_uri)) { 
             throw new Error("Invalid prediction chart data received."); 
         }
 
@@ -113,6 +365,11 @@ async function loadPredictionChartAndText(params = {}) {
         };
         
         predictionChartImage.onerror = () => { 
+            if (predictionData.chart_url && useChartUrl) {
+                predictionChartImage.onerror = null;
+                loadPredictionChartAndText(params, false, false);
+                return;
+            }
             predictionChartLoadingIndicator.innerText = 'Display Error'; 
             predictionChartLoadingIndicator.style.display = 'block'; 
             predictionChartImage.alt = 'Error displaying prediction chart'; 
@@ -120,18 +377,13 @@ async function loadPredictionChartAndText(params = {}) {
             predictionChartImage.onload = null; predictionChartImage.onerror = null; 
         };
         
-        predictionChartImage.src = chartData.chart_uri;
-
-        const analysisData = await analysisResponse.json();
-        if (!analysisResponse.ok) { 
-            throw new Error(analysisData.error || `Analysis HTTP error! status: ${analysisResponse.status}`); 
-        }
-        if (!analysisData || typeof analysisData.analysis_text === 'undefined') { 
-            throw new Error("Invalid prediction analysis data received."); 
-        }
-        predictionAnalysisTextDiv.innerHTML = analysisData.analysis_text.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>').replace(/\*(.*?)\*/g, '<em>$1</em>').replace(/\n/g, '<br>');
+        predictionChartImage.src = predictionData.chart_url || predictionData.chart_uri;
+        predictionAnalysisTextDiv.innerHTML = formatAnalysisText(predictionData.analysis_text);
 
     } catch (error) {
+        if (useChartData) {
+            return await loadPredictionChartAndText(params, false);
+        }
         predictionChartLoadingIndicator.innerText = `Chart Load Error`; predictionChartLoadingIndicator.style.display = 'block';
         predictionChartImage.alt = `Error loading prediction chart: ${error.message}`; 
         predictionChartImage.src = "data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' width='100' height='100' viewBox='0 0 100 100'%3E%3Crect width='100' height='100' fill='%23eee'/%3E%3Ctext x='50' y='55' font-family='Arial' font-size='12' fill='%23aaa' text-anchor='middle'%3EError%3C/text%3E%3C/svg%3E";
@@ -185,10 +437,7 @@ function updateDashboardState() {
         view: currentView, start_date: currentStartDate, end_date: currentEndDate 
     };
 
-    loadChart(pieChartImage, pieLoadingIndicator, '/api/pie-chart', commonParams, "Budget vs Spending Chart");
-    loadChart(lineChartCategoryImage, lineChartCategoryLoadingIndicator, '/api/line-chart', commonParams, "Category Spending Line Chart");
-    loadChart(categoryPieChartImage, categoryPieLoadingIndicator, '/api/category-pie-chart', commonParams, "Category Spending Pie Chart");
-    loadPredictionChartAndText({ view: currentView, start_date: currentStartDate });
+    loadDashboardBundle(commonParams);
 
 }
 
@@ -203,13 +452,42 @@ function submitTimeframeForm() {
 function addChatMessage(message, isUser) {
     const listItem = document.createElement('li');
     listItem.classList.add(isUser ? 'user-message' : 'bot-message');
+    setChatMessageText(listItem, message);
+    chatHistory.appendChild(listItem);
+    return listItem;
+}
+
+function setChatMessageText(listItem, message) {
     const sanitizedMessage = message.replace(/</g, "<").replace(/>/g, ">");
     listItem.innerHTML = sanitizedMessage.replace(/\n/g, '<br>');
-    chatHistory.appendChild(listItem);
     const chatBody = chatPopup.querySelector('.chat-body');
     chatBody.scrollTop = chatBody.scrollHeight;
 }
 
+// Read server-sent events from a fetch response, calling onEvent(name, data) for each one
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffered += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffered.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffered.slice(0, boundary);
+            buffered = buffered.slice(boundary + 2);
+            let eventName = 'message';
+            let eventData = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) eventName = line.slice(7);
+                else if (line.startsWith('data: ')) eventData += line.slice(6);
+            });
+            onEvent(eventName, eventData ? JSON.parse(eventData) : {});
+        }
+    }
+}
+
 async function sendChatMessage(messageToSend = null) {
     const userMessage = messageToSend ?? chatInput.value.trim();
     if (!userMessage) return;
@@ -220,23 +498,46 @@ async function sendChatMessage(messageToSend = null) {
     sendChatButton.disabled = true;
     chatInput.disabled = true;
 
+    const requestBody = JSON.stringify({
+        prompt: userMessage,
+        start_date: currentStartDate,
+        end_date: currentEndDate,
+        view_type: currentView
+    });
+
     try {
-        const response = await fetch('/api/chatbot', {
+        const response = await fetch('/api/chatbot/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json', },
-            body: JSON.stringify({
-                prompt: userMessage,
-                start_date: currentStartDate,
-                end_date: currentEndDate,
-                view_type: currentView
-            }),
+            body: requestBody,
         });
-        const data = await response.json();
 
         if (!response.ok) {
+            const data = await response.json();
             throw new Error(data.error || `HTTP error ${response.status}`);
         }
-        addChatMessage(data.response || "Sorry, I couldn't get a response.", false);
+
+        // The answer is shown as it arrives
+        let botText = '';
+        let botMessage = null;
+        await readEventStream(response, (eventName, data) => {
+            if (eventName === 'chunk') {
+                botText += data.text;
+                if (!botMessage) {
+                    chatLoadingIndicator.style.display = 'none';
+                    botMessage = addChatMessage(botText, false);
+                } else {
+                    setChatMessageText(botMessage, botText);
+                }
+            } else if (eventName === 'error') {
+                botText += botText ? `\n${data.error}` : data.error;
+                if (botMessage) setChatMessageText(botMessage, botText);
+                else botMessage = addChatMessage(botText, false);
+            }
+        });
+        if (!botMessage) {
+            addChatMessage("Sorry, I couldn't get a response.", false);
+        }
 
     } catch (error) {
         addChatMessage(`Error: ${error.message}`, false);
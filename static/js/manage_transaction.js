@@ -41,6 +41,15 @@ const editAccount = document.getElementById('editAccount');
 const deleteTransactionId = document.getElementById('deleteTransactionId');
 const confirmDeleteBtn = document.getElementById('confirmDelete');
 const saveTransactionChangesBtn = document.getElementById('saveTransactionChanges');
+const selectAllTransactions = document.getElementById('selectAllTransactions');
+const bulkActions = document.getElementById('bulkActions');
+const bulkSelectedCount = document.getElementById('bulkSelectedCount');
+const bulkCategorySelect = document.getElementById('bulkCategory');
+const bulkApplyCategoryBtn = document.getElementById('bulkApplyCategory');
+const bulkDeleteBtn = document.getElementById('bulkDelete');
+
+const TRANSACTION_PAGE_SIZE = 200;
+let currentLoadId = 0;
 
 function debounce(func, wait) {
     let timeout;
@@ -54,18 +63,8 @@ function debounce(func, wait) {
     };
 }
 
-async function loadTransactions() {
-    if (!transactionTableLoading || !transactionTableBody || !noTransactionsMessage) {
-        if (transactionTableBody) {
-            transactionTableBody.innerHTML = '<tr><td colspan="6" class="text-center text-danger p-3">Error: Page elements missing. Cannot load transactions.</td></tr>';
-        }
-        return;
-    }
-
-    transactionTableLoading.style.display = 'block';
-    transactionTableBody.innerHTML = '';
-    noTransactionsMessage.style.display = 'none';
-
+// Current filter values as query parameters, leaving out empty ones
+function transactionFilterParams() {
     const params = new URLSearchParams({
         start_date: filterStartDateInput ? filterStartDateInput.value : '',
         end_date: filterEndDateInput ? filterEndDateInput.value : '',
@@ -84,70 +83,188 @@ async function loadTransactions() {
         }
     });
     paramsToDelete.forEach(key => params.delete(key));
+    return params;
+}
+
+// Download the filtered transactions. The browser handles the streamed file itself.
+function handleExportClick(e) {
+    e.preventDefault();
+    const params = transactionFilterParams();
+    params.set('format', e.currentTarget.dataset.format);
+    window.location.href = `/api/transactions/export?${params.toString()}`;
+}
+
+async function loadTransactions() {
+    if (!transactionTableLoading || !transactionTableBody || !noTransactionsMessage) {
+        if (transactionTableBody) {
+            transactionTableBody.innerHTML = '<tr><td colspan="7" class="text-center text-danger p-3">Error: Page elements missing. Cannot load transactions.</td></tr>';
+        }
+        return;
+    }
+
+    transactionTableLoading.style.display = 'block';
+    transactionTableBody.innerHTML = '';
+    noTransactionsMessage.style.display = 'none';
+    updateBulkActions();
 
-    const apiUrl = `/api/transactions?${params.toString()}`;
+    const params = transactionFilterParams();
+    params.set('limit', TRANSACTION_PAGE_SIZE);
+    const loadId = ++currentLoadId;
+    let nextCursor = null;
+    let rowCount = 0;
 
     try {
-        const response = await fetch(apiUrl);
-        const data = await response.json();
+        do {
+            if (nextCursor) {
+                params.set('cursor', nextCursor);
+            }
+            const response = await fetch(`/api/transactions?${params.toString()}`);
+            const data = await response.json();
 
-        if (!response.ok) {
-            const errorMsg = data?.error || data?.message || response.statusText;
-            throw new Error(errorMsg || `HTTP error ${response.status}`);
-        }
+            if (!response.ok) {
+                const errorMsg = data?.error || data?.message || response.statusText;
+                throw new Error(errorMsg || `HTTP error ${response.status}`);
+            }
 
-        if (data && data.length > 0) {
-            data.forEach(t => {
-                const row = transactionTableBody.insertRow();
-                row.dataset.transactionId = t.Transaction_ID;
-
-                let displayDate = 'N/A';
-                if (t.Transaction_Date) {
-                    displayDate = t.Transaction_Date;
-                }
-                row.insertCell().textContent = displayDate;
-
-                row.insertCell().textContent = t.Transaction_Description || '-';
-                row.insertCell().textContent = t.Category_Name || 'Uncategorized';
-
-                const amountCell = row.insertCell();
-                const amount = parseFloat(t.Transaction_Amount || 0);
-                amountCell.textContent = amount.toLocaleString('en-US', { style: 'currency', currency: 'USD' });
-                amountCell.classList.add(amount >= 0 ? 'amount-positive' : 'amount-negative');
-                amountCell.style.textAlign = 'right';
-
-                row.insertCell().textContent = t.Account_Name || 'N/A';
-
-                const actionsCell = row.insertCell();
-                actionsCell.className = 'text-center action-buttons';
-                actionsCell.innerHTML = `
-                    <button class="btn btn-sm btn-outline-primary edit-btn" data-id="${t.Transaction_ID}" title="Edit">
-                        <i class="bi bi-pencil"></i>
-                    </button>
-                    <button class="btn btn-sm btn-outline-danger delete-btn ms-1" data-id="${t.Transaction_ID}" title="Delete">
-                        <i class="bi bi-trash"></i>
-                    </button>
-                `;
-            });
-
-            transactionTableBody.querySelectorAll('.edit-btn').forEach(btn => {
-                btn.addEventListener('click', handleEditClick);
-            });
-            transactionTableBody.querySelectorAll('.delete-btn').forEach(btn => {
-                btn.addEventListener('click', handleDeleteClick);
-            });
-        } else {
+            // Filters changed while this page was loading, so a newer load owns the table now
+            if (loadId !== currentLoadId) {
+                return;
+            }
+
+            (data.transactions || []).forEach(appendTransactionRow);
+            rowCount += (data.transactions || []).length;
+            nextCursor = data.next_cursor;
+            transactionTableLoading.style.display = 'none';
+        } while (nextCursor);
+
+        if (rowCount === 0) {
             noTransactionsMessage.style.display = 'block';
         }
 
     } catch (error) {
-        transactionTableBody.innerHTML = `<tr><td colspan="6" class="text-center text-danger p-3">Error loading transactions: ${error.message}</td></tr>`;
+        if (loadId !== currentLoadId) {
+            return;
+        }
+        transactionTableBody.innerHTML = `<tr><td colspan="7" class="text-center text-danger p-3">Error loading transactions: ${error.message}</td></tr>`;
         noTransactionsMessage.style.display = 'none';
     } finally {
-        transactionTableLoading.style.display = 'none';
+        if (loadId === currentLoadId) {
+            transactionTableLoading.style.display = 'none';
+        }
+    }
+}
+
+function appendTransactionRow(t) {
+    const row = transactionTableBody.insertRow();
+    row.dataset.transactionId = t.Transaction_ID;
+
+    const selectCell = row.insertCell();
+    selectCell.className = 'text-center';
+    selectCell.innerHTML = `<input type="checkbox" class="form-check-input transaction-select" value="${t.Transaction_ID}">`;
+    selectCell.querySelector('input').addEventListener('change', updateBulkActions);
+
+    let displayDate = 'N/A';
+    if (t.Transaction_Date) {
+        displayDate = t.Transaction_Date;
+    }
+    row.insertCell().textContent = displayDate;
+
+    row.insertCell().textContent = t.Transaction_Description || '-';
+    row.insertCell().textContent = t.Category_Name || 'Uncategorized';
+
+    const amountCell = row.insertCell();
+    const amount = parseFloat(t.Transaction_Amount || 0);
+    amountCell.textContent = amount.toLocaleString('en-US', { style: 'currency', currency: 'USD' });
+    amountCell.classList.add(amount >= 0 ? 'amount-positive' : 'amount-negative');
+    amountCell.style.textAlign = 'right';
+
+    row.insertCell().textContent = t.Account_Name || 'N/A';
+
+    const actionsCell = row.insertCell();
+    actionsCell.className = 'text-center action-buttons';
+    actionsCell.innerHTML = `
+        <button class="btn btn-sm btn-outline-primary edit-btn" data-id="${t.Transaction_ID}" title="Edit">
+            <i class="bi bi-pencil"></i>
+        </button>
+        <button class="btn btn-sm btn-outline-danger delete-btn ms-1" data-id="${t.Transaction_ID}" title="Delete">
+            <i class="bi bi-trash"></i>
+        </button>
+    `;
+    actionsCell.querySelector('.edit-btn').addEventListener('click', handleEditClick);
+    actionsCell.querySelector('.delete-btn').addEventListener('click', handleDeleteClick);
+}
+
+function selectedTransactionIds() {
+    return Array.from(document.querySelectorAll('.transaction-select:checked')).map(box => box.value);
+}
+
+// Show the bulk action bar while any rows are ticked
+function updateBulkActions() {
+    const count = selectedTransactionIds().length;
+    if (bulkActions) {
+        bulkActions.style.display = count ? 'flex' : 'none';
+    }
+    if (bulkSelectedCount) {
+        bulkSelectedCount.textContent = `${count} selected`;
+    }
+    if (selectAllTransactions) {
+        const boxes = document.querySelectorAll('.transaction-select');
+        selectAllTransactions.checked = boxes.length > 0 && count === boxes.length;
+    }
+}
+
+function handleSelectAll() {
+    document.querySelectorAll('.transaction-select').forEach(box => {
+        box.checked = selectAllTransactions.checked;
+    });
+    updateBulkActions();
+}
+
+// Send one batch request for all ticked rows and reload the list
+async function runBulkAction(url, body, failureMessage) {
+    const transactionIds = selectedTransactionIds();
+    if (!transactionIds.length) {
+        return;
+    }
+
+    try {
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ transaction_ids: transactionIds, ...body }),
+        });
+
+        const result = await response.json();
+
+        if (response.ok && result.success) {
+            loadTransactions();
+        } else {
+            const errorMsg = result?.error || result?.message || failureMessage;
+            alert(`Error: ${errorMsg}`);
+        }
+    } catch (error) {
+        alert(`${failureMessage} due to a network or server error. Please try again.`);
     }
 }
 
+function handleBulkApplyCategory() {
+    if (!bulkCategorySelect || !bulkCategorySelect.value) {
+        alert('Please choose a category.');
+        return;
+    }
+    runBulkAction('/api/transactions/batch-update', { changes: { category: bulkCategorySelect.value } }, 'Failed to update transactions');
+}
+
+function handleBulkDelete() {
+    const count = selectedTransactionIds().length;
+    if (!count || !confirm(`Delete ${count} transactions? This action cannot be undone.`)) {
+        return;
+    }
+    runBulkAction('/api/transactions/batch-delete', {}, 'Failed to delete transactions');
+}
+
 function handleFilterChange() {
     loadTransactions();
 }
@@ -365,6 +482,17 @@ if (filterMaxAmountInput)
 if (clearFiltersButton) 
     clearFiltersButton.addEventListener('click', handleClearFilters);
 
+if (selectAllTransactions) 
+    selectAllTransactions.addEventListener('change', handleSelectAll);
+
+if (bulkApplyCategoryBtn) 
+    bulkApplyCategoryBtn.addEventListener('click', handleBulkApplyCategory);
+
+if (bulkDeleteBtn) 
+    bulkDeleteBtn.addEventListener('click', handleBulkDelete);
+
+document.querySelectorAll('.export-link').forEach(link => link.addEventListener('click', handleExportClick));
+
 if (saveTransactionChangesBtn) 
     saveTransactionChangesBtn.addEventListener('click', saveTransactionChanges);
 